@@ -0,0 +1,6 @@
+"""micro-benchmarks for qbdesktop. Run a module from the repository root,
+e.g. ``python -m benchmarks.bench_builder``.
+
+``python -m benchmarks.suite run`` runs the whole suite over generated
+corpora (benchmarks.corpus) and writes a JSON file per commit;
+``python -m benchmarks.suite compare`` diffs two of them."""
@@ -0,0 +1,82 @@
+"""compare the old insert-based Aggregate.read() with the single pass writer.
+
+usage: python -m benchmarks.bench_builder [sizes...]
+"""
+import sys
+import time
+
+from qbdesktop import Aggregate, Element, MessageAggregate
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+
+
+#================================================================
+# LEGACY BUILDER (as it was before the rewrite)
+#================================================================
+
+class LegacyElement:
+    def __init__(self, name: str, value: str, indent: int=3) -> None:
+        self.name = name
+        self.value = value
+        self._indent = "\t"*indent
+        self.statement = f"{self._indent}<{self.name}{self.value}</{self.name}>"
+
+    def read(self) -> str:
+        return self.statement
+
+
+class LegacyAggregate:
+    def __init__(self, name: str, elements: list, indent: int=2) -> None:
+        self.name = name
+        self.elements = elements
+        self.objects = [f"<{self.name} >", f"</{self.name}>"]
+
+    def read(self) -> str:
+        objs = self.objects
+        for element in self.elements:
+            objs.insert(1, element.read())
+        return "\n".join(objs)
+
+
+class LegacyMessageAggregate(LegacyAggregate):
+    pass
+
+
+#================================================================
+# BENCHMARK
+#================================================================
+
+def _timed(func) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def bench(size: int) -> dict:
+    values = [(f"Line{i % 50}", f"value {i}") for i in range(size)]
+    legacy = LegacyMessageAggregate("InvoiceAddRq", [
+        LegacyAggregate("InvoiceAdd", [LegacyElement(name, value) for name, value in values])
+    ])
+    new = MessageAggregate("InvoiceAddRq", [
+        Aggregate("InvoiceAdd", [Element(name, value) for name, value in values])
+    ])
+    return {
+        "size": size,
+        "legacy_read": _timed(legacy.read),
+        "read": _timed(new.read),
+        "to_bytes": _timed(new.to_bytes),
+    }
+
+
+def main(argv: list[str]) -> None:
+    sizes = [int(arg) for arg in argv] or DEFAULT_SIZES
+    print(f"{'elements':>10} {'legacy read':>12} {'read':>10} {'to_bytes':>10} {'speedup':>8}")
+    for size in sizes:
+        result = bench(size)
+        speedup = result["legacy_read"] / result["read"] if result["read"] else float("inf")
+        print(f"{size:>10} {result['legacy_read']:>11.4f}s {result['read']:>9.4f}s "
+              f"{result['to_bytes']:>9.4f}s {speedup:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
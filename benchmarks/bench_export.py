@@ -0,0 +1,62 @@
+"""records per second and peak memory of the streaming exporters, one sink at
+a time and all of them fed from a single parse. The response is read from a
+file so that only the exporters' own buffers show up in the peak.
+
+usage: python -m benchmarks.bench_export [invoices]
+"""
+import os
+import sys
+import tempfile
+import tracemalloc
+
+from qbdesktop import MessageAggregate, QBXMLDocument
+from qbexport import CSVSink, ExcelSink, ParquetSink, export
+from qbrecords import iter_typed
+from qbtransport import FakeQuickBooks
+
+SINKS = {"csv": CSVSink, "parquet": ParquetSink, "xlsx": ExcelSink}
+
+
+def _export(path: str, sinks: list):
+    with open(path, "rb") as file:
+        return export(iter_typed(file), sinks)
+
+
+def _run(path: str, make_sinks) -> tuple:
+    """(result of an untraced run, peak traced bytes of a second run)."""
+    result = _export(path, make_sinks())
+    tracemalloc.start()
+    _export(path, make_sinks())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, peak
+
+
+def main(argv: list[str]) -> None:
+    invoices = int(argv[0]) if argv else 20_000
+    backend = FakeQuickBooks().generate(customers=500, items=100, invoices=invoices, lines=3)
+    ticket = backend.begin_session()
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "invoices.xml")
+        with open(source, "w", encoding="utf-8") as file:
+            file.write(backend.process_request(ticket, QBXMLDocument([MessageAggregate("InvoiceQueryRq")]).read()))
+        del backend
+        available = []
+        print(f"{'sinks':<20} {'records':>8} {'records/s':>10} {'peak MiB':>9}")
+        for name, sink in SINKS.items():
+            try:
+                result, peak = _run(source, lambda: [sink(os.path.join(directory, f"single.{name}"))])
+            except ImportError as e:
+                print(f"{name:<20} {'(' + e.name + ' missing)':>8}")
+                continue
+            available.append(name)
+            print(f"{name:<20} {result.records:>8} {result.rate:>10,.0f} {peak / 2 ** 20:>9.1f}")
+        if len(available) > 1:
+            result, peak = _run(source, lambda: [SINKS[name](os.path.join(directory, f"fanout.{name}"))
+                                                 for name in available])
+            print(f"{'+'.join(available):<20} {result.records:>8} {result.rate:>10,.0f} {peak / 2 ** 20:>9.1f}")
+            print(result)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
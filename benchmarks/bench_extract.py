@@ -0,0 +1,29 @@
+"""multi-company extraction with fake worker backends, one worker process
+versus several.
+
+usage: python -m benchmarks.bench_extract [companies] [workers]
+"""
+import os
+import sys
+import tempfile
+
+from qbextract import ExtractionPlan, FakeBackend, Orchestrator
+
+
+def main(argv: list[str]) -> None:
+    companies = int(argv[0]) if argv else 24
+    workers = int(argv[1]) if len(argv) > 1 else os.cpu_count() or 4
+    files = [os.path.join("Clients", f"Client {i:03d}.QBW") for i in range(companies)]
+    plan = ExtractionPlan(entities=("Customer", "ItemService", "Invoice"),
+                          reports=[("GeneralDetail", "TxnListByDate", {"date_macro": "All"})])
+    backend = FakeBackend(customers=200, invoices=500, latency=0.05, latency_per_record=2e-5)
+    for count in sorted({1, workers}):
+        with tempfile.TemporaryDirectory() as output:
+            summary = Orchestrator(output, plan, backend=backend, workers=count, root="Clients").run(files)
+        slowest = max(summary.companies, key=lambda company: company.elapsed)
+        print(f"{companies} companies {count:>2} workers: {summary.elapsed:6.2f}s, "
+              f"slowest file {slowest.elapsed:.2f}s, failed {len(summary.failed)}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
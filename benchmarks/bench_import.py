@@ -0,0 +1,74 @@
+"""import time of the qbdesktop modules, measured with ``python -X importtime``
+in fresh interpreters, and a check that heavy optional dependencies stay
+unloaded.
+
+usage: python -m benchmarks.bench_import [--max-ms N] [module ...]
+
+Exits with status 1 when a module takes longer than --max-ms (best of
+RUNS) or pulls in one of FORBIDDEN at import, so it can guard startup in CI.
+"""
+import os
+import subprocess
+import sys
+
+MODULES = ("qbdesktop", "qbparser", "qbtransport", "qbrecords", "qbreports", "qbpool", "qbasync", "qbcache",
+           "qbsync", "qbshard", "qbexport", "qbmetrics", "qbjournal", "qbresilience")
+FORBIDDEN = ("pandas", "numpy", "pyarrow", "win32com", "pythoncom", "installer", "urllib.request")
+RUNS = 5
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _environment() -> dict:
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+
+def import_time(module: str, env: dict) -> tuple:
+    """(cumulative microseconds, top 5 (cumulative, name) children, forbidden modules loaded)."""
+    check = f"import sys, {module}; print(' '.join(m for m in {FORBIDDEN!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", check], env=env, cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    total = 0
+    children = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        if name.strip() == module and name.rstrip() == " " + module:
+            total = int(cumulative)
+        elif name.startswith("   ") and not name.startswith("     "):
+            children.append((int(cumulative), name.strip()))
+    return total, sorted(children, reverse=True)[:5], result.stdout.split()
+
+
+def main(argv: list[str]) -> int:
+    max_ms = None
+    if "--max-ms" in argv:
+        index = argv.index("--max-ms")
+        max_ms = float(argv[index + 1])
+        del argv[index:index + 2]
+    modules = argv or MODULES
+    env = _environment()
+    subprocess.run([sys.executable, "-c", "import " + ", ".join(modules)], env=env, cwd=ROOT, check=True)
+    failed = False
+    print(f"{'module':<12} {'best ms':>8}  slowest imports")
+    for module in modules:
+        runs = [import_time(module, env) for _ in range(RUNS)]
+        best, children, loaded = min(runs, key=lambda run: run[0])
+        slowest = ", ".join(f"{name} {cumulative / 1000:.1f}" for cumulative, name in children[:3])
+        print(f"{module:<12} {best / 1000:>8.1f}  {slowest}")
+        if loaded:
+            print(f"{'':<12} loads {', '.join(loaded)} at import")
+            failed = True
+        if max_ms is not None and best / 1000 > max_ms:
+            print(f"{'':<12} slower than {max_ms} ms")
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,54 @@
+"""recording overhead, compression and replay throughput of qbjournal.
+
+usage: python -m benchmarks.bench_journal [customers] [page size]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+from qbdesktop import RequestProcessor
+from qbjournal import Journal, JournalReader, ReplayTransport
+from qbtransport import FakeQuickBooks
+
+
+def _pull(transport, page_size: int, recorder=None) -> tuple:
+    start = time.perf_counter()
+    with RequestProcessor("bench", transport=transport, recorder=recorder) as qb:
+        count = sum(1 for _ in qb.paged_query("CustomerQueryRq", page_size=page_size, target_latency=None))
+    return count, time.perf_counter() - start
+
+
+def main(argv: list[str]) -> None:
+    customers = int(argv[0]) if argv else 50_000
+    page_size = int(argv[1]) if len(argv) > 1 else 500
+    backend = FakeQuickBooks().generate(customers=customers)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "capture.qbj")
+        count, plain = _pull(backend, page_size)
+        with Journal(path) as journal:
+            _, recorded = _pull(backend, page_size, journal)
+            entries = journal.entries
+        with JournalReader(path) as reader:
+            raw = sum(len(entry.request) + len(entry.response) for entry in reader)
+            numbers = [random.randrange(len(reader)) for _ in range(1_000)]
+            start = time.perf_counter()
+            for number in numbers:
+                reader[number]
+            lookup = (time.perf_counter() - start) / len(numbers)
+        size = os.path.getsize(path)
+        print(f"{count} records in {entries} pages: live {plain:.2f}s, recording {recorded:.2f}s "
+              f"({(recorded - plain) / entries * 1000:+.2f} ms per page)")
+        print(f"journal {size / 2 ** 20:.1f} MiB for {raw / 2 ** 20:.1f} MiB of qbXML ({raw / size:.1f}x), "
+              f"random entry read {lookup * 1e6:.0f} us")
+        for speed in (None, 10.0):
+            replay = ReplayTransport(path, speed)
+            count, elapsed = _pull(replay, page_size)
+            replay.close()
+            label = "as fast as possible" if speed is None else f"{speed:g}x speed"
+            print(f"replay {label:<20} {count} records {elapsed:.2f}s ({count / elapsed:,.0f} records/s)")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,65 @@
+"""load test of the Web Connector server: many simulated QBWC clients polling
+one QBWCServer at once, each pulling its own queue of customer queries from a
+shared fake backend.
+
+usage: python -m benchmarks.bench_qbwc [clients] [messages per client] [concurrency]
+"""
+import asyncio
+import functools
+import sys
+import time
+import tracemalloc
+
+from qbdesktop import MessageAggregate, build_nodes
+from qbtransport import FakeQuickBooks
+from qbwc import QBWCServer, SimulatedWebConnector
+
+
+def _work(messages: int, user: str) -> list:
+    return [MessageAggregate("CustomerQueryRq", build_nodes({"MaxReturned": 20})) for _ in range(messages)]
+
+
+async def _run(clients: int, messages: int, concurrency: int) -> None:
+    backend = FakeQuickBooks()
+    backend.generate(customers=200, items=10, invoices=0)
+    records = [0]
+    closed = []
+    server = QBWCServer(lambda user, password: "" if password == "secret" else None,
+                        functools.partial(_work, messages),
+                        on_record=lambda state, record: records.__setitem__(0, records[0] + 1),
+                        on_close=closed.append, batch_size=4)
+    port = await server.start()
+    limit = asyncio.Semaphore(concurrency)
+    peak_tickets = [0]
+
+    async def client(number: int) -> int:
+        async with limit:
+            connector = SimulatedWebConnector("127.0.0.1", port, f"user{number}", "secret", backend)
+            result = await connector.run()
+            peak_tickets[0] = max(peak_tickets[0], len(server.tickets))
+            return result
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    results = await asyncio.gather(*(client(number) for number in range(clients)))
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    await server.close()
+    complete = sum(1 for result in results if result == 100)
+    print(f"{clients} clients ({concurrency} at once), {messages} messages each: {complete} complete, "
+          f"{server.requests} SOAP calls, {records[0]} records in {elapsed:.2f}s "
+          f"({server.requests / elapsed:,.0f} calls/s, {records[0] / elapsed:,.0f} records/s)")
+    print(f"peak {peak / 2 ** 20:.1f} MiB traced, {peak_tickets[0]} tickets open at most, "
+          f"{peak / max(peak_tickets[0], 1) / 1024:.1f} KiB per open ticket, {len(closed)} closed")
+
+
+def main(argv: list[str]) -> None:
+    clients = int(argv[0]) if argv else 2_000
+    messages = int(argv[1]) if len(argv) > 1 else 10
+    concurrency = int(argv[2]) if len(argv) > 2 else 500
+    asyncio.run(_run(clients, messages, concurrency))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,58 @@
+"""bytes per record for the typed __slots__ records, plain dicts and a DataFrame.
+
+usage: python -m benchmarks.bench_records [count]
+"""
+import gc
+import sys
+import tracemalloc
+
+from qbdesktop import MessageAggregate, QBXMLDocument
+from qbparser import ResponseStream
+from qbrecords import iter_typed
+from qbtransport import FakeQuickBooks
+
+
+def _response(entity: str, backend: FakeQuickBooks) -> str:
+    ticket = backend.begin_session()
+    return backend.process_request(ticket, QBXMLDocument([MessageAggregate(f"{entity}QueryRq")]).read())
+
+
+def _measure(build) -> tuple:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+
+def _dataframe(response: str):
+    try:
+        return ResponseStream(response).to_dataframe()
+    except ImportError:
+        return None
+
+
+def main(argv: list[str]) -> None:
+    count = int(argv[0]) if argv else 20_000
+    backend = FakeQuickBooks().generate(customers=count, items=200, invoices=count)
+    print(f"{'entity':<10} {'representation':<16} {'bytes/record':>12}")
+    for entity in ("Customer", "Invoice"):
+        response = _response(entity, backend)
+        builders = {
+            "dict": lambda: [record.fields for record in ResponseStream(response)],
+            "slots": lambda: list(iter_typed(response)),
+            "DataFrame": lambda: _dataframe(response),
+        }
+        for name, build in builders.items():
+            result, used = _measure(build)
+            if result is None:
+                print(f"{entity:<10} {name:<16} {'(pandas missing)':>12}")
+                continue
+            print(f"{entity:<10} {name:<16} {used / count:>12.0f}")
+            del result
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
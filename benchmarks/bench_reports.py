@@ -0,0 +1,39 @@
+"""parse time and peak memory of a synthetic General Ledger report.
+
+usage: python -m benchmarks.bench_reports [rows]
+"""
+import io
+import sys
+import time
+import tracemalloc
+
+from benchmarks.corpus import write_report
+from qbreports import parse_report
+
+def report_response(rows: int) -> bytes:
+    """a GeneralDetailReportQueryRs with about rows data rows, see corpus.write_report()."""
+    out = io.StringIO()
+    write_report(out, rows)
+    return out.getvalue().encode()
+
+
+def main(argv: list[str]) -> None:
+    rows = int(argv[0]) if argv else 200_000
+    payload = report_response(rows)
+    print(f"{len(payload) / 2**20:.1f} MiB response, {rows} data rows")
+
+    start = time.perf_counter()
+    report = parse_report(io.BytesIO(payload))
+    elapsed = time.perf_counter() - start
+    print(f"parse: {elapsed:.2f}s, {len(report) / elapsed:,.0f} rows/s, {report!r}")
+
+    del report
+    tracemalloc.start()
+    report = parse_report(io.BytesIO(payload))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"peak memory while parsing: {peak / 2**20:.1f} MiB ({peak / len(report):.0f} bytes/row)")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,71 @@
+"""workers sharing one company file that gets busier with every concurrent
+request: without a policy, with retries only and with retries under the
+adaptive concurrency limit.
+
+usage: python -m benchmarks.bench_resilience [workers] [pages per worker]
+"""
+import sys
+import threading
+import time
+
+from qbdesktop import MessageAggregate, QBXMLDocument, build_nodes
+from qbpool import SessionPool
+from qbresilience import AdaptiveLimit, QuickBooksError, Resilience
+from qbtransport import FakeQuickBooks
+
+LATENCY = 0.005
+CONTENTION = 0.04
+
+
+def _run(workers: int, pages: int, resilience) -> dict:
+    backend = FakeQuickBooks(latency=LATENCY).generate(customers=100).inject_faults(contention=CONTENTION)
+    request = QBXMLDocument([MessageAggregate("CustomerQueryRq", build_nodes({"MaxReturned": 20}))]).read()
+    done = [0]
+    crashed = [0]
+    lock = threading.Lock()
+
+    def work(pool):
+        for _ in range(pages):
+            try:
+                with pool.session() as processor:
+                    response = processor.process_request(request)
+                if 'statusSeverity="Error"' in response:
+                    raise QuickBooksError("busy")
+            except QuickBooksError:
+                with lock:
+                    crashed[0] += 1
+                continue
+            with lock:
+                done[0] += 1
+
+    start = time.perf_counter()
+    with SessionPool("bench", lambda: backend, max_size=workers, resilience=resilience) as pool:
+        threads = [threading.Thread(target=work, args=(pool,)) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    elapsed = time.perf_counter() - start
+    return {"done": done[0], "failed": crashed[0], "seconds": elapsed, "faults": backend.faults,
+            "limit": resilience.limit.limit if resilience else None}
+
+
+def main(argv: list[str]) -> None:
+    workers = int(argv[0]) if argv else 16
+    pages = int(argv[1]) if len(argv) > 1 else 50
+    variants = {
+        "no policy": None,
+        "retries only": Resilience(backoff=0.005, limit=AdaptiveLimit(workers, maximum=workers, decrease=1.0),
+                                   seed=0),
+        "adaptive limit": Resilience(backoff=0.005, limit=AdaptiveLimit(workers, maximum=workers), seed=0),
+    }
+    print(f"{workers} workers x {pages} requests, {CONTENTION:.0%} busy chance per concurrent request")
+    for name, resilience in variants.items():
+        result = _run(workers, pages, resilience)
+        limit = "" if result["limit"] is None else f", final limit {result['limit']:.1f}"
+        print(f"{name:<15} {result['done']:>5} ok {result['failed']:>5} failed {result['faults']:>6} busy answers "
+              f"{result['done'] / result['seconds']:>8.1f} ok/s{limit}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,60 @@
+"""one big date-range request versus sharded requests over a session pool,
+against a fake backend whose latency grows faster than the result size.
+
+usage: python -m benchmarks.bench_shard [invoices] [years]
+"""
+import datetime
+import sys
+import time
+
+from qbdesktop import MessageAggregate, QBXMLDocument, RequestProcessor, build_nodes
+from qbparser import ResponseStream
+from qbpool import SessionPool
+from qbreports import build_report_request, parse_report
+from qbshard import ShardedQuery
+from qbtransport import FakeQuickBooks
+
+START = datetime.date(2020, 1, 1)
+
+
+def _single(backend: FakeQuickBooks, request_name: str, end: datetime.date) -> int:
+    with RequestProcessor("bench", transport=backend) as qb:
+        if request_name == "GeneralDetailReportQueryRq":
+            request = build_report_request("GeneralDetail", "TxnListByDate", START.isoformat(), end.isoformat())
+            return len(parse_report(qb.process_request(request)))
+        message = MessageAggregate(request_name, build_nodes({
+            "TransactionDateRangeFilter": {"FromTxnDate": START.isoformat(), "ToTxnDate": end.isoformat()}}))
+        return sum(1 for _ in ResponseStream(qb.process_request(QBXMLDocument([message]).read())))
+
+
+def _sharded(backend: FakeQuickBooks, request_name: str, end: datetime.date, sessions: int) -> tuple:
+    with SessionPool("bench", lambda: backend, max_size=sessions) as pool:
+        query = ShardedQuery(pool, request_name, START, end, report_type="TxnListByDate", target_rows=1_000)
+        if request_name == "GeneralDetailReportQueryRq":
+            rows = len(query.report())
+        else:
+            rows = sum(1 for _ in query.records())
+        return rows, len(query.shards)
+
+
+def main(argv: list[str]) -> None:
+    invoices = int(argv[0]) if argv else 20_000
+    years = int(argv[1]) if len(argv) > 1 else 4
+    backend = FakeQuickBooks(latency=0.05, latency_per_record=1e-5, latency_exponent=1.3)
+    backend.generate(customers=500, items=100, invoices=invoices, lines=1, start=START, days=365 * years)
+    end = START + datetime.timedelta(days=365 * years - 1)
+    for request_name in ("TransactionQueryRq", "GeneralDetailReportQueryRq"):
+        start = time.perf_counter()
+        rows = _single(backend, request_name, end)
+        single = time.perf_counter() - start
+        print(f"{request_name:<27} single request        {rows:>7} rows {single:7.2f}s")
+        for sessions in (1, 4, 8):
+            start = time.perf_counter()
+            rows, shards = _sharded(backend, request_name, end, sessions)
+            elapsed = time.perf_counter() - start
+            print(f"{request_name:<27} {shards:>3} shards {sessions} sessions {rows:>7} rows {elapsed:7.2f}s "
+                  f"({single / elapsed:.1f}x)")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,39 @@
+"""paging, batching and parsing throughput against the in-process fake backend.
+
+usage: python -m benchmarks.bench_transport [customers] [latency]
+"""
+import sys
+import time
+
+from qbdesktop import Aggregate, Element, MessageAggregate, RequestProcessor
+from qbtransport import FakeQuickBooks
+
+
+def _customer_add(i: int) -> MessageAggregate:
+    return MessageAggregate("CustomerAddRq", [Aggregate("CustomerAdd", [Element("Name", f"Bench {i}")])])
+
+
+def main(argv: list[str]) -> None:
+    customers = int(argv[0]) if argv else 20_000
+    latency = float(argv[1]) if len(argv) > 1 else 0.005
+    backend = FakeQuickBooks(latency=latency).generate(customers=customers)
+    with RequestProcessor("bench", transport=backend) as qb:
+        for page_size in (100, 1000):
+            start = time.perf_counter()
+            count = sum(1 for _ in qb.paged_query("CustomerQueryRq", page_size=page_size, target_latency=None))
+            elapsed = time.perf_counter() - start
+            print(f"paged_query page_size={page_size:<5} {count} records {elapsed:.3f}s {count / elapsed:,.0f} rec/s")
+
+        writes = 500
+        start = time.perf_counter()
+        for i in range(writes):
+            list(qb.bulk_write([_customer_add(i)], batch_size=1))
+        single = time.perf_counter() - start
+        start = time.perf_counter()
+        list(qb.bulk_write((_customer_add(i) for i in range(writes)), batch_size=250))
+        batched = time.perf_counter() - start
+        print(f"{writes} adds: one per request {single:.3f}s, batched {batched:.3f}s ({single / batched:.1f}x)")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,222 @@
+"""reproducible synthetic qbXML responses for the benchmarks.
+
+Responses are written straight to a file object record by record, so corpora
+of a million records never have to fit in memory. corpus_file() keeps the
+generated files in a cache directory and only writes them once per size.
+
+usage: python -m benchmarks.corpus [directory] [sizes...]
+"""
+import datetime
+import os
+import random
+import sys
+import tempfile
+
+KINDS = ("customers", "invoices", "pages", "report")
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+DEFAULT_PAGE_SIZE = 1_000
+CACHE_DIR = os.path.join(tempfile.gettempdir(), "qbdesktop-corpus")
+START = datetime.datetime(2020, 1, 1, 8, 0, 0)
+CITIES = (("Springfield", "IL"), ("Portland", "OR"), ("Austin", "TX"), ("Columbus", "OH"), ("Madison", "WI"))
+STREETS = ("Main St", "Oak Ave", "Pine Rd", "Maple Dr", "Cedar Ln", "Elm St")
+ITEMS = 200
+REPORT_COLUMNS = (
+    ("1", "Type", "TxnType"), ("2", "Date", "Date"), ("3", "Num", "RefNumber"),
+    ("4", "Name", "Name"), ("5", "Memo", "Memo"), ("6", "Split", "SplitAccount"),
+    ("7", "Debit", "Debit"), ("8", "Credit", "Credit"), ("9", "Balance", "Balance"),
+)
+REPORT_ACCOUNTS = 50
+_HEAD = '<?xml version="1.0" ?>\n<QBXML>\n<QBXMLMsgsRs>\n'
+_TAIL = "</QBXMLMsgsRs>\n</QBXML>\n"
+
+
+#================================================================
+# RECORDS
+#================================================================
+
+def _stamp(index: int) -> str:
+    return (START + datetime.timedelta(minutes=index)).isoformat() + "-08:00"
+
+
+def _address(rnd: random.Random) -> str:
+    city, state = rnd.choice(CITIES)
+    return (f"<Addr1>{rnd.randint(1, 9999)} {rnd.choice(STREETS)}</Addr1><City>{city}</City>"
+            f"<State>{state}</State><PostalCode>{rnd.randint(10000, 99999)}</PostalCode>")
+
+
+def customer_ret(index: int, rnd: random.Random) -> str:
+    name = f"Customer {index:07d}"
+    balance = rnd.randint(0, 500_000) / 100
+    return (f"<CustomerRet><ListID>{0x80000000 + index:X}-1234567890</ListID>"
+            f"<TimeCreated>{_stamp(index)}</TimeCreated><TimeModified>{_stamp(index + 60)}</TimeModified>"
+            f"<EditSequence>{1234567890 + index}</EditSequence><Name>{name}</Name><FullName>{name}</FullName>"
+            f"<IsActive>true</IsActive><Sublevel>0</Sublevel><CompanyName>Company {index:07d} LLC</CompanyName>"
+            f"<FirstName>First{index % 997}</FirstName><LastName>Last{index % 991}</LastName>"
+            f"<BillAddress>{_address(rnd)}</BillAddress><ShipAddress>{_address(rnd)}</ShipAddress>"
+            f"<Phone>555-{rnd.randint(1000, 9999)}</Phone><Email>customer{index}@example.com</Email>"
+            f"<TermsRef><ListID>10000-1</ListID><FullName>Net 30</FullName></TermsRef>"
+            f"<Balance>{balance:.2f}</Balance><TotalBalance>{balance:.2f}</TotalBalance>"
+            f"<JobStatus>None</JobStatus></CustomerRet>\n")
+
+
+def invoice_ret(index: int, rnd: random.Random, lines: int=3) -> str:
+    customer = rnd.randrange(max(index, 1_000))
+    date = START.date() + datetime.timedelta(days=index % 1_460)
+    out = []
+    subtotal = 0
+    for line in range(lines):
+        quantity = rnd.randint(1, 10)
+        rate = rnd.randint(5, 500)
+        item = rnd.randrange(ITEMS)
+        subtotal += quantity * rate
+        out.append(f"<InvoiceLineRet><TxnLineID>{index:X}-{line}</TxnLineID>"
+                   f"<ItemRef><ListID>{0x90000000 + item:X}-1234567890</ListID><FullName>Item {item:05d}</FullName>"
+                   f"</ItemRef><Desc>Service line {line}</Desc><Quantity>{quantity}</Quantity>"
+                   f"<Rate>{rate}.00</Rate><Amount>{quantity * rate}.00</Amount></InvoiceLineRet>")
+    return (f"<InvoiceRet><TxnID>{0xA0000000 + index:X}-1234567890</TxnID>"
+            f"<TimeCreated>{_stamp(index)}</TimeCreated><TimeModified>{_stamp(index)}</TimeModified>"
+            f"<EditSequence>{1234567890 + index}</EditSequence><TxnNumber>{index + 1}</TxnNumber>"
+            f"<CustomerRef><ListID>{0x80000000 + customer:X}-1234567890</ListID>"
+            f"<FullName>Customer {customer:07d}</FullName></CustomerRef>"
+            f"<ARAccountRef><ListID>20000-1</ListID><FullName>Accounts Receivable</FullName></ARAccountRef>"
+            f"<TemplateRef><ListID>30000-1</ListID><FullName>Intuit Service Invoice</FullName></TemplateRef>"
+            f"<TxnDate>{date.isoformat()}</TxnDate><RefNumber>{10000 + index}</RefNumber>"
+            f"<BillAddress>{_address(rnd)}</BillAddress><IsPending>false</IsPending>"
+            f"<DueDate>{(date + datetime.timedelta(days=30)).isoformat()}</DueDate>"
+            f"<Subtotal>{subtotal}.00</Subtotal><SalesTaxPercentage>0.00</SalesTaxPercentage>"
+            f"<SalesTaxTotal>0.00</SalesTaxTotal><AppliedAmount>0.00</AppliedAmount>"
+            f"<BalanceRemaining>{subtotal}.00</BalanceRemaining><IsPaid>false</IsPaid>"
+            f"{''.join(out)}</InvoiceRet>\n")
+
+
+#================================================================
+# RESPONSES
+#================================================================
+
+def _status(name: str, count: int, request_id: int=1, extra: str="") -> str:
+    if count:
+        code, message = 0, "Status OK"
+    else:
+        code, message = 1, "A query request did not find a matching object in QuickBooks"
+    return (f'<{name} requestID="{request_id}" statusCode="{code}" statusSeverity="Info" '
+            f'statusMessage="{message}"{extra}>\n')
+
+
+def write_customers(out, count: int, seed: int=0) -> None:
+    """a CustomerQueryRs with count CustomerRet elements."""
+    rnd = random.Random(seed)
+    out.write(_HEAD + _status("CustomerQueryRs", count))
+    for index in range(count):
+        out.write(customer_ret(index, rnd))
+    out.write("</CustomerQueryRs>\n" + _TAIL)
+
+
+def write_invoices(out, count: int, seed: int=0, lines: int=3) -> None:
+    """an InvoiceQueryRs with count InvoiceRet elements of lines lines each."""
+    rnd = random.Random(seed)
+    out.write(_HEAD + _status("InvoiceQueryRs", count))
+    for index in range(count):
+        out.write(invoice_ret(index, rnd, lines))
+    out.write("</InvoiceQueryRs>\n" + _TAIL)
+
+
+def iterator_pages(count: int, page_size: int=DEFAULT_PAGE_SIZE, seed: int=0):
+    """CustomerQueryRs replies of an iterator walking count customers, one
+    reply per page, as QuickBooks answers iterator="Start"/"Continue"."""
+    rnd = random.Random(seed)
+    iterator_id = "{3B4A4C2E-5F10-4D6E-9A1B-0C2D3E4F5A6B}"
+    for page, start in enumerate(range(0, max(count, 1), page_size)):
+        size = min(page_size, count - start)
+        remaining = count - start - size
+        extra = f' iteratorRemainingCount="{remaining}" iteratorID="{iterator_id}"'
+        body = "".join(customer_ret(index, rnd) for index in range(start, start + size))
+        yield _HEAD + _status("CustomerQueryRs", size, page + 1, extra) + body + "</CustomerQueryRs>\n" + _TAIL
+
+
+def write_pages(out, count: int, seed: int=0, page_size: int=DEFAULT_PAGE_SIZE) -> None:
+    """the iterator pages of iterator_pages(), separated by form feeds."""
+    for page in iterator_pages(count, page_size, seed):
+        out.write(page)
+        out.write("\f")
+
+
+def read_pages(file):
+    """iterate the pages of a file written by write_pages()."""
+    buffer = ""
+    for chunk in iter(lambda: file.read(1 << 20), ""):
+        buffer += chunk
+        *pages, buffer = buffer.split("\f")
+        yield from pages
+
+
+def write_report(out, rows: int, seed: int=0) -> None:
+    """a GeneralDetailReportQueryRs with about rows data rows spread over REPORT_ACCOUNTS sections."""
+    out.write(_HEAD + '<GeneralDetailReportQueryRs statusCode="0" statusSeverity="Info" statusMessage="Status OK">'
+              '<ReportRet><ReportTitle>General Ledger</ReportTitle><ReportSubtitle>All Transactions</ReportSubtitle>'
+              f'<ReportBasis>Accrual</ReportBasis><NumRows>{rows}</NumRows>'
+              f'<NumColumns>{len(REPORT_COLUMNS)}</NumColumns>')
+    for col_id, title, col_type in REPORT_COLUMNS:
+        out.write(f'<ColDesc colID="{col_id}" dataType="STRTYPE"><ColTitle titleRow="1" value="{title}" />'
+                  f'<ColType>{col_type}</ColType></ColDesc>')
+    out.write("<ReportData>")
+    number = 0
+    per_account = max(rows // REPORT_ACCOUNTS, 1)
+    for account in range(REPORT_ACCOUNTS):
+        number += 1
+        out.write(f'<TextRow rowNumber="{number}" value="Account {account}" />')
+        balance = 0.0
+        for line in range(per_account):
+            number += 1
+            amount = (line * 37 % 1000) + 0.25
+            balance += amount
+            out.write(f'<DataRow rowNumber="{number}"><RowData rowType="account" value="Account {account}" />'
+                      f'<ColData colID="1" value="Invoice" /><ColData colID="2" value="2024-{line % 12 + 1:02d}-15" />'
+                      f'<ColData colID="3" value="{line}" /><ColData colID="4" value="Customer {line % 500}" />'
+                      f'<ColData colID="6" value="Accounts Receivable" /><ColData colID="7" value="{amount}" />'
+                      f'<ColData colID="9" value="{balance:.2f}" /></DataRow>')
+        number += 1
+        out.write(f'<SubtotalRow rowNumber="{number}"><RowData rowType="account" value="Account {account}" />'
+                  f'<ColData colID="1" value="Total Account {account}" /><ColData colID="7" value="{balance:.2f}" />'
+                  f'<ColData colID="9" value="{balance:.2f}" /></SubtotalRow>')
+    out.write(f'<TotalRow rowNumber="{number + 1}"><ColData colID="1" value="TOTAL" /></TotalRow>')
+    out.write("</ReportData></ReportRet></GeneralDetailReportQueryRs>\n" + _TAIL)
+
+
+WRITERS = {"customers": write_customers, "invoices": write_invoices, "pages": write_pages, "report": write_report}
+
+
+def corpus_file(kind: str, count: int, directory: str=CACHE_DIR, seed: int=0) -> str:
+    """path of a generated response, written on first use.
+
+    Args:
+        kind (str): one of KINDS
+        count (int): records (report: data rows)
+        directory (str): cache directory
+        seed (int): seed of the generated values
+
+    Returns:
+        str: path of the utf-8 file
+    """
+    if kind not in WRITERS:
+        raise ValueError(f"unknown corpus {kind!r}, expected one of {KINDS}")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{kind}-{count}-{seed}.xml")
+    if not os.path.exists(path):
+        partial = path + ".part"
+        with open(partial, "w", encoding="utf-8", newline="") as out:
+            WRITERS[kind](out, count, seed)
+        os.replace(partial, path)
+    return path
+
+
+def main(argv: list[str]) -> None:
+    directory = argv[0] if argv and not argv[0].isdigit() else CACHE_DIR
+    sizes = [int(size) for size in argv if size.isdigit()] or DEFAULT_SIZES
+    for kind in KINDS:
+        for size in sizes:
+            path = corpus_file(kind, size, directory)
+            print(f"{kind:<10} {size:>9} {os.path.getsize(path) / 2 ** 20:9.1f} MiB  {path}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,259 @@
+"""the benchmark suite: throughput and peak memory of the request builders,
+response parsing and end-to-end queries against the fake backend, over
+generated corpora (see benchmarks.corpus), written to a JSON file that can be
+compared with the file of another commit.
+
+usage:
+    python -m benchmarks.suite run [--sizes 1000,10000] [--cases parse_customers,...] [--repeat 3]
+                                   [--output results.json] [--corpus DIR]
+    python -m benchmarks.suite compare base.json head.json [--threshold 10]
+
+Every case runs --repeat times for the time and once more under tracemalloc
+for the peak, so tracing does not distort the throughput figures. compare
+exits with status 1 when a case got slower or bigger by more than
+--threshold percent.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from benchmarks.corpus import CACHE_DIR, DEFAULT_SIZES, corpus_file, read_pages
+from qbdesktop import (Aggregate, Element, MessageAggregate, PagedQuery, QBXMLDocument, QuickBooksResponse,
+                       RequestProcessor)
+from qbreports import parse_report
+from qbtransport import FakeQuickBooks
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_REPEAT = 3
+DEFAULT_THRESHOLD = 10.0
+E2E_MAX_SIZE = 100_000
+
+
+#================================================================
+# CASES
+#================================================================
+# each case takes (size, corpus directory), does its setup and returns a
+# callable that runs the measured part and returns (records, bytes)
+
+def _invoice_add(index: int) -> MessageAggregate:
+    return MessageAggregate("InvoiceAddRq", [Aggregate("InvoiceAdd", [
+        Aggregate("CustomerRef", [Element("FullName", f"Customer {index % 1000:07d}")]),
+        Element("TxnDate", "2024-01-15"),
+        Element("RefNumber", str(10000 + index)),
+        Element("Memo", f"Synthetic invoice {index} & co"),
+        Aggregate("InvoiceLineAdd", [
+            Aggregate("ItemRef", [Element("FullName", f"Item {index % 200:05d}")]),
+            Element("Quantity", str(index % 10 + 1)),
+            Element("Rate", "25.00"),
+        ]),
+    ])])
+
+
+def case_build(size: int, directory: str):
+    def run():
+        text = QBXMLDocument([_invoice_add(index) for index in range(size)]).read()
+        return size, len(text)
+    return run
+
+
+def _parse(kind: str, typed: bool):
+    def case(size: int, directory: str):
+        path = corpus_file(kind, size, directory)
+
+        def run():
+            with open(path, "rb") as file:
+                response = QuickBooksResponse(None, file)
+                records = response.typed_records() if typed else response.records()
+                return sum(1 for _ in records), os.path.getsize(path)
+        return run
+    return case
+
+
+def case_pages(size: int, directory: str):
+    path = corpus_file("pages", size, directory)
+
+    def run():
+        query = PagedQuery("CustomerQueryRq", target_latency=None)
+        count = 0
+        with open(path, encoding="utf-8") as file:
+            for page in read_pages(file):
+                count += len(query.feed(page))
+        return count, os.path.getsize(path)
+    return run
+
+
+def case_report(size: int, directory: str):
+    path = corpus_file("report", size, directory)
+
+    def run():
+        with open(path, "rb") as file:
+            return len(parse_report(file)), os.path.getsize(path)
+    return run
+
+
+def case_e2e(size: int, directory: str):
+    if size > E2E_MAX_SIZE:
+        return None
+    backend = FakeQuickBooks().generate(customers=size)
+
+    def run():
+        sent = [0]
+        with RequestProcessor("bench", transport=backend) as qb:
+            send = qb.process_request
+
+            def process_request(request):
+                response = send(request)
+                sent[0] += len(response)
+                return response
+            qb.process_request = process_request
+            count = sum(1 for _ in qb.paged_query("CustomerQueryRq", page_size=1_000, target_latency=None))
+        return count, sent[0]
+    return run
+
+
+CASES = {
+    "build": case_build,
+    "parse_customers": _parse("customers", False),
+    "parse_invoices": _parse("invoices", False),
+    "parse_invoices_typed": _parse("invoices", True),
+    "pages": case_pages,
+    "report": case_report,
+    "e2e_paged": case_e2e,
+}
+
+
+#================================================================
+# RUN
+#================================================================
+
+def measure(run, repeat: int) -> dict:
+    """best of repeat timed runs, then one traced run for the peak."""
+    best = float("inf")
+    records = size = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        records, size = run()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "records": records, "bytes": size, "seconds": best,
+        "records_per_s": records / best if best else 0.0,
+        "mib_per_s": size / 2 ** 20 / best if best else 0.0,
+        "peak_bytes": peak,
+    }
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(sizes, cases, repeat: int=DEFAULT_REPEAT, directory: str=CACHE_DIR, report=print) -> dict:
+    """run the cases for every size.
+
+    Returns:
+        dict: commit, interpreter, platform, time and one result per (case, size)
+    """
+    results = []
+    for name in cases:
+        for size in sizes:
+            run = CASES[name](size, directory)
+            if run is None:
+                report(f"{name:<22} {size:>9}  skipped")
+                continue
+            result = {"case": name, "size": size, **measure(run, repeat)}
+            results.append(result)
+            report(f"{name:<22} {size:>9} {result['records_per_s']:>12,.0f} rec/s {result['mib_per_s']:>8.1f} MiB/s "
+                   f"{result['peak_bytes'] / 2 ** 20:>8.1f} MiB peak")
+    return {
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def compare(base: dict, head: dict, threshold: float=DEFAULT_THRESHOLD, report=print) -> list:
+    """changes between two suite files.
+
+    Returns:
+        list[str]: the (case, size) entries that regressed by more than threshold percent
+    """
+    before = {(result["case"], result["size"]): result for result in base["results"]}
+    regressions = []
+    report(f"{(base.get('commit') or '?')[:10]} -> {(head.get('commit') or '?')[:10]}")
+    report(f"{'case':<22} {'size':>9} {'rec/s':>12} {'change':>8} {'peak MiB':>9} {'change':>8}")
+    for result in head["results"]:
+        key = (result["case"], result["size"])
+        old = before.get(key)
+        if old is None:
+            report(f"{key[0]:<22} {key[1]:>9} {result['records_per_s']:>12,.0f} {'new':>8}")
+            continue
+        speed = _change(old["records_per_s"], result["records_per_s"])
+        memory = _change(old["peak_bytes"], result["peak_bytes"])
+        regressed = speed < -threshold or memory > threshold
+        if regressed:
+            regressions.append(f"{key[0]}[{key[1]}]")
+        report(f"{key[0]:<22} {key[1]:>9} {result['records_per_s']:>12,.0f} {speed:>+7.1f}% "
+               f"{result['peak_bytes'] / 2 ** 20:>9.1f} {memory:>+7.1f}%{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def _change(old: float, new: float) -> float:
+    return (new - old) / old * 100 if old else 0.0
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.suite")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="run the suite and write a results file")
+    run.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)))
+    run.add_argument("--cases", default=",".join(CASES))
+    run.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    run.add_argument("--output", default=None, help="defaults to bench-<commit>.json")
+    run.add_argument("--corpus", default=CACHE_DIR, help="directory of the generated responses")
+    diff = commands.add_parser("compare", help="compare two results files")
+    diff.add_argument("base")
+    diff.add_argument("head")
+    diff.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        with open(args.base, encoding="utf-8") as file:
+            base = json.load(file)
+        with open(args.head, encoding="utf-8") as file:
+            head = json.load(file)
+        regressions = compare(base, head, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+        return 1 if regressions else 0
+
+    cases = [name.strip() for name in args.cases.split(",") if name.strip()]
+    unknown = [name for name in cases if name not in CASES]
+    if unknown:
+        parser.error(f"unknown cases {unknown}, expected some of {list(CASES)}")
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    results = run_suite(sizes, cases, args.repeat, args.corpus)
+    output = args.output or f"bench-{(results['commit'] or 'local')[:10]}.json"
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+    print(f"results written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,56 +1,218 @@
 
+import asyncio
+import hashlib
+import json
+import logging
 import subprocess
+import sys
 import time
 import platform
 import zipfile
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 
+INSTALLER_NAME = "QBSDK160_x64.exe"
+DEFAULT_CHUNK_SIZE_MB = 20
+READ_BUFFER_SIZE = 1024 * 1024
+MANIFEST_SUFFIX = ".manifest.json"
+QB_SDK_PATH = "C:\\Program Files\\Intuit\\IDN\\QBSDK16.0"
+ENVIRONMENT_CACHE = "environment.json"
+TOOLS_INSTALLERS_PATH = "C:\\Program Files (x86)\\Intuit\\IDN\\QBSDK16.0\\tools\\installers"
+MAX_PARALLEL_INSTALLERS = 4
+_ENVIRONMENT = None
 
-def split_exe(input_file_path, output_folder, chunk_size_mb=20):
+log = logging.getLogger("qbdesktop.installer")
+
+
+def manifest_path(folder, file_name):
+    return os.path.join(folder, os.path.basename(file_name) + MANIFEST_SUFFIX)
+
+
+def _read_blocks(file, size):
+    """yield at most size bytes of file in READ_BUFFER_SIZE blocks."""
+    while size > 0:
+        block = file.read(min(READ_BUFFER_SIZE, size))
+        if not block:
+            return
+        size -= len(block)
+        yield block
+
+
+def _compress_part(input_file_path, output_file_path, offset, size):
+    """deflate one byte range of the input into its own zip part and return its SHA-256."""
+    digest = hashlib.sha256()
+    with open(input_file_path, 'rb') as input_file, \
+         zipfile.ZipFile(output_file_path, 'w', zipfile.ZIP_DEFLATED) as zip_file, \
+         zip_file.open(os.path.basename(input_file_path), 'w', force_zip64=True) as entry:
+        input_file.seek(offset)
+        for block in _read_blocks(input_file, size):
+            digest.update(block)
+            entry.write(block)
+    return digest.hexdigest()
+
+
+def split_exe(input_file_path, output_folder, chunk_size_mb=DEFAULT_CHUNK_SIZE_MB, workers=None):
+    """split a file into deflated zip parts plus a manifest with the SHA-256 of
+    every part and of the whole file.
+
+    Parts are compressed in parallel, each from its own file handle in
+    READ_BUFFER_SIZE blocks, so memory stays at a few MB per worker whatever
+    the file size.
+
+    Args:
+        input_file_path (str): file to split
+        output_folder (str): folder for <name>_part_<n>.zip and <name>.manifest.json
+        chunk_size_mb (int): uncompressed size of a part
+        workers (int): parts compressed at once, os.cpu_count() by default
+
+    Returns:
+        dict: the manifest, None if the input does not exist
+    """
     if not os.path.exists(input_file_path):
-        print(f"Error: File not found - {input_file_path}")
-        return
-    if not os.path.exists(output_folder):                                                   # Create the output folder if it doesn't exist
-        os.makedirs(output_folder)
-    chunk_size_bytes = chunk_size_mb * 1024 * 1024                                          # Calculate the chunk size in bytes
-    with open(input_file_path, 'rb') as input_file:                                         # Open the input file for reading in binary mode
-        file_content = input_file.read()                                                    # Read the input file content
-        total_size = len(file_content)                                                      # Get the total size of the file
-        num_chunks = (total_size + chunk_size_bytes - 1) // chunk_size_bytes                # Calculate the number of chunks needed
-
-        for i in range(num_chunks):                                                         # Split the file into chunks
-            start_index = i * chunk_size_bytes                                              # Calculate the start and end indices for each chunk
-            end_index = min((i + 1) * chunk_size_bytes, total_size)
-            output_file_name = f"{os.path.basename(input_file_path)}_part_{i + 1}.zip"      # Create the output file name
-            output_file_path = os.path.join(output_folder, output_file_name)
-            with zipfile.ZipFile(output_file_path, 'w', zipfile.ZIP_DEFLATED) as zip_file:  # Write the chunk to the output file
-                zip_file.writestr(os.path.basename(input_file_path), file_content[start_index:end_index])
-            print(f"Chunk {i + 1} created: {output_file_path}")
-    print("Splitting complete.")
-
-def combine_chunks(input_folder: str, output_file: str) -> None:
-    # Get a list of all zip files in the input folder
+        log.error("File not found - %s", input_file_path)
+        return None
+    os.makedirs(output_folder, exist_ok=True)
+    name = os.path.basename(input_file_path)
+    chunk_size_bytes = chunk_size_mb * 1024 * 1024
+    total_size = os.path.getsize(input_file_path)
+    parts = []
+    for i, offset in enumerate(range(0, total_size, chunk_size_bytes)):
+        parts.append({"name": f"{name}_part_{i + 1}.zip", "offset": offset,
+                      "size": min(chunk_size_bytes, total_size - offset)})
+
+    with ThreadPoolExecutor(workers or os.cpu_count()) as executor:
+        futures = [executor.submit(_compress_part, input_file_path, os.path.join(output_folder, part["name"]),
+                                   part["offset"], part["size"]) for part in parts]
+        whole = hashlib.sha256()                                                            # hash the whole file while the parts compress
+        with open(input_file_path, 'rb') as input_file:
+            for block in _read_blocks(input_file, total_size):
+                whole.update(block)
+        for part, future in zip(parts, futures):
+            part["sha256"] = future.result()
+            log.info("Chunk %s created", part["name"])
+
+    manifest = {"file": name, "size": total_size, "sha256": whole.hexdigest(),
+                "chunk_size": chunk_size_bytes, "parts": parts}
+    with open(manifest_path(output_folder, name), 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    log.info("Splitting complete.")
+    return manifest
+
+
+def load_manifest(input_folder, file_name):
+    """the manifest of file_name in input_folder, or the only manifest there."""
+    path = manifest_path(input_folder, file_name)
+    if not os.path.exists(path):
+        manifests = [f for f in os.listdir(input_folder) if f.endswith(MANIFEST_SUFFIX)]
+        if len(manifests) != 1:
+            return None
+        path = os.path.join(input_folder, manifests[0])
+    with open(path) as manifest_file:
+        return json.load(manifest_file)
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(READ_BUFFER_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def is_combined(output_file, manifest):
+    """True if output_file already has the size and SHA-256 recorded in the manifest."""
+    return (os.path.exists(output_file) and os.path.getsize(output_file) == manifest["size"]
+            and file_sha256(output_file) == manifest["sha256"])
+
+
+def combine_chunks(input_folder: str, output_file: str, resume: bool=True) -> bool:
+    """stream the zip parts back into output_file.
+
+    With a manifest (written by split_exe) nothing is done when the output
+    already matches the whole-file hash. Otherwise the parts of a partially
+    written output that still match their hashes are kept, the output is
+    truncated after the last good part and the rest is appended. Every part
+    and the finished file are verified. Without a manifest the parts are
+    concatenated in part number order, unverified.
+
+    Args:
+        input_folder (str): folder holding the parts and the manifest
+        output_file (str): file to write
+        resume (bool): keep verified parts of an existing output
+
+    Raises:
+        ValueError: a part or the combined file does not match the manifest
+
+    Returns:
+        bool: True if the output was written, False if it was already complete
+    """
+    manifest = load_manifest(input_folder, output_file)
+    if manifest is None:
+        _combine_unverified(input_folder, output_file)
+        return True
+    if is_combined(output_file, manifest):
+        log.info("Combined file already matches the manifest.")
+        return False
+
+    whole = hashlib.sha256()
+    mode = 'r+b' if resume and os.path.exists(output_file) else 'wb'
+    with open(output_file, mode) as ofile:
+        existing = os.fstat(ofile.fileno()).st_size
+        kept = 0
+        for part in manifest["parts"]:                                                      # re-hash the parts already on disk
+            end = part["offset"] + part["size"]
+            if end > existing:
+                break
+            digest = hashlib.sha256()
+            running = whole.copy()
+            ofile.seek(part["offset"])
+            for block in _read_blocks(ofile, part["size"]):
+                digest.update(block)
+                running.update(block)
+            if digest.hexdigest() != part["sha256"]:
+                break
+            whole = running
+            kept += 1
+        start = manifest["parts"][kept]["offset"] if kept < len(manifest["parts"]) else manifest["size"]
+        ofile.seek(start)
+        ofile.truncate()
+        if kept:
+            log.info("Resuming after %d verified chunks.", kept)
+
+        for part in manifest["parts"][kept:]:
+            digest = hashlib.sha256()
+            with zipfile.ZipFile(os.path.join(input_folder, part["name"]), 'r') as zip_file:
+                with zip_file.open(zip_file.namelist()[0]) as entry:
+                    for block in iter(lambda: entry.read(READ_BUFFER_SIZE), b""):
+                        digest.update(block)
+                        whole.update(block)
+                        ofile.write(block)
+            if digest.hexdigest() != part["sha256"]:
+                ofile.truncate(part["offset"])
+                raise ValueError(f"chunk {part['name']} does not match the manifest")
+            log.info("Chunk %s added to the output file.", part["name"])
+    if whole.hexdigest() != manifest["sha256"]:
+        raise ValueError(f"{output_file} does not match the manifest")
+    log.info("Combining complete.")
+    return True
+
+
+def _combine_unverified(input_folder, output_file):
     zip_files = [f for f in os.listdir(input_folder) if f.endswith(".zip")]
-    # Sort the zip files based on part number
     zip_files.sort(key=lambda x: int(x.split('_')[-1].split('.')[0]))
-    # Open the output file for writing in binary mode
     with open(output_file, 'wb') as ofile:
-        # Iterate through the sorted zip files and append their content to the output file
         for zip_file_name in zip_files:
-            zip_file_path = os.path.join(input_folder, zip_file_name)
-            with zipfile.ZipFile(zip_file_path, 'r') as zip_file:
-                # Assume there is only one file in the zip archive (the original exe)
-                file_content = zip_file.read(zip_file.namelist()[0])
-                ofile.write(file_content)
-            print(f"Chunk {zip_file_name} added to the output file.")
-    print("Combining complete.")
+            with zipfile.ZipFile(os.path.join(input_folder, zip_file_name), 'r') as zip_file:
+                with zip_file.open(zip_file.namelist()[0]) as entry:
+                    for block in iter(lambda: entry.read(READ_BUFFER_SIZE), b""):
+                        ofile.write(block)
+            log.info("Chunk %s added to the output file.", zip_file_name)
+    log.info("Combining complete.")
+
 
 def make_broken_zip():
-    installer_origin_exe = "QBSDK160_x64.exe"
-    installer_output_folder = os.getcwd()
-    split_exe("QBSDK160_x64.exe", installer_output_folder)
-    #combine_chunks(installer_output_folder, installer_origin_exe)
+    split_exe(INSTALLER_NAME, os.getcwd())
 
 
 
@@ -62,56 +224,204 @@ def make_broken_zip():
 def is_windows():
     return platform.system().lower() == 'windows'
 
-def ensure_installation() -> None:
-    """Make sure that the quickbooks installation is 
-       complete and ready to use. """
-    
-    qb_sdk_path = "C:\\Program Files\\Intuit\\IDN\\QBSDK16.0"
-    installer_home_exe = os.path.join(os.getcwd(),"QBSDK160_x64.exe")
-    
-    # check to see if the quickbooks sdk is available
-    if not os.path.exists(qb_sdk_path):
-        print("Running installer...")
-        combine_chunks(os.getcwd(), installer_home_exe)
-        installer_path = "QBSDK160_x64.exe" # create installer path
-        install_process = subprocess.Popen([installer_path])                      # run the installer
-        install_progress = install_process.poll() 
-        while install_progress is None:                                           # wait for installer to finish
-            install_progress = install_process.poll()
-            time.sleep(0.50)
-        print(install_process.returncode)
-
-        qb_xml_requester_path = "C:\\Program Files (x86)\\Intuit\\IDN\\QBSDK16.0\\tools\\installers"
-        for root, dirs, files in os.walk(qb_xml_requester_path):
-            for file in files:
-                print("installing ", file)
-                exepath = os.path.join(root, file)
-                installing_process = subprocess.Popen([exepath])
-                installing_progress = installing_process.poll()
-                while installing_progress is None:
-                    installing_progress = installing_process.poll()
-                    time.sleep(0.50)
-                print(install_process.returncode)
-
-        print("installation complete")
+class InstallEvent:
+    """progress of the installation, passed to the on_event callback.
+
+    Attributes:
+        stage (str): check, combine, start, finish or done
+        name (str): installer file name, "" for the whole installation
+        returncode (int): exit code once an installer finished
+        elapsed (float): seconds since the installer (or the installation) started
+    """
+    __slots__ = ("stage", "name", "returncode", "elapsed")
+
+    def __init__(self, stage: str, name: str="", returncode: int=None, elapsed: float=0.0) -> None:
+        self.stage = stage
+        self.name = name
+        self.returncode = returncode
+        self.elapsed = elapsed
+
+    def __repr__(self) -> str:
+        return f"InstallEvent({self.stage!r}, {self.name!r}, returncode={self.returncode}, elapsed={self.elapsed:.2f})"
+
+
+def log_event(event: InstallEvent) -> None:
+    """default on_event callback, reports through the qbdesktop.installer logger."""
+    if event.stage == "finish":
+        log.info("%s finished with exit code %s after %.1fs", event.name, event.returncode, event.elapsed)
     else:
-        print("installation checked and passed successfully") 
+        log.info("%s %s (%.1fs)", event.stage, event.name, event.elapsed)
+
+
+def run_installer(path: str, args=(), timeout: float=None, on_event=log_event) -> int:
+    """run one installer and block in Popen.wait() until it exits.
+
+    Raises:
+        subprocess.TimeoutExpired: still running after timeout seconds
+
+    Returns:
+        int: the installer exit code
+    """
+    name = os.path.basename(path)
+    start = time.perf_counter()
+    on_event(InstallEvent("start", name))
+    process = subprocess.Popen([path, *args])
+    returncode = process.wait(timeout)
+    on_event(InstallEvent("finish", name, returncode, time.perf_counter() - start))
+    return returncode
+
+
+async def run_installer_async(path: str, args=(), on_event=log_event) -> int:
+    """run one installer as an asyncio subprocess and return its exit code."""
+    name = os.path.basename(path)
+    start = time.perf_counter()
+    on_event(InstallEvent("start", name))
+    process = await asyncio.create_subprocess_exec(path, *args)
+    returncode = await process.wait()
+    on_event(InstallEvent("finish", name, returncode, time.perf_counter() - start))
+    return returncode
+
+
+async def run_installers(paths, on_event=log_event, max_parallel: int=MAX_PARALLEL_INSTALLERS,
+                         parallel_safe=()) -> dict:
+    """run independent installers concurrently.
+
+    Windows Installer packages (.msi) take the system wide installer mutex,
+    and most .exe bootstrappers start msiexec themselves, so both run one
+    after another. Only installers listed in parallel_safe run next to them.
+    No more than max_parallel installers run at once in total.
+
+    Args:
+        paths (iterable[str]): installer files
+        on_event (callable): receives an InstallEvent per step
+        max_parallel (int): installers running at once
+        parallel_safe (iterable[str]): paths or file names of installers that
+            do not use Windows Installer
+
+    Returns:
+        dict: exit code per installer path
+    """
+    slots = asyncio.Semaphore(max_parallel)
+    msi_lock = asyncio.Lock()
+    safe = {os.path.normcase(name) for name in parallel_safe}
+
+    async def start(path):
+        if path.lower().endswith(".msi"):
+            return path, await run_installer_async("msiexec", ("/i", path), on_event)
+        return path, await run_installer_async(path, (), on_event)
+
+    async def run(path):
+        if os.path.normcase(path) in safe or os.path.normcase(os.path.basename(path)) in safe:
+            async with slots:
+                return await start(path)
+        async with msi_lock, slots:
+            return await start(path)
+
+    return dict(await asyncio.gather(*(run(path) for path in paths)))
+
+
+def ensure_installation(on_event=log_event, max_parallel: int=MAX_PARALLEL_INSTALLERS, parallel_safe=()) -> dict:
+    """Make sure that the quickbooks installation is
+       complete and ready to use.
 
-def precheck() -> None:
+    Combines and runs the bundled SDK installer when the SDK is missing,
+    then runs the tools installers it ships, concurrently where safe.
+
+    Args:
+        on_event (callable): receives an InstallEvent per step, logs by default
+        max_parallel (int): tools installers run at once
+        parallel_safe (iterable[str]): tools installers that do not use Windows
+            Installer and may run next to others, see run_installers()
+
+    Returns:
+        dict: exit code per installer path, empty if the SDK was already installed
+    """
+    start = time.perf_counter()
+    if os.path.exists(QB_SDK_PATH):
+        on_event(InstallEvent("check", "installation checked and passed", elapsed=time.perf_counter() - start))
+        return {}
+    installer_home_exe = os.path.join(os.getcwd(), INSTALLER_NAME)
+    combine_chunks(os.getcwd(), installer_home_exe)
+    on_event(InstallEvent("combine", INSTALLER_NAME, elapsed=time.perf_counter() - start))
+    results = {installer_home_exe: run_installer(installer_home_exe, on_event=on_event)}
+
+    tools = [os.path.join(root, file) for root, dirs, files in os.walk(TOOLS_INSTALLERS_PATH) for file in files]
+    results.update(asyncio.run(run_installers(sorted(tools), on_event, max_parallel, parallel_safe)))
+    on_event(InstallEvent("done", "installation", elapsed=time.perf_counter() - start))
+    return results
+
+
+def cache_dir() -> str:
+    """per user cache folder, %LOCALAPPDATA%\\qbdesktop or ~/.cache/qbdesktop."""
     if is_windows():
-        print("Running on Windows.")
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~\\AppData\\Local")
     else:
-        print("Not running on Windows.")
-        exit()
-    installer_path = os.path.join(os.getcwd(), "QBSDK160_64.exe")
-    if not os.path.exists(installer_path):
-        combine_chunks(os.getcwd(), installer_path)
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "qbdesktop")
+
+
+def check_environment() -> dict:
+    """probe the host without changing anything."""
+    import importlib.util
+    windows = is_windows()
+    status = {
+        "platform": platform.system(),
+        "python": sys.executable,
+        "windows": windows,
+        "sdk_installed": windows and os.path.exists(QB_SDK_PATH),
+        "pywin32": importlib.util.find_spec("win32com") is not None,
+        "checked_at": time.time(),
+    }
+    status["ready"] = status["sdk_installed"] and status["pywin32"]
+    return status
+
 
+def _load_status(path):
     try:
-        ensure_installation()
-    except Exception as e:
-        print(e)
-        print("installation failed to proceed or pass.")
-        exit()
+        with open(path) as cache_file:
+            return json.load(cache_file)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_status(path, status):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as cache_file:
+            json.dump(status, cache_file, indent=2)
+    except OSError:
+        pass
+
+
+def precheck(install: bool=False, refresh: bool=False, cache_path: str=None, on_event=log_event) -> dict:
+    """check once that this host can talk to QuickBooks, optionally installing the SDK.
+
+    Nothing runs at import time any more; call this explicitly, e.g. at the
+    start of a CLI. A ready result is kept for the life of the process and
+    written to cache_path, so later runs with the same interpreter skip the
+    check entirely. Results that are not ready are probed again next time.
+
+    Args:
+        install (bool): combine and run the bundled SDK installer if the SDK is missing
+        refresh (bool): ignore the cached result
+        cache_path (str): JSON file for the result, <cache_dir()>/environment.json by default
+        on_event (callable): installation progress callback, see ensure_installation()
+
+    Returns:
+        dict: platform, python, windows, sdk_installed, pywin32, ready and checked_at
+    """
+    global _ENVIRONMENT
+    if _ENVIRONMENT is not None and not refresh:
+        return _ENVIRONMENT
+    path = cache_path or os.path.join(cache_dir(), ENVIRONMENT_CACHE)
+    status = None if refresh else _load_status(path)
+    if not status or not status.get("ready") or status.get("python") != sys.executable:
+        status = check_environment()
+        if install and status["windows"] and not status["sdk_installed"]:
+            ensure_installation(on_event)
+            status = check_environment()
+        _save_status(path, status)
+    _ENVIRONMENT = status
+    return status
 
 
@@ -0,0 +1,229 @@
+import asyncio
+import itertools
+import queue
+import threading
+import time
+
+from qbdesktop import DEFAULT_PAGE_SIZE, PagedQuery
+
+
+#================================================================
+#CONST
+#================================================================
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 5
+PRIORITY_BULK = 10
+DEFAULT_MAX_PENDING = 64
+
+
+#================================================================
+# CLASSES
+#================================================================
+
+class RequestTiming:
+    """timestamps (time.perf_counter) of one request through the worker."""
+    __slots__ = ("priority", "queued", "started", "finished", "request_bytes", "response_bytes", "error")
+
+    def __init__(self, priority: int, request_bytes: int) -> None:
+        self.priority = priority
+        self.request_bytes = request_bytes
+        self.response_bytes = 0
+        self.queued = time.perf_counter()
+        self.started = None
+        self.finished = None
+        self.error = None
+
+    @property
+    def wait(self) -> float:
+        return self.started - self.queued
+
+    @property
+    def run(self) -> float:
+        return self.finished - self.started
+
+    def __repr__(self) -> str:
+        return f"RequestTiming(priority={self.priority}, wait={self.wait:.4f}, run={self.run:.4f})"
+
+
+class _Job:
+    __slots__ = ("priority", "sequence", "request", "future", "cancelled", "timing")
+
+    def __init__(self, priority, sequence: int, request: str=None, future=None) -> None:
+        self.priority = priority
+        self.sequence = sequence
+        self.request = request
+        self.future = future
+        self.cancelled = False
+        self.timing = RequestTiming(priority, len(request) if request else 0)
+
+    def __lt__(self, other: "_Job") -> bool:
+        return (self.priority, self.sequence) < (other.priority, other.sequence)
+
+
+def _resolve(future, result, error) -> None:
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+class AsyncRequestProcessor:
+    def __init__(self, processor_factory, max_pending: int=DEFAULT_MAX_PENDING, on_timing=None) -> None:
+        """asyncio front-end for the blocking QuickBooks processor.
+
+        All calls run on one dedicated worker thread that initializes COM once,
+        creates the processor there and keeps it for its whole life, which is
+        what the apartment threaded QuickBooks objects require. Requests wait
+        in a priority queue, so interactive lookups can jump ahead of bulk
+        syncs, and at most max_pending requests may be queued before callers
+        are suspended.
+
+        Args:
+            processor_factory (callable): called on the worker thread, returns an
+                object with process_request(xml). Context managers such as
+                RequestProcessor are entered and exited by the worker.
+            max_pending (int): queued requests allowed before callers wait
+            on_timing (callable): called on the event loop with a RequestTiming
+                after every request
+        """
+        self.processor_factory = processor_factory
+        self.max_pending = max_pending
+        self.timing_hooks = [on_timing] if on_timing else []
+        self._queue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._slots = None
+        self._loop = None
+        self._thread = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    def add_timing_hook(self, hook) -> None:
+        self.timing_hooks.append(hook)
+
+    async def start(self) -> None:
+        """start the worker thread and wait until its session is open.
+
+        Raises:
+            Exception: whatever creating or opening the processor raised; the
+                processor is left stopped
+        """
+        self._loop = asyncio.get_running_loop()
+        self._slots = asyncio.Semaphore(self.max_pending)
+        ready = self._loop.create_future()
+        self._thread = threading.Thread(target=self._run, args=(ready,), name="qbxml-worker", daemon=True)
+        self._thread.start()
+        try:
+            await ready
+        except BaseException:
+            self._thread = None
+            raise
+
+    async def close(self) -> None:
+        """let queued requests finish, then close the session and stop the worker."""
+        if self._thread is None:
+            return
+        self._queue.put(_Job(float("inf"), next(self._sequence)))
+        await self._loop.run_in_executor(None, self._thread.join)
+        self._thread = None
+
+    async def process_request(self, request: str, priority: int=PRIORITY_NORMAL, timeout: float=None) -> str:
+        """send a request and wait for the response without blocking the loop.
+
+        Args:
+            request (str): qbXML request
+            priority (int): lower runs first, see PRIORITY_INTERACTIVE and PRIORITY_BULK
+            timeout (float): seconds to wait for the response
+
+        Raises:
+            asyncio.TimeoutError: no response within timeout. The request is
+                skipped if it has not started yet.
+            RuntimeError: the worker is not running
+
+        Returns:
+            str: qbXML response
+        """
+        if self._thread is None or not self._thread.is_alive():
+            raise RuntimeError("AsyncRequestProcessor is not started")
+        await self._slots.acquire()
+        job = _Job(priority, next(self._sequence), request, self._loop.create_future())
+        try:
+            self._queue.put(job)
+            return await asyncio.wait_for(job.future, timeout)
+        except BaseException:
+            job.cancelled = True
+            raise
+        finally:
+            self._slots.release()
+
+    async def query(self, request_name: str, filters: dict=None, page_size: int=DEFAULT_PAGE_SIZE,
+                    priority: int=PRIORITY_BULK, **options):
+        """async generator over the records of an iterator paged Query request.
+        Pages are parsed in the default executor so the loop stays responsive.
+
+        Args:
+            request_name (str): e.g. CustomerQueryRq
+            filters (dict): extra query elements, see build_nodes()
+            page_size (int): MaxReturned for the first page
+            priority (int): queue priority of every page request
+            **options: passed on to PagedQuery
+        """
+        paged = PagedQuery(request_name, filters, page_size, **options)
+        while not paged.done:
+            start = time.perf_counter()
+            response = await self.process_request(paged.request(), priority)
+            elapsed = time.perf_counter() - start
+            records = await self._loop.run_in_executor(None, paged.feed, response, elapsed)
+            for record in records:
+                yield record
+
+    def _run(self, ready) -> None:
+        try:
+            import pythoncom
+        except ImportError:
+            pythoncom = None
+        if pythoncom is not None:
+            pythoncom.CoInitialize()
+        try:
+            try:
+                processor = self.processor_factory()
+                if hasattr(processor, "__enter__"):
+                    processor.__enter__()
+            except BaseException as e:
+                self._loop.call_soon_threadsafe(_resolve, ready, None, e)
+                return
+            self._loop.call_soon_threadsafe(_resolve, ready, None, None)
+            try:
+                self._work(processor)
+            finally:
+                if hasattr(processor, "__exit__"):
+                    processor.__exit__(None, None, None)
+        finally:
+            if pythoncom is not None:
+                pythoncom.CoUninitialize()
+
+    def _work(self, processor) -> None:
+        while True:
+            job = self._queue.get()
+            if job.future is None:
+                return
+            if job.cancelled:
+                continue
+            timing = job.timing
+            timing.started = time.perf_counter()
+            result = error = None
+            try:
+                result = processor.process_request(job.request)
+                timing.response_bytes = len(result)
+            except Exception as e:
+                error = timing.error = e
+            timing.finished = time.perf_counter()
+            self._loop.call_soon_threadsafe(_resolve, job.future, result, error)
+            for hook in self.timing_hooks:
+                self._loop.call_soon_threadsafe(hook, timing)
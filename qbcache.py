@@ -0,0 +1,299 @@
+import collections
+import re
+import threading
+import time
+from xml.etree import ElementTree
+
+from qbdesktop import (BulkWriter, DEFAULT_BATCH_SIZE, DEFAULT_PAGE_SIZE, MessageAggregate,
+                       PagedQuery, QBXMLDocument, build_nodes, escape_attr)
+from qbparser import ResponseStream
+from qbresilience import response_statuses
+from qbtransport import id_field, parse_time
+
+
+#================================================================
+#CONST
+#================================================================
+DEFAULT_CACHE_SIZE = 256
+DEFAULT_TTL = 300.0
+NON_CACHEABLE_ATTRIBUTES = frozenset(("requestID",))
+# envelope elements whose children are messages: their order is significant
+ORDERED_ELEMENTS = frozenset(("QBXML", "QBXMLMsgsRq"))
+BALANCE_ENTITIES = ("Customer", "Vendor", "Account")
+# ListDelType values of the lists ItemQueryRq answers for
+ITEM_DEL_TYPES = ("ItemDiscount", "ItemFixedAsset", "ItemGroup", "ItemInventory", "ItemInventoryAssembly",
+                  "ItemNonInventory", "ItemOtherCharge", "ItemPayment", "ItemSalesTax", "ItemSalesTaxGroup",
+                  "ItemService", "ItemSubtotal")
+_VERSION = re.compile(r'<\?qbxml\s+version="([^"]*)"')
+_TIME_MODIFIED = re.compile(r"<TimeModified>([^<]+)</TimeModified>")
+_RESPONSE_MESSAGE = re.compile(r"<(\w+Rs)(\s[^>]*statusCode=[^>]*)>")
+_REQUEST_ID = re.compile(r'\s+requestID="[^"]*"')
+
+
+#================================================================
+# FUNCTIONS
+#================================================================
+
+def _canonical(element) -> str:
+    attributes = sorted((key, value) for key, value in element.attrib.items()
+                        if key not in NON_CACHEABLE_ATTRIBUTES)
+    text = (element.text or "").strip()
+    children = [_canonical(child) for child in element]
+    if element.tag not in ORDERED_ELEMENTS:
+        children.sort()
+    return f"<{element.tag}{attributes}{text}{''.join(children)}>"
+
+
+def normalize_request(request: str) -> str:
+    """cache key of a qbXML request. The order of the messages is kept, the
+    order of the fields inside a message, whitespace and requestID
+    attributes are ignored; the qbXML version is kept. Responses served for
+    a key need their requestIDs set with rewrite_request_ids()."""
+    version = _VERSION.search(request)
+    root = ElementTree.fromstring(request)
+    return (version.group(1) if version else "") + _canonical(root)
+
+
+def request_ids(request: str) -> list:
+    """requestID of every message of a request, None where it has none."""
+    messages = ElementTree.fromstring(request).find("QBXMLMsgsRq")
+    return [message.get("requestID") for message in messages] if messages is not None else []
+
+
+def rewrite_request_ids(response: str, ids: list) -> str:
+    """give the n-th message of a response the requestID of the n-th request
+    message, so a response recorded for another request matches this one."""
+    ids = iter(ids)
+
+    def replace(match) -> str:
+        request_id = next(ids, None)
+        attributes = _REQUEST_ID.sub("", match.group(2))
+        if request_id is None:
+            return f"<{match.group(1)}{attributes}>"
+        return f'<{match.group(1)} requestID="{escape_attr(request_id)}"{attributes}>'
+    return _RESPONSE_MESSAGE.sub(replace, response)
+
+
+def cache_group(entity: str) -> str:
+    """ItemService, ItemInventory and friends are all answered by ItemQueryRq too."""
+    return "Item" if entity.startswith("Item") else entity
+
+
+#================================================================
+# CLASSES
+#================================================================
+
+class _CacheEntry:
+    __slots__ = ("key", "response", "request_ids", "groups", "entity", "expires", "mark")
+
+    def __init__(self, key: str, response: str, request_ids: list, groups: frozenset, entity: str, expires: float,
+                 mark: str) -> None:
+        self.key = key
+        self.response = response
+        self.request_ids = request_ids
+        self.groups = groups
+        self.entity = entity
+        self.expires = expires
+        self.mark = mark
+
+
+class CachingProcessor:
+    def __init__(self, processor, max_entries: int=DEFAULT_CACHE_SIZE, ttl: dict=None,
+                 default_ttl: float=DEFAULT_TTL, revalidate: bool=False) -> None:
+        """opt-in read-through cache in front of process_request().
+
+        Only requests made entirely of list Query messages (CustomerQueryRq,
+        ItemQueryRq, AccountQueryRq, ...) without iterators are cached. Entries
+        are evicted least recently used first once max_entries is reached and
+        expire after the TTL of their entity. Responses with an Error status,
+        e.g. a record in use by another user, are passed on but not cached. A successful Add, Mod or Del of an
+        entity type drops every cached response of that type; transaction
+        changes also drop customers, vendors and accounts, whose balances move.
+
+        With revalidate, an expired single-entity response is kept when a
+        cheap query for records modified or deleted since its newest
+        TimeModified comes back empty.
+
+        Args:
+            processor: anything with process_request(xml), e.g. a RequestProcessor
+            max_entries (int): cached responses kept
+            ttl (dict): seconds per entity, e.g. {"Customer": 60, "Account": 3600}
+            default_ttl (float): seconds for entities missing from ttl
+            revalidate (bool): revalidate expired entries by TimeModified
+        """
+        self.processor = processor
+        self.max_entries = max_entries
+        self.ttl = ttl or {}
+        self.default_ttl = default_ttl
+        self.revalidate = revalidate
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.invalidations = 0
+        self.evictions = 0
+        self._entries: collections.OrderedDict[str, _CacheEntry] = collections.OrderedDict()
+        self._groups: dict[str, set] = collections.defaultdict(set)
+        self._lock = threading.Lock()
+
+    @property
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "revalidations": self.revalidations,
+                "invalidations": self.invalidations, "evictions": self.evictions,
+                "entries": len(self._entries)}
+
+    def process_request(self, request: str) -> str:
+        root = ElementTree.fromstring(request)
+        messages = root.find("QBXMLMsgsRq")
+        messages = list(messages) if messages is not None else []
+        entities = self._cacheable(messages)
+        if entities is None:
+            response = self.processor.process_request(request)
+            self._invalidate_for(messages, response)
+            return response
+
+        key = normalize_request(request)
+        ids = [message.get("requestID") for message in messages]
+        entry = self._lookup(key)
+        if entry is not None:
+            if entry.request_ids == ids:
+                return entry.response
+            return rewrite_request_ids(entry.response, ids)
+        response = self.processor.process_request(request)
+        self._store(key, response, ids, entities)
+        return response
+
+    def paged_query(self, request_name: str, filters: dict=None, page_size: int=DEFAULT_PAGE_SIZE, **options):
+        return PagedQuery(request_name, filters, page_size, **options).records_from(self)
+
+    def bulk_write(self, payloads, batch_size: int=DEFAULT_BATCH_SIZE, **options):
+        return BulkWriter(self, batch_size, **options).write(payloads)
+
+    def invalidate(self, entity: str=None) -> None:
+        """drop cached responses of one entity type, or everything."""
+        with self._lock:
+            if entity is None:
+                dropped = len(self._entries)
+                self._entries.clear()
+                self._groups.clear()
+            else:
+                keys = self._groups.pop(cache_group(entity), set())
+                dropped = len(keys)
+                for key in keys:
+                    self._drop(key)
+            self.invalidations += dropped
+
+    def _cacheable(self, messages: list):
+        if not messages:
+            return None
+        entities = []
+        for message in messages:
+            tag = message.tag
+            if not tag.endswith("QueryRq") or message.get("iterator"):
+                return None
+            entity = tag[:-7]
+            if entity != "Item" and id_field(entity) != "ListID":
+                return None
+            entities.append(entity)
+        return entities
+
+    def _lookup(self, key: str) -> _CacheEntry:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.expires > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+        if self.revalidate and entry.mark and self._still_fresh(entry):
+            with self._lock:
+                entry.expires = time.monotonic() + self._ttl((entry.entity,))
+                self.revalidations += 1
+                self.hits += 1
+            return entry
+        with self._lock:
+            self._drop(key)
+            self.misses += 1
+        return None
+
+    def _still_fresh(self, entry: _CacheEntry) -> bool:
+        entity = entry.entity
+        messages = [MessageAggregate(f"{entity}QueryRq", build_nodes({
+            "ActiveStatus": "All",
+            "FromModifiedDate": entry.mark,
+            "IncludeRetElement": ["ListID", "TimeModified"],
+        })), MessageAggregate("ListDeletedQueryRq", build_nodes({
+            "ListDelType": list(ITEM_DEL_TYPES) if entity == "Item" else entity,
+            "DeletedDateRangeFilter": {"FromDeletedDate": entry.mark},
+        }))]
+        request = QBXMLDocument(messages, on_error="continueOnError").read()
+        try:
+            stream = ResponseStream(self.processor.process_request(request))
+            mark = parse_time(entry.mark)
+            for record in stream:
+                if record.tag == "ListDeletedRet":
+                    return False
+                if parse_time(record.fields.get("TimeModified", entry.mark)) > mark:
+                    return False
+        except Exception:
+            return False
+        return all(status.ok for status in stream.statuses)
+
+    def _ttl(self, entities) -> float:
+        return min(self.ttl.get(entity, self.default_ttl) for entity in entities)
+
+    def _store(self, key: str, response: str, ids: list, entities: list) -> None:
+        statuses = response_statuses(response)
+        if not statuses or any(attrib.get("statusSeverity") == "Error" for _, attrib in statuses):
+            return
+        mark = None
+        if len(entities) == 1:
+            stamps = _TIME_MODIFIED.findall(response)
+            if stamps:
+                mark = max(stamps, key=parse_time)
+        groups = frozenset(cache_group(entity) for entity in entities)
+        entry = _CacheEntry(key, response, ids, groups, entities[0], time.monotonic() + self._ttl(entities), mark)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = entry
+            for group in groups:
+                self._groups[group].add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for group in entry.groups:
+            keys = self._groups.get(group)
+            if keys is not None:
+                keys.discard(key)
+
+    def _invalidate_for(self, messages: list, response: str) -> None:
+        changed = set()
+        for message in messages:
+            tag = message.tag
+            if tag.endswith("AddRq") or tag.endswith("ModRq"):
+                changed.add(tag[:-5])
+                if id_field(tag[:-5]) == "TxnID":
+                    changed.update(BALANCE_ENTITIES)
+            elif tag == "ListDelRq":
+                changed.add(message.findtext("ListDelType"))
+            elif not tag.endswith("QueryRq"):
+                changed.add(None)
+        if not changed:
+            return
+        stream = ResponseStream(response)
+        for _ in stream:
+            pass
+        if not any(status.ok and status.code == 0 for status in stream.statuses):
+            return
+        if None in changed:
+            self.invalidate()
+            return
+        for entity in changed:
+            self.invalidate(entity)
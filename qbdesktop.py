@@ -1,26 +1,39 @@
-import subprocess 
-try:
-    from win32com import client
-except Exception as e:
-    subprocess.run(["pip install pywin32"])
-
-try:
-    import pandas as pd
-except Exception as e:
-    subprocess.run(["pip install pandas"])
-    
+import io
 import os
-from xml.etree.ElementTree import Element 
+import re
+import threading
+import time
 from dataclasses import dataclass
-from installer import precheck
-
-precheck()
+from qbmetrics import INSTRUMENTATION
+from qbparser import ResponseStream
+from qbresilience import BUSY_STATUS_CODES, QuickBooksError, retryable_failure
+from qbtransport import (ComTransport, REQUEST_PROCESSOR_DIALOG, WEB_CONNECTOR,
+                         FILE_MODE_SINGLE_USER, escape)
 
 #================================================================
 #CONST
 #================================================================
 DEFAULT_COMPANY_FILE = f"C:\\Users\\Public\\Documents\\Intuit\\QuickBooks\\Company Files"
 REQUESTS_PATH = os.path.join(os.getcwd(), "all_requests.xml")
+QBXML_VERSION = "13.0"
+DEFAULT_BUFFER_SIZE = 64 * 1024
+DEFAULT_PAGE_SIZE = 100
+MIN_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 5_000
+TARGET_PAGE_LATENCY = 2.0
+ALL_QUERY_REQUESTS = (
+    "AccountQueryRq", "ClassQueryRq", "CustomerQueryRq", "EmployeeQueryRq", "ItemQueryRq",
+    "VendorQueryRq", "InvoiceQueryRq", "SalesReceiptQueryRq", "ReceivePaymentQueryRq",
+    "EstimateQueryRq", "BillQueryRq", "CheckQueryRq", "JournalEntryQueryRq",
+)
+DEFAULT_BATCH_SIZE = 250
+DEFAULT_BATCH_BYTES = 4 * 1024 * 1024
+POLL_INITIAL = 0.01
+POLL_MAX = 0.5
+TAB = "\t"
+_ATTR_ENTITIES = {'"': "&quot;"}
+_START_TAG = re.compile(r"""<([\w.:-]+)((?:\s+[\w.:-]+\s*=\s*(?:"[^"]*"|'[^']*'))*)\s*(/?)>""")
+_REQUEST_ID = re.compile(r"""\s+requestID\s*=\s*(?:"[^"]*"|'[^']*')""")
 
 #================================================================
 # DATACLASSES
@@ -64,16 +77,96 @@ class QBAgingRequest:
     Job = "JobReportQueryRq"
     PayrollDetail = "PayrollDetailReportQueryRq"
     PayrollSummary = "PayrollSummaryReportQueryRq"
-    Time = "	TimeReportQueryRq"
+    Time = "TimeReportQueryRq"
     
 
 #================================================================
 # TYPES
 #================================================================
 
+def _format(value) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def escape_text(value) -> str:
+    """escape a value for use as element text."""
+    return escape(_format(value))
+
+
+def escape_attr(value) -> str:
+    """escape a value for use inside a double quoted attribute."""
+    return escape(_format(value), _ATTR_ENTITIES)
+
+
+class XMLWriter:
+    """buffered writer that encodes serialized qbXML into a bytearray.
+
+    When a sink is given (a binary file object or a socket) the buffer is
+    flushed to it every time it grows past buffer_size, so a document never
+    has to exist in memory as a whole.
+
+    Args:
+        sink (file | socket): optional destination, anything with write() or sendall()
+        encoding (str): output encoding
+        buffer_size (int): bytes kept in memory before flushing to the sink
+    """
+
+    def __init__(self, sink=None, encoding: str="utf-8", buffer_size: int=DEFAULT_BUFFER_SIZE) -> None:
+        self.sink = sink
+        self.encoding = encoding
+        self.buffer_size = buffer_size
+        self.buffer = bytearray()
+        self.bytes_written = 0
+        self._send = None
+        if sink is not None:
+            self._send = getattr(sink, "sendall", None) or sink.write
+
+    def write(self, text: str) -> None:
+        self.buffer += text.encode(self.encoding)
+        if self._send is not None and len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._send is not None and self.buffer:
+            self.bytes_written += len(self.buffer)
+            self._send(self.buffer)
+            self.buffer = bytearray()
+
+    def getvalue(self) -> bytes:
+        return bytes(self.buffer)
+
 
 class qbXML:
-    pass
+    """base class for every node of a qbXML request tree. Subclasses only
+    implement write(), which streams the node into anything with a write(str)
+    method in a single pass."""
+    indent = 0
+
+    def write(self, out, depth: int=None) -> None:
+        raise NotImplementedError
+
+    def read(self) -> str:
+        out = io.StringIO()
+        self.write(out)
+        return out.getvalue()
+
+    def to_bytes(self, encoding: str="utf-8") -> bytes:
+        writer = XMLWriter(encoding=encoding)
+        self.write(writer)
+        return writer.getvalue()
+
+    def dump(self, sink, encoding: str="utf-8", buffer_size: int=DEFAULT_BUFFER_SIZE) -> int:
+        """serialize straight into a binary file or socket.
+
+        Returns:
+            int: number of bytes written
+        """
+        writer = XMLWriter(sink, encoding, buffer_size)
+        self.write(writer)
+        writer.flush()
+        return writer.bytes_written
 
 
 class Param:
@@ -82,7 +175,7 @@ class Param:
         self.value = value
     
     def read(self): 
-        return f'{self.name}="{self.value}"'
+        return f'{self.name}="{escape_attr(self.value)}"'
         
 
 class Element(qbXML):
@@ -90,63 +183,133 @@ class Element(qbXML):
         self.name = name
         self.value = value
         self.indent = indent
-        self._indent = "\t"*indent
-        self.statement = f"{self._indent}<{self.name}{self.value}</{self.name}>"
-        super().__init__()
-        
-    def read(self) -> str:
-        return self.statement
+
+    @property
+    def statement(self) -> str:
+        return f"{TAB * self.indent}<{self.name}>{escape_text(self.value)}</{self.name}>"
+
+    def write(self, out, depth: int=None) -> None:
+        if depth is None:
+            depth = self.indent
+        out.write(f"{TAB * depth}<{self.name}>{escape_text(self.value)}</{self.name}>\n")
     
 
 class Aggregate(qbXML):
-    def __init__(self, name: str, elements: list[Element]=[], indent: int=2, params=[Param]) -> None:
-        super().__init__()
-        self.params: list[Param] = params 
+    def __init__(self, name: str, elements: list[qbXML]=None, indent: int=2, params: list[Param]=None) -> None:
+        self.params: list[Param] = list(params) if params else []
         self.name = name
-        self.elements = elements
+        self.elements: list[qbXML] = list(elements) if elements else []
         self.indent = indent
-        
-        self.opening = f"<{self.name}"
-        for param in self.params:
-            self.opening += " "
-            self.opening+=param.read()
-        self.opening+=" >"
-        self.closing = f"</{self.name}>"
-        self.objects = [self.opening, self.closing]
-
-    def add_element(self, element: Element) -> None:
+
+    @property
+    def opening(self) -> str:
+        params = "".join(" " + param.read() for param in self.params)
+        return f"<{self.name}{params}>"
+
+    @property
+    def closing(self) -> str:
+        return f"</{self.name}>"
+
+    def add_element(self, element: qbXML) -> None:
         self.elements.append(element)
-        
-    def read(self) -> str:
-        objs = self.objects
+
+    def write(self, out, depth: int=None) -> None:
+        if depth is None:
+            depth = self.indent
+        tabs = TAB * depth
+        out.write(f"{tabs}{self.opening}\n")
         for element in self.elements:
-            objs.insert(1, element.read())
-        return "\n".join(objs)
+            element.write(out, depth + 1)
+        out.write(f"{tabs}</{self.name}>\n")
         
         
-class MessageAggregate(qbXML):
-    def __init__(self, name: str, aggregates: list[Aggregate]=[], indent: int=1, params:list[Param] =[]) -> None:
-        super().__init__()
-        self.params: list[Param] = params 
-        self.name = name
-        self.aggregates = aggregates
-        self.indent = indent
-        self.opening = f"<{self.name}"
-        for param in self.params:
-            self.opening += " "
-            self.opening+=param.read()
-        self.opening+=" >"
-        self.closing = f"</{self.name}>"
-        self.objects = [self.opening, self.closing]
+class MessageAggregate(Aggregate):
+    def __init__(self, name: str, aggregates: list[qbXML]=None, indent: int=1, params: list[Param]=None) -> None:
+        super().__init__(name, aggregates, indent, params)
+
+    @property
+    def aggregates(self) -> list[qbXML]:
+        return self.elements
     
-    def add_aggregate(self, aggregate: Aggregate) -> None:
-        self.aggregates.append(aggregate)
-        
+    def add_aggregate(self, aggregate: qbXML) -> None:
+        self.elements.append(aggregate)
+
+
+class RawXML(qbXML):
+    def __init__(self, text: str) -> None:
+        """already serialized qbXML that is written as is."""
+        self.text = text
+
+    def write(self, out, depth: int=None) -> None:
+        out.write(self.text)
+
+
+class QBXMLDocument(qbXML):
+    def __init__(self, messages: list[qbXML]=None, version: str=QBXML_VERSION, on_error: str="stopOnError") -> None:
+        """a complete qbXML request: xml and qbxml prologs, the QBXML root and
+        one QBXMLMsgsRq holding the request messages.
+
+        Args:
+            messages (list[qbXML]): request messages, e.g. CustomerQueryRq aggregates
+            version (str): qbXML spec version written to the <?qbxml?> prolog
+            on_error (str): stopOnError, continueOnError or rollbackOnError
+        """
+        self.messages: list[qbXML] = list(messages) if messages else []
+        self.version = version
+        self.on_error = on_error
+
+    def add_message(self, message: qbXML) -> None:
+        self.messages.append(message)
+
+    def write_head(self, out) -> None:
+        out.write('<?xml version="1.0" encoding="utf-8"?>\n')
+        out.write(f'<?qbxml version="{escape_attr(self.version)}"?>\n')
+        out.write("<QBXML>\n")
+        out.write(f'{TAB}<QBXMLMsgsRq onError="{escape_attr(self.on_error)}">\n')
+
+    def write_tail(self, out) -> None:
+        out.write(f"{TAB}</QBXMLMsgsRq>\n")
+        out.write("</QBXML>\n")
+
+    def write(self, out, depth: int=None) -> None:
+        self.write_head(out)
+        for message in self.messages:
+            message.write(out, 2)
+        self.write_tail(out)
+
     def read(self) -> str:
-        objs = self.objects
-        for agg in self.aggregates:
-            objs.insert(1, agg.read())
-        return "\n".join(objs)
+        if not INSTRUMENTATION.enabled:
+            return super().read()
+        start = time.perf_counter()
+        text = super().read()
+        INSTRUMENTATION.built(time.perf_counter() - start)
+        return text
+
+
+def build_nodes(fields: dict) -> list[qbXML]:
+    """turn a dict into request nodes. Nested dicts become aggregates, lists
+    repeat the element and None values are skipped. Order is preserved, which
+    matters because qbXML validates element order.
+
+    Args:
+        fields (dict): e.g. {"ActiveStatus": "All", "NameFilter": {"MatchCriterion": "StartsWith", "Name": "A"}}
+
+    Returns:
+        list[qbXML]: the matching Element/Aggregate nodes
+    """
+    nodes = []
+    for name, value in fields.items():
+        values = value if isinstance(value, (list, tuple)) else (value,)
+        for item in values:
+            if item is None:
+                continue
+            if isinstance(item, qbXML):
+                nodes.append(item)
+            elif isinstance(item, dict):
+                nodes.append(Aggregate(name, build_nodes(item)))
+            else:
+                nodes.append(Element(name, item))
+    return nodes
 
 
 #================================================================
@@ -155,28 +318,435 @@ class MessageAggregate(qbXML):
 
 class QuickBooksResponse:
     def __init__(self, request: str=None, response: str=None) -> None:
+        """wraps a qbXML response. Records are parsed straight from the 
+        response string as they are iterated, nothing is written to disk.
+
+        Args:
+            request (str): the qbXML request that was sent
+            response (str | bytes): the qbXML response returned by QuickBooks
+        """
         self.request = request
         self.response = response
-        self._path = os.path.join(os.getcwd(), "temp1.xml")
-        with open(self._path, 'r') as xml:
-            xml.write(self.response)
-        self.dataframe = pd.read_xml(self._path)
-        os.remove(self._path)
+        self.stream = ResponseStream(self.response)
+        self._dataframe = None
+
+    def __iter__(self):
+        return self.records()
+
+    def records(self):
+        """yield one QBRecord per *Ret element or report row."""
+        return self.stream.records()
+
+    @property
+    def statuses(self):
+        """status of every *Rs element seen so far while iterating records."""
+        return self.stream.statuses
+
+    @property
+    def dataframe(self):
+        if self._dataframe is None:
+            self._dataframe = self.stream.to_dataframe()
+        return self._dataframe
     
-    def save_as_excel(self, filepath: str):
-        pass
-        
+    def typed_records(self):
+        """like records() but with the qbrecords classes for known entities."""
+        from qbrecords import make_record
+
+        return ResponseStream(self.response, factory=make_record).records()
+
+    def export(self, *sinks, tag: str=None):
+        """write the records to one or more files in a single pass, see qbexport.export().
+
+        Args:
+            *sinks: paths (.csv, .parquet, .xlsx) or qbexport sinks
+            tag (str): record element to export, defaults to the first one, all rows for reports
+
+        Returns:
+            qbexport.ExportResult: record count and records per second
+        """
+        from qbexport import export
+
+        return export(self.typed_records(), sinks, tag)
+
+    def save_as_excel(self, filepath: str, tag: str=None):
+        from qbexport import ExcelSink
+
+        return self.export(ExcelSink(filepath), tag=tag)
+
+    def save_as_csv(self, filepath: str, tag: str=None):
+        from qbexport import CSVSink
+
+        return self.export(CSVSink(filepath), tag=tag)
+
+    def save_as_parquet(self, filepath: str, tag: str=None):
+        from qbexport import ParquetSink
+
+        return self.export(ParquetSink(filepath), tag=tag)
+
+
+
+class PagedQuery:
+    def __init__(self, request_name: str, filters: dict=None, page_size: int=DEFAULT_PAGE_SIZE,
+                 min_page_size: int=MIN_PAGE_SIZE, max_page_size: int=MAX_PAGE_SIZE,
+                 target_latency: float=TARGET_PAGE_LATENCY, version: str=QBXML_VERSION) -> None:
+        """iterator based paging for a Query request. The first page is sent with
+        iterator="Start", later pages with iterator="Continue" and the iteratorID
+        returned by QuickBooks until iteratorRemainingCount reaches zero.
+
+        MaxReturned is adjusted after every page so that a page takes roughly
+        target_latency seconds, never growing or shrinking more than 2x at once.
+
+        Args:
+            request_name (str): e.g. CustomerQueryRq or InvoiceQueryRq
+            filters (dict): extra query elements, see build_nodes()
+            page_size (int): MaxReturned for the first page
+            min_page_size (int): lower bound for the adaptive page size
+            max_page_size (int): upper bound for the adaptive page size
+            target_latency (float): wanted seconds per page, None keeps page_size fixed
+            version (str): qbXML version of the request
+        """
+        self.request_name = request_name
+        self.filters = filters or {}
+        self.page_size = page_size
+        self.min_page_size = min_page_size
+        self.max_page_size = max_page_size
+        self.target_latency = target_latency
+        self.version = version
+        self.iterator_id = None
+        self.remaining = None
+        self.pages = 0
+        self.done = False
+
+    def request(self) -> str:
+        """the qbXML request for the next page."""
+        if self.iterator_id is None:
+            params = [Param("requestID", self.pages + 1), Param("iterator", "Start")]
+        else:
+            params = [Param("requestID", self.pages + 1), Param("iterator", "Continue"),
+                      Param("iteratorID", self.iterator_id)]
+        message = MessageAggregate(self.request_name, [Element("MaxReturned", self.page_size)]
+                                   + build_nodes(self.filters), params=params)
+        return QBXMLDocument([message], self.version).read()
+
+    def feed(self, response: str, elapsed: float=None) -> list:
+        """parse one page of results and advance the iterator.
+
+        Args:
+            response (str): the qbXML response for the last request()
+            elapsed (float): seconds the page took, used to adapt the page size
+
+        Raises:
+            QuickBooksError: QuickBooks reported an error for the page
+
+        Returns:
+            list[QBRecord]: the records of the page
+        """
+        stream = ResponseStream(response)
+        records = list(stream)
+        if not stream.statuses:
+            raise QuickBooksError(f"no {self.request_name[:-2]}Rs in response")
+        status = stream.statuses[0]
+        if not status.ok:
+            raise QuickBooksError.from_status(status)
+        self.pages += 1
+        self.iterator_id = status.attrib.get("iteratorID")
+        self.remaining = int(status.attrib.get("iteratorRemainingCount", 0))
+        self.done = self.iterator_id is None or self.remaining == 0
+        if elapsed and records and self.target_latency:
+            self._adapt(len(records), elapsed)
+        return records
+
+    def _adapt(self, count: int, elapsed: float) -> None:
+        ideal = int(self.target_latency * count / elapsed)
+        ideal = max(self.page_size // 2, min(self.page_size * 2, ideal))
+        self.page_size = max(self.min_page_size, min(self.max_page_size, ideal))
+
+    def pages_from(self, processor):
+        """send the pages through anything with a process_request(xml) method
+        and yield the records of each page as a list."""
+        while not self.done:
+            request = self.request()
+            start = time.perf_counter()
+            response = processor.process_request(request)
+            yield self.feed(response, time.perf_counter() - start)
+
+    def records_from(self, processor):
+        for page in self.pages_from(processor):
+            yield from page
+
+
+class BulkResult:
+    """outcome of one payload sent through a BulkWriter.
+
+    Args:
+        index (int): position of the payload in the input stream
+        payload (qbXML | str): the request message that was sent
+        status (QBStatus): the matching *Rs status, None if QuickBooks never processed it
+        record (QBRecord): the returned *Ret record if there was one
+    """
+    __slots__ = ("index", "payload", "status", "record")
+
+    def __init__(self, index: int, payload, status=None, record=None) -> None:
+        self.index = index
+        self.payload = payload
+        self.status = status
+        self.record = record
+
+    @property
+    def request_id(self) -> str:
+        return str(self.index)
+
+    @property
+    def processed(self) -> bool:
+        return self.status is not None
+
+    @property
+    def ok(self) -> bool:
+        return self.status is not None and self.status.ok
+
+    @property
+    def message(self) -> str:
+        if self.status is None:
+            return "not processed"
+        return self.status.message
+
+    def __repr__(self) -> str:
+        return f"BulkResult({self.index}, ok={self.ok}, message={self.message!r})"
+
+
+def wait_until(done, timeout: float=None, initial: float=POLL_INITIAL, maximum: float=POLL_MAX) -> bool:
+    """poll done() with exponential backoff instead of spinning.
+
+    Args:
+        done (callable): returns True once the awaited thing happened
+        timeout (float): seconds to wait, None waits forever
+        initial (float): first sleep, doubled after every poll
+        maximum (float): longest sleep between polls
+
+    Returns:
+        bool: True if done() returned True, False on timeout
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    delay = initial
+    while not done():
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            delay = min(delay, remaining)
+        time.sleep(delay)
+        delay = min(delay * 2, maximum)
+    return True
+
+
+def _thread_reference(obj):
+    """a callable returning obj on another thread. COM objects are marshalled
+    across apartments with CoMarshalInterThreadInterfaceInStream, other
+    objects are passed through. Returns (callable, uses_com)."""
+    oleobj = getattr(obj, "_oleobj_", None)
+    if oleobj is None:
+        return (lambda: obj), False
+    import pythoncom
+    from win32com import client
+    stream = pythoncom.CoMarshalInterThreadInterfaceInStream(pythoncom.IID_IDispatch, oleobj)
+    return (lambda: client.Dispatch(pythoncom.CoGetInterfaceAndReleaseStream(stream, pythoncom.IID_IDispatch))), True
+
+
+def tag_request(payload, request_id) -> str:
+    """serialize a request message with its requestID attribute set.
+
+    Args:
+        payload (qbXML | str): e.g. a CustomerAddRq MessageAggregate or its XML text
+        request_id: value for the requestID attribute
+
+    Raises:
+        ValueError: a string payload does not start with an element
+
+    Returns:
+        str: the message XML, indented for a position inside QBXMLMsgsRq
+    """
+    if isinstance(payload, str):
+        text = payload.strip()
+        match = _START_TAG.match(text)
+        if match is None:
+            raise ValueError(f"request message does not start with an element: {text[:40]!r}")
+        attributes = _REQUEST_ID.sub("", match.group(2))
+        return (f'{TAB * 2}<{match.group(1)}{attributes} requestID="{escape_attr(request_id)}"{match.group(3)}>'
+                f'{text[match.end():]}\n')
+    params = [param for param in payload.params if param.name != "requestID"]
+    params.append(Param("requestID", request_id))
+    tagged = Aggregate(payload.name, payload.elements, params=params)
+    out = io.StringIO()
+    tagged.write(out, 2)
+    return out.getvalue()
+
+
+def pack_envelopes(payloads, batch_size: int=DEFAULT_BATCH_SIZE, max_bytes: int=DEFAULT_BATCH_BYTES,
+                   on_error: str="continueOnError", version: str=QBXML_VERSION, start: int=0):
+    """pack request messages into QBXMLMsgsRq envelopes.
+
+    An envelope is closed once it holds batch_size messages or adding the next
+    message would push it past max_bytes. A single message larger than
+    max_bytes is sent on its own. Every message gets its input position as
+    requestID so responses can be matched back to the inputs.
+
+    Args:
+        payloads (iterable): request messages, consumed lazily
+        batch_size (int): maximum messages per envelope
+        max_bytes (int): maximum utf-8 size of an envelope
+        on_error (str): continueOnError, stopOnError or rollbackOnError
+        version (str): qbXML version of the envelopes
+        start (int): requestID of the first payload
+
+    Yields:
+        tuple[str, list[tuple[int, object]]]: envelope XML and its (index, payload) pairs
+    """
+    document = QBXMLDocument(version=version, on_error=on_error)
+    head = io.StringIO()
+    document.write_head(head)
+    document.write_tail(head)
+    overhead = len(head.getvalue().encode("utf-8"))
+
+    items = []
+    parts = []
+    size = overhead
+    for index, payload in enumerate(payloads, start):
+        text = tag_request(payload, index)
+        length = len(text.encode("utf-8"))
+        if items and (len(items) >= batch_size or size + length > max_bytes):
+            document.messages = [RawXML(part) for part in parts]
+            yield document.read(), items
+            items, parts, size = [], [], overhead
+        items.append((index, payload))
+        parts.append(text)
+        size += length
+    if items:
+        document.messages = [RawXML(part) for part in parts]
+        yield document.read(), items
+
+
+class BulkWriter:
+    def __init__(self, processor, batch_size: int=DEFAULT_BATCH_SIZE, max_bytes: int=DEFAULT_BATCH_BYTES,
+                 on_error: str="continueOnError", version: str=QBXML_VERSION) -> None:
+        """sends Add/Mod messages in batched envelopes instead of one round-trip each.
+
+        When the processor has a resilience policy, messages that failed with
+        a busy statusCode, and those skipped after them, are sent again in a
+        smaller envelope with the policy's backoff. Messages that succeeded
+        are never resent. An envelope the policy gave up on as busy yields
+        failed results rather than raising, since none of it was applied.
+
+        Args:
+            processor: anything with a process_request(xml) method, e.g. RequestProcessor
+            batch_size (int): maximum messages per envelope
+            max_bytes (int): maximum utf-8 size of an envelope
+            on_error (str): continueOnError or stopOnError. With stopOnError nothing
+                is sent after the first failed message.
+            version (str): qbXML version of the envelopes
+        """
+        self.processor = processor
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.on_error = on_error
+        self.version = version
+        self.envelopes = 0
+
+    def write(self, payloads):
+        """send the payloads and yield a BulkResult per payload, in input order.
+
+        Args:
+            payloads (iterable): request messages such as CustomerAddRq aggregates
+
+        Yields:
+            BulkResult: per item success or failure
+        """
+        resilience = getattr(self.processor, "resilience", None)
+        envelopes = pack_envelopes(payloads, self.batch_size, self.max_bytes, self.on_error, self.version)
+        for request, items in envelopes:
+            response, results = self._send(request, items)
+            attempt = 0
+            while resilience is not None and attempt < resilience.retries and retryable_failure(response) is None:
+                busy = self._busy(results)
+                if not busy:
+                    break
+                attempt += 1
+                time.sleep(resilience.delay(attempt))
+                request = QBXMLDocument([RawXML(tag_request(results[i].payload, results[i].index)) for i in busy],
+                                        self.version, self.on_error).read()
+                response, resent = self._send(request, [(results[i].index, results[i].payload) for i in busy])
+                for i, result in zip(busy, resent):
+                    results[i] = result
+            failed = False
+            for result in results:
+                failed = failed or not result.ok
+                yield result
+            if failed and self.on_error == "stopOnError":
+                return
+
+    def _send(self, request: str, items: list) -> tuple:
+        try:
+            response = self.processor.process_request(request)
+        except QuickBooksError as e:
+            # still busy after the policy's retries; the statuses are in the response
+            if e.response is None:
+                raise
+            response = e.response
+        self.envelopes += 1
+        stream = ResponseStream(response)
+        records = {}
+        for record in stream:
+            if record.status is not None:
+                records.setdefault(record.status.request_id, record)
+        statuses = {status.request_id: status for status in stream.statuses}
+        return response, [BulkResult(index, payload, statuses.get(str(index)), records.get(str(index)))
+                          for index, payload in items]
+
+    def _busy(self, results: list) -> list:
+        """positions worth resending: busy failures and, under stopOnError, the
+        messages skipped after one. Nothing is resent past another failure."""
+        busy = []
+        for i, result in enumerate(results):
+            status = result.status
+            if status is None:
+                if busy:
+                    busy.append(i)
+            elif not status.ok:
+                if status.code in BUSY_STATUS_CODES:
+                    busy.append(i)
+                elif self.on_error == "stopOnError":
+                    return []
+        return busy
 
 
 class RequestProcessor:
-    def __init__(self, app_name: str) -> None:
+    def __init__(self, app_name: str, transport=None, company_file: str="", mode: int=FILE_MODE_SINGLE_USER,
+                 recorder=None, resilience=None) -> None:
+        """qbXML request processor.
+
+        Args:
+            app_name (str): name shown to the QuickBooks user
+            transport (Transport): defaults to the QBXMLRP2 COM transport
+            company_file (str): company file to open, "" for the one open in QuickBooks
+            mode (int): QBFileMode passed to BeginSession
+            recorder: opt-in, gets record(request, response, elapsed, started)
+                for every round trip, e.g. a qbjournal.Journal
+            resilience (Resilience): opt-in retry, throttling and circuit
+                breaking, see qbresilience; share one between sessions
+
+        Raises:
+            QuickBooksError: the COM request processor could not be created
+        """
         try:
-            self.qbxmlrp = client.Dispatch("QBXMLRP2.RequestProcessor")
+            self.transport = transport or ComTransport()
         except Exception as e:
-            print(e)
-            exit()
+            raise QuickBooksError.from_exception(e, "cannot create the QuickBooks request processor") from e
         self.app_name = app_name
+        self.company_file = company_file
+        self.mode = mode
+        self.recorder = recorder
+        self.resilience = resilience
         self.ticket = None
+        self.requests = 0
 
     def __enter__(self):
         self.open_connection()
@@ -188,56 +758,114 @@ class RequestProcessor:
         self.close_connection()
 
     def open_connection(self):
-        self.qbxmlrp.OpenConnection("", self.app_name)
+        self.transport.open_connection("", self.app_name)
 
     def close_connection(self):
-        self.qbxmlrp.CloseConnection()
+        self.transport.close_connection()
 
     def begin_session(self):
-        self.ticket = self.qbxmlrp.BeginSession("", 0)
+        self.ticket = self.transport.begin_session(self.company_file, self.mode)
+        self.requests = 0
 
     def end_session(self):
-        self.qbxmlrp.EndSession(self.ticket)
+        self.transport.end_session(self.ticket)
         self.ticket = None
 
     def process_request(self, request):
-        return self.qbxmlrp.ProcessRequest(self.ticket, request)
+        if self.resilience is not None:
+            return self.resilience.call(self._round_trip, request, self.company_file)
+        return self._round_trip(request)
+
+    def _round_trip(self, request):
+        self.requests += 1
+        if self.recorder is None and not INSTRUMENTATION.enabled:
+            return self.transport.process_request(self.ticket, request)
+        started = time.time()
+        start = time.perf_counter()
+        if INSTRUMENTATION.enabled:
+            response = INSTRUMENTATION.round_trip("RequestProcessor", self._send, request, self.requests > 1)
+        else:
+            response = self._send(request)
+        if self.recorder is not None:
+            self.recorder.record(request, response, time.perf_counter() - start, started)
+        return response
+
+    def _send(self, request):
+        return self.transport.process_request(self.ticket, request)
+
+    def paged_query(self, request_name: str, filters: dict=None, page_size: int=DEFAULT_PAGE_SIZE, **options):
+        """run a Query request page by page using QuickBooks iterators.
+
+        Args:
+            request_name (str): e.g. CustomerQueryRq, ItemQueryRq or TransactionQueryRq
+            filters (dict): extra query elements, see build_nodes()
+            page_size (int): MaxReturned for the first page
+            **options: passed on to PagedQuery
+
+        Returns:
+            generator: QBRecord objects, the next page is requested once the
+            current one has been consumed
+        """
+        return PagedQuery(request_name, filters, page_size, **options).records_from(self)
+
+    def bulk_write(self, payloads, batch_size: int=DEFAULT_BATCH_SIZE, **options):
+        """send Add/Mod messages in batched envelopes, see BulkWriter.
+
+        Returns:
+            generator: one BulkResult per payload
+        """
+        return BulkWriter(self, batch_size, **options).write(payloads)
     
     
 
 class SessionManager:
-    def __init__(self, app_id, app_name, company_file_path):
-        self.qb_session_manager = client.Dispatch("QBFC13.QBSessionManager")
+    def __init__(self, app_id, app_name, company_file_path, transport=None, mode: int=FILE_MODE_SINGLE_USER,
+                 resilience=None):
+        self.transport = transport or ComTransport()
         self.app_id = app_id
         self.app_name = app_name
         self.company_file_path = company_file_path
-        self.qb_session = None
+        self.mode = mode
+        self.resilience = resilience
+        self.ticket = None
+        self.requests = 0
 
     def __enter__(self):
-        self.begin_session()
+        self.begin()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.end_session()
+        self.end()
 
     def begin(self):
         """used to manage the session with QuickBooks.
         """
-        self.qb_session_manager.OpenConnection('', self.app_name)
-        self.qb_session_manager.BeginSession(self.company_file_path, self.app_id)
-
-        self.qb_session = self.qb_session_manager.Session
-        self.qb_session.OpenEntity('Customer', '')
+        self.transport.open_connection(self.app_id, self.app_name)
+        self.ticket = self.transport.begin_session(self.company_file_path, self.mode)
+        self.requests = 0
 
     def end(self):
         """used to manage the session with QuickBooks.
         """
-        if self.qb_session:
-            self.qb_session.Close()
-            self.qb_session = None
+        if self.ticket:
+            self.transport.end_session(self.ticket)
+            self.ticket = None
+
+        self.transport.close_connection()
 
-        self.qb_session_manager.EndSession()
-        self.qb_session_manager.CloseConnection()
+    def process_request(self, request):
+        if self.resilience is not None:
+            return self.resilience.call(self._round_trip, request, self.company_file_path)
+        return self._round_trip(request)
+
+    def _round_trip(self, request):
+        self.requests += 1
+        if not INSTRUMENTATION.enabled:
+            return self.transport.process_request(self.ticket, request)
+        return INSTRUMENTATION.round_trip("SessionManager", self._send, request, self.requests > 1)
+
+    def _send(self, request):
+        return self.transport.process_request(self.ticket, request)
 
     def create_customer(self, customer_data):
         """create a new customer in QuickBooks. 
@@ -246,44 +874,47 @@ class SessionManager:
         and returns the customer details.
 
         Args:
-            customer_data (_type_): _description_
+            customer_data (str | dict): the CustomerAdd aggregate as XML, or its fields
 
         Raises:
-            Exception: _description_
+            QuickBooksError: QuickBooks rejected the request
 
         Returns:
-            _type_: _description_
+            QBRecord: the CustomerRet of the new customer
         """
-        customer_add_rq = self.qb_session.CreateMsgSetRequest('US', '2.0').AppendCustomerAddRq()
-        customer_add_rq.CustomerAdd.FromXmlString(customer_data)
-        response = self.qb_sessionManager.DoRequests(customer_add_rq).ResponseList.GetAt(0)
-
-        if response.StatusCode != 0:
-            raise Exception(response.StatusMessage)
-
-        return response.Detail
+        if isinstance(customer_data, dict):
+            body = Aggregate("CustomerAdd", build_nodes(customer_data))
+        else:
+            body = RawXML(customer_data)
+        request = QBXMLDocument([MessageAggregate("CustomerAddRq", [body])]).read()
+        response = ResponseStream(self.process_request(request))
+        records = list(response)
+        if not response.statuses:
+            raise QuickBooksError("no CustomerAddRs in response")
+        status = response.statuses[0]
+
+        if status.code != 0:
+            raise QuickBooksError.from_status(status)
+        if not records:
+            raise QuickBooksError("CustomerAddRs without a CustomerRet", code=status.code, status=status)
+
+        return records[0]
 
     def query_customers(self):
         """ query customers in QuickBooks. 
         It sends a customer query request to QuickBooks and returns the customer details
 
         Raises:
-            Exception: _description_
+            QuickBooksError: QuickBooks rejected the request
 
         Returns:
-            _type_: _description_
+            list[QBRecord]: one CustomerRet per customer
         """
-        customer_query_rq = self.qb_session.CreateMsgSetRequest('US', '2.0').AppendCustomerQueryRq()
-        response = self.qb_sessionManager.DoRequests(customer_query_rq).ResponseList.GetAt(0)
-
-        if response.StatusCode != 0:
-            raise Exception(response.StatusMessage)
-
-        return response.Detail
+        return list(PagedQuery("CustomerQueryRq").records_from(self))
     
 
 class RequestProcessorDialog:
-    def __init__(self, app_id, app_name, company_file_path):
+    def __init__(self, app_id, app_name, company_file_path, transport=None):
         """ simple interface for showing the QuickBooks request processor 
         dialog and retrieving the response using the QBXMLRP2UI.RequestProcessorDialog
         COM object. The constructor takes the QuickBooks Application ID, Application Name, 
@@ -293,8 +924,10 @@ class RequestProcessorDialog:
             app_id (_type_): _description_
             app_name (_type_): _description_
             company_file_path (_type_): _description_
+            transport (Transport): creates the dialog object, defaults to COM
         """
-        self.qb_request_processor = client.Dispatch("QBXMLRP2UI.RequestProcessorDialog")
+        self.transport = transport or ComTransport(None)
+        self.qb_request_processor = self.transport.dispatch(REQUEST_PROCESSOR_DIALOG)
         self.app_id = app_id
         self.app_name = app_name
         self.company_file_path = company_file_path
@@ -325,21 +958,88 @@ class RequestProcessorDialog:
         """
         return self.qb_request_processor.Response
 
+    def wait(self, timeout: float=None) -> str:
+        """block until the dialog is done and return its response. IsDone is
+        polled with exponential backoff (POLL_INITIAL up to POLL_MAX seconds).
+
+        Raises:
+            TimeoutError: the dialog is still open after timeout seconds
+        """
+        if not wait_until(self.is_done, timeout):
+            raise TimeoutError(f"request processor dialog not done after {timeout}s")
+        return self.get_response()
+
+    def submit(self, xml_request, callback=None, timeout: float=None):
+        """show the dialog and return a concurrent.futures.Future for its response.
+
+        A background thread polls the dialog with backoff and resolves the
+        future, so the caller can block on result(), add callbacks or await
+        it through request().
+
+        Args:
+            xml_request (str): qbXML request
+            callback (callable): called with the future once it is resolved
+            timeout (float): seconds before the future fails with TimeoutError
+
+        Returns:
+            concurrent.futures.Future: resolves to the response string
+        """
+        from concurrent.futures import Future
+
+        self.show(xml_request)
+        future = Future()
+        if callback is not None:
+            future.add_done_callback(callback)
+        reference, uses_com = _thread_reference(self.qb_request_processor)
+        threading.Thread(target=self._poll, args=(future, reference, uses_com, timeout),
+                         name="qbxml-dialog", daemon=True).start()
+        return future
+
+    async def request(self, xml_request, timeout: float=None) -> str:
+        """awaitable form of submit(): show the dialog and wait for the response
+        without blocking the event loop."""
+        import asyncio
+
+        return await asyncio.wrap_future(self.submit(xml_request, timeout=timeout))
+
+    @staticmethod
+    def _poll(future, reference, uses_com: bool, timeout: float) -> None:
+        if not future.set_running_or_notify_cancel():
+            return
+        pythoncom = None
+        if uses_com:
+            import pythoncom
+            pythoncom.CoInitialize()
+        try:
+            dialog = reference()
+            if wait_until(dialog.IsDone, timeout):
+                future.set_result(dialog.Response)
+            else:
+                future.set_exception(TimeoutError(f"request processor dialog not done after {timeout}s"))
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            if pythoncom is not None:
+                pythoncom.CoUninitialize()
+
     def close(self):
         self.qb_request_processor.EndSession()
 
 
 class WebConnector:
-    def __init__(self, url):
+    def __init__(self, url, transport=None):
         """simple interface for interacting with the QuickBooks Web Connector 
         using the QBWebConnector.QBWebConnectorSvc COM object. 
         The constructor takes the URL of the QBWC web service as an argument.
 
         Args:
             url (_type_): _description_
+            transport (Transport): creates the connector object, defaults to COM
         """
-        self.qb_web_connector = client.Dispatch("QBWebConnector.QBWebConnectorSvc")
+        self.transport = transport or ComTransport(None)
+        self.qb_web_connector = self.transport.dispatch(WEB_CONNECTOR)
         self.url = url
+        self._last_ticket = None
 
     def get_version(self):
         """ used to retrieve the version
@@ -385,7 +1085,12 @@ class WebConnector:
         Returns:
             _type_: _description_
         """
-        return self.qb_web_connector.processRequest(ticket, str_request, self.url)
+        if not INSTRUMENTATION.enabled:
+            return self.qb_web_connector.processRequest(ticket, str_request, self.url)
+        reused = ticket == self._last_ticket
+        self._last_ticket = ticket
+        return INSTRUMENTATION.round_trip("WebConnector", lambda request: self.qb_web_connector.processRequest(
+            ticket, request, self.url), str_request, reused)
 
     def receive_response(self, ticket, response, hresult, message):
         """ receive a response from QuickBooks using the specified ticket number, 
@@ -423,27 +1128,35 @@ class WebConnector:
 
 class RequestAllData:
     
-    def __init__(self, company_file_path, qb_file_mode):
+    def __init__(self, company_file_path, qb_file_mode, transport=None, requests=ALL_QUERY_REQUESTS):
         """sends a request for all data in the QuickBooks 
         company file specified by company_file_path and 
-        returns the response as a QBXMLRP2.ResponseReader object
+        returns the response as a QuickBooksResponse object
 
         Args:
-            company_file_path (_type_): _description_
-            qb_file_mode (_type_): _description_
+            company_file_path (str): company file to open
+            qb_file_mode (int): QBFileMode passed to BeginSession
+            transport (Transport): defaults to the QBXMLRP2 COM transport
+            requests (tuple[str]): query requests sent by send_request()
         """
-        self.qbxmlrp = client.Dispatch("QBXMLRP2.RequestProcessor")
-        self.qbxmlrp.OpenConnection('', 'Python QuickBooks Connector')
-        self.qbxmlrp.BeginSession(company_file_path, qb_file_mode)
+        self.transport = transport or ComTransport()
+        self.requests = requests
+        self.transport.open_connection('', 'Python QuickBooks Connector')
+        self.ticket = self.transport.begin_session(company_file_path, qb_file_mode)
 
     def __del__(self):
-        self.qbxmlrp.EndSession()
-        self.qbxmlrp.CloseConnection()
+        self.close()
+
+    def close(self):
+        if getattr(self, "ticket", None):
+            self.transport.end_session(self.ticket)
+            self.transport.close_connection()
+            self.ticket = None
 
     def send_request(self):
-        request = self.qbxmlrp.CreateMsgSetRequest('US', '13.0')
-        request.AppendRequestForFullSync()
-        response_str = self.qbxmlrp.ProcessRequest(request.ToXMLString(), '')
-        response = client.Dispatch("QBXMLRP2.ResponseReader")
-        response.LoadString(response_str)
-        return response
\ No newline at end of file
+        document = QBXMLDocument(on_error="continueOnError")
+        for name in self.requests:
+            document.add_message(MessageAggregate(name))
+        request = document.read()
+        response = self.transport.process_request(self.ticket, request)
+        return QuickBooksResponse(request, response)
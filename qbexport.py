@@ -0,0 +1,424 @@
+import csv
+import datetime
+import json
+import operator
+import os
+import time
+from dataclasses import dataclass, field
+
+from qbparser import REPORT_ROWS, flatten
+from qbrecords import RECORD_TYPES, Ref, RetRecord
+
+
+#================================================================
+#CONST
+#================================================================
+DEFAULT_EXPORT_BATCH = 2_000
+DEFAULT_ROW_GROUP_SIZE = 100_000
+EXCEL_MAX_ROWS = 1_048_576
+DECIMAL_PRECISION = 38
+DECIMAL_SCALE = 10
+REPEATED = "json"
+EXTRA_COLUMN = "extra"
+REPORT_DATA = "ReportData"
+ROW_TYPE_COLUMN = "RowType"
+
+
+#================================================================
+# SCHEMA
+#================================================================
+
+def _json_default(value):
+    if isinstance(value, (RetRecord, Ref)):
+        return value.to_dict()
+    return str(value)
+
+
+def _to_json(value):
+    if value is None:
+        return None
+    return json.dumps([item.to_dict() if isinstance(item, RetRecord) else item for item in value],
+                      default=_json_default, separators=(",", ":"))
+
+
+def _extra_json(record):
+    if not record._extra:
+        return None
+    return json.dumps(record._extra, default=_json_default, separators=(",", ":"))
+
+
+def _path_getter(path: tuple, leaf=None):
+    if len(path) == 1 and leaf is None:
+        return operator.attrgetter(path[0])
+    first = operator.attrgetter(path[0])
+    rest = path[1:]
+
+    def get(record):
+        value = first(record)
+        for name in rest:
+            if value is None:
+                return None
+            value = getattr(value, name)
+        if value is None or leaf is None:
+            return value
+        return leaf(value)
+    return get
+
+
+def _spec_columns(spec: dict, prefix: tuple=()) -> list:
+    columns = []
+    for name, kind in spec.items():
+        path = prefix + (name,)
+        dotted = ".".join(path)
+        if kind == "ref":
+            columns.append((dotted + ".ListID", "str", _path_getter(path + ("ListID",))))
+            columns.append((dotted + ".FullName", "str", _path_getter(path + ("FullName",))))
+        elif isinstance(kind, list):
+            columns.append((dotted, REPEATED, _path_getter(path, _to_json)))
+        elif isinstance(kind, type):
+            columns.extend(_spec_columns(kind._spec, path))
+        else:
+            columns.append((dotted, kind, _path_getter(path)))
+    return columns
+
+
+class Schema:
+    """flat column layout of one record type, worked out once per export.
+
+    Typed records (see qbrecords) get one column per field of their spec:
+    refs become <Field>.ListID and <Field>.FullName, nested aggregates dotted
+    columns and repeated aggregates (e.g. InvoiceLineRet) a JSON column.
+    Children the spec does not know about go to a JSON "extra" column.
+    Other records get a text column per flattened field seen in a sample.
+    Report rows of every kind share one layout with a leading RowType column.
+    Fields missing from the sample, e.g. first set in a later batch, go to
+    the "extra" column of the flat layouts too.
+
+    Args:
+        tag (str): record element name, e.g. CustomerRet, or ReportData
+        columns (list[tuple]): (name, kind, getter); kind is a qbrecords
+            converter name or "json", getter maps a record to the cell value
+        flat (bool): columns are looked up in the flattened QBRecord fields
+        tags (frozenset): element names exported with this layout, tag alone
+            when omitted
+    """
+
+    def __init__(self, tag: str, columns: list, flat: bool=False, tags: frozenset=None) -> None:
+        self.tag = tag
+        self.tags = tags or frozenset((tag,))
+        self.columns = columns
+        self.names = [name for name, _, _ in columns]
+        self.kinds = [kind for _, kind, _ in columns]
+        self._getters = [getter for _, _, getter in columns]
+        self._flat = flat
+        self._known = frozenset(self.names) - {EXTRA_COLUMN}
+
+    @classmethod
+    def for_type(cls, record_type: type) -> "Schema":
+        return cls(record_type.tag, _spec_columns(record_type._spec) + [(EXTRA_COLUMN, REPEATED, _extra_json)])
+
+    @classmethod
+    def for_records(cls, records: list) -> "Schema":
+        names = {}
+        for record in records:
+            names.update(dict.fromkeys(flatten(record.fields)))
+        columns = [(name, "str", None) for name in names] + [(EXTRA_COLUMN, REPEATED, None)]
+        return cls(records[0].tag if records else "", columns, flat=True)
+
+    @classmethod
+    def for_report_rows(cls, records: list) -> "Schema":
+        names = {ROW_TYPE_COLUMN: None}
+        for record in records:
+            if record.tag in REPORT_ROWS:
+                names.update(dict.fromkeys(flatten(record.fields)))
+        columns = [(name, "str", None) for name in names] + [(EXTRA_COLUMN, REPEATED, None)]
+        return cls(REPORT_DATA, columns, flat=True, tags=REPORT_ROWS)
+
+    def row(self, record) -> list:
+        if self._flat:
+            fields = flatten(record.fields)
+            if self.tag == REPORT_DATA:
+                fields[ROW_TYPE_COLUMN] = record.tag
+            extra = {name: value for name, value in fields.items() if name not in self._known}
+            fields[EXTRA_COLUMN] = json.dumps(extra, default=str, separators=(",", ":")) if extra else None
+            return [_cell_text(fields.get(name)) for name in self.names]
+        return [get(record) for get in self._getters]
+
+    def __len__(self) -> int:
+        return len(self.columns)
+
+    def __repr__(self) -> str:
+        return f"Schema({self.tag!r}, {len(self.columns)} columns)"
+
+
+def _cell_text(value):
+    if isinstance(value, list):
+        return json.dumps(value, default=str, separators=(",", ":"))
+    return value
+
+
+def infer_schema(records: list, tag: str=None) -> Schema:
+    """schema of the first record type in records, or of tag when given.
+    Report rows are exported together whatever their kind, unless tag names
+    one of them (e.g. DataRow).
+
+    Args:
+        records (list): sample of records, typed or QBRecord
+        tag (str): element name of the records to export, or ReportData for
+            all report rows
+
+    Returns:
+        Schema: from the qbrecords spec when the type is known, from the
+            fields of the sample otherwise
+    """
+    if tag is None and records:
+        tag = REPORT_DATA if records[0].tag in REPORT_ROWS else records[0].tag
+    if tag == REPORT_DATA:
+        return Schema.for_report_rows(records)
+    record_type = RECORD_TYPES.get(tag)
+    if record_type is not None:
+        return Schema.for_type(record_type)
+    return Schema.for_records([record for record in records if record.tag == tag])
+
+
+#================================================================
+# SINKS
+#================================================================
+
+class CSVSink:
+    def __init__(self, path: str, encoding: str="utf-8", **fmtparams) -> None:
+        """CSV file with a header row, written a batch at a time.
+
+        Args:
+            path (str): output file
+            encoding (str): file encoding
+            **fmtparams: passed to csv.writer, e.g. delimiter
+        """
+        self.path = path
+        self.encoding = encoding
+        self.fmtparams = fmtparams
+        self.rows = 0
+        self._file = None
+        self._writer = None
+
+    def open(self, schema: Schema) -> None:
+        self._file = open(self.path, "w", newline="", encoding=self.encoding)
+        self._writer = csv.writer(self._file, **self.fmtparams)
+        self._writer.writerow(schema.names)
+
+    def write(self, rows: list) -> None:
+        self._writer.writerows(rows)
+        self.rows += len(rows)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class ParquetSink:
+    def __init__(self, path: str, row_group_size: int=DEFAULT_ROW_GROUP_SIZE, compression: str="snappy") -> None:
+        """Parquet file written one row group at a time with pyarrow. Only one
+        row group is held in memory.
+
+        Args:
+            path (str): output file
+            row_group_size (int): rows per row group
+            compression (str): parquet codec
+        """
+        self.path = path
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.rows = 0
+        self._writer = None
+        self._schema = None
+        self._pending = []
+
+    def open(self, schema: Schema) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        types = {
+            "str": pa.string(), "int": pa.int64(), "bool": pa.bool_(), "date": pa.date32(),
+            "decimal": pa.decimal128(DECIMAL_PRECISION, DECIMAL_SCALE), "datetime": pa.timestamp("us", tz="UTC"),
+            REPEATED: pa.string(),
+        }
+        self._schema = pa.schema([pa.field(name, types[kind]) for name, kind in zip(schema.names, schema.kinds)],
+                                 metadata={"qbxml_tag": schema.tag})
+        self._writer = pq.ParquetWriter(self.path, self._schema, compression=self.compression)
+
+    def write(self, rows: list) -> None:
+        self._pending.extend(rows)
+        while len(self._pending) >= self.row_group_size:
+            self._write_group(self._pending[:self.row_group_size])
+            del self._pending[:self.row_group_size]
+
+    def _write_group(self, rows: list) -> None:
+        import pyarrow as pa
+
+        arrays = [pa.array(column, type=arrow_field.type) for column, arrow_field in zip(zip(*rows), self._schema)]
+        self._writer.write_table(pa.Table.from_arrays(arrays, schema=self._schema))
+        self.rows += len(rows)
+
+    def close(self) -> None:
+        if self._writer is None:
+            return
+        if self._pending:
+            self._write_group(self._pending)
+            self._pending = []
+        self._writer.close()
+        self._writer = None
+
+
+class ExcelSink:
+    def __init__(self, path: str, sheet: str=None) -> None:
+        """xlsx workbook written through openpyxl's write-only mode, which
+        streams rows to disk instead of keeping cells in memory. Rows past
+        Excel's sheet limit continue on a new sheet.
+
+        Args:
+            path (str): output file
+            sheet (str): sheet title, defaults to the record tag
+        """
+        self.path = path
+        self.sheet = sheet
+        self.rows = 0
+        self._workbook = None
+        self._worksheet = None
+        self._sheet_rows = 0
+        self._names = None
+        self._title = None
+
+    def open(self, schema: Schema) -> None:
+        from openpyxl import Workbook
+
+        self._workbook = Workbook(write_only=True)
+        self._names = schema.names
+        self._title = (self.sheet or schema.tag or "Sheet")[:28]
+        self._new_sheet()
+
+    def _new_sheet(self) -> None:
+        count = len(self._workbook.worksheets)
+        self._worksheet = self._workbook.create_sheet(self._title if not count else f"{self._title}_{count + 1}")
+        self._worksheet.append(self._names)
+        self._sheet_rows = 1
+
+    def write(self, rows: list) -> None:
+        append = self._worksheet.append
+        for row in rows:
+            if self._sheet_rows == EXCEL_MAX_ROWS:
+                self._new_sheet()
+                append = self._worksheet.append
+            append([_excel_cell(value) for value in row])
+            self._sheet_rows += 1
+        self.rows += len(rows)
+
+    def close(self) -> None:
+        if self._workbook is not None:
+            self._workbook.save(self.path)
+            self._workbook = None
+
+
+def _excel_cell(value):
+    if value.__class__ is datetime.datetime and value.tzinfo is not None:
+        return value.replace(tzinfo=None)
+    return value
+
+
+SINKS = {".csv": CSVSink, ".parquet": ParquetSink, ".pq": ParquetSink, ".xlsx": ExcelSink}
+
+
+def open_sink(path: str, **options):
+    """sink for a path, picked by extension (.csv, .parquet, .xlsx)."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in SINKS:
+        raise ValueError(f"no exporter for {extension!r} files, expected one of {sorted(SINKS)}")
+    return SINKS[extension](path, **options)
+
+
+#================================================================
+# EXPORT
+#================================================================
+
+@dataclass
+class ExportResult:
+    tag: str = None
+    records: int = 0
+    skipped: int = 0
+    seconds: float = 0.0
+    sink_seconds: dict = field(default_factory=dict)
+
+    @property
+    def rate(self) -> float:
+        """records written per second, parsing included."""
+        return self.records / self.seconds if self.seconds else 0.0
+
+    def __str__(self) -> str:
+        sinks = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.sink_seconds.items())
+        skipped = f", {self.skipped} skipped" if self.skipped else ""
+        return (f"{self.records} {self.tag or 'records'}{skipped} in {self.seconds:.2f}s "
+                f"({self.rate:,.0f} records/s; {sinks})")
+
+
+def export(records, sinks, tag: str=None, schema: Schema=None, batch_size: int=DEFAULT_EXPORT_BATCH) -> ExportResult:
+    """write one record stream to several sinks in a single pass.
+
+    The first batch fixes the schema (see infer_schema), then every batch is
+    turned into rows once and handed to each sink, so memory stays at one
+    batch plus what the sinks buffer. Fields first seen after the first
+    batch land in the "extra" column. Records of another tag than the
+    exported one are counted as skipped; the rows of a report count as one
+    tag.
+
+    Args:
+        records (iterable): QBRecord or typed records, e.g. iter_typed(response)
+        sinks (list): CSVSink, ParquetSink, ExcelSink or paths for open_sink()
+        tag (str): element name to export, defaults to the first record's
+        schema (Schema): column layout, inferred when omitted
+        batch_size (int): records converted and written at a time
+
+    Returns:
+        ExportResult: counts, elapsed time and records per second
+    """
+    sinks = [open_sink(sink) if isinstance(sink, str) else sink for sink in sinks]
+    result = ExportResult(tag)
+    timings = [0.0] * len(sinks)
+    start = time.perf_counter()
+    iterator = iter(records)
+    batch = []
+    opened = False
+    try:
+        while True:
+            for record in iterator:
+                batch.append(record)
+                if len(batch) == batch_size:
+                    break
+            if not opened:
+                if schema is None:
+                    schema = infer_schema(batch, tag)
+                result.tag = tag = schema.tag
+                for sink in sinks:
+                    sink.open(schema)
+                opened = True
+            if not batch:
+                break
+            tags = schema.tags
+            rows = [schema.row(record) for record in batch if record.tag in tags]
+            result.records += len(rows)
+            result.skipped += len(batch) - len(rows)
+            for index, sink in enumerate(sinks):
+                sink_start = time.perf_counter()
+                sink.write(rows)
+                timings[index] += time.perf_counter() - sink_start
+            if len(batch) < batch_size:
+                break
+            batch = []
+    finally:
+        for index, sink in enumerate(sinks):
+            sink_start = time.perf_counter()
+            sink.close()
+            timings[index] += time.perf_counter() - sink_start
+    result.seconds = time.perf_counter() - start
+    for sink, seconds in zip(sinks, timings):
+        result.sink_seconds[f"{type(sink).__name__}({os.path.basename(sink.path)})"] = seconds
+    return result
@@ -0,0 +1,294 @@
+import collections
+import csv
+import datetime
+import glob
+import json
+import math
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import asdict, dataclass, field
+
+from qbdesktop import DEFAULT_COMPANY_FILE, RequestProcessor
+from qbreports import ROW_TYPES, run_report
+from qbsync import DEFAULT_SYNC_ENTITIES, DEFAULT_SYNC_PAGE_SIZE, IncrementalSync, SyncStore
+from qbtransport import ComTransport, FakeQuickBooks, FILE_MODE_SINGLE_USER
+
+
+#================================================================
+#CONST
+#================================================================
+COMPANY_FILE_PATTERNS = ("*.qbw", "*.QBW")
+ENTITIES_TASK = "entities"
+SYNC_DATABASE = "sync.sqlite"
+SUMMARY_FILE = "summary.json"
+_FAKE_COMPANIES = {}
+
+
+#================================================================
+# DATACLASSES
+#================================================================
+
+@dataclass
+class ExtractionPlan:
+    """what to pull from every company file.
+
+    Attributes:
+        entities (tuple[str]): entities synced into <output>/<company>/sync.sqlite
+        reports (tuple[tuple]): (kind, report_type, options) written as
+            <output>/<company>/<kind>-<report_type>.csv, options go to build_report_request()
+        full (bool): full pull instead of an incremental sync
+        page_size (int): MaxReturned of the first iterator page
+        sessions_per_file (int): tasks allowed to run against one company file at once, at least 1
+        mode (int): QBFileMode passed to BeginSession
+
+    Raises:
+        ValueError: sessions_per_file is below 1
+    """
+    entities: tuple = DEFAULT_SYNC_ENTITIES
+    reports: tuple = ()
+    full: bool = False
+    page_size: int = DEFAULT_SYNC_PAGE_SIZE
+    sessions_per_file: int = 1
+    mode: int = FILE_MODE_SINGLE_USER
+
+    def __post_init__(self) -> None:
+        if self.sessions_per_file < 1:
+            raise ValueError(f"sessions_per_file must be at least 1, got {self.sessions_per_file}")
+
+    def tasks(self) -> list:
+        """(name, report) per task; report is None for the entity sync."""
+        tasks = [(ENTITIES_TASK, None)] if self.entities else []
+        for report in self.reports:
+            kind, report_type, options = (tuple(report) + (None,))[:3]
+            tasks.append((f"{kind}-{report_type}", (kind, report_type, dict(options or {}))))
+        return tasks
+
+
+@dataclass
+class TaskResult:
+    company_file: str
+    task: str
+    started: float = 0.0
+    elapsed: float = 0.0
+    records: int = 0
+    written: int = 0
+    error: str = None
+
+
+@dataclass
+class CompanySummary:
+    company_file: str
+    output: str
+    elapsed: float = 0.0
+    tasks: list = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return all(task.error is None for task in self.tasks)
+
+
+@dataclass
+class RunSummary:
+    started: str
+    elapsed: float = 0.0
+    companies: list = field(default_factory=list)
+
+    @property
+    def failed(self) -> list:
+        return [company for company in self.companies if not company.ok]
+
+    def as_dict(self) -> dict:
+        summary = asdict(self)
+        summary["failed"] = [company.company_file for company in self.failed]
+        return summary
+
+
+#================================================================
+# BACKENDS
+#================================================================
+
+def com_backend(company_file: str):
+    """the real QBXMLRP2 transport; the company file is opened by BeginSession."""
+    return ComTransport()
+
+
+class FakeBackend:
+    def __init__(self, customers: int=200, items: int=50, invoices: int=1_000,
+                 latency: float=0.0, latency_per_record: float=0.0) -> None:
+        """picklable worker backend creating one generated FakeQuickBooks per
+        company file and worker process, seeded from the file name so every
+        worker sees the same company.
+        """
+        self.customers = customers
+        self.items = items
+        self.invoices = invoices
+        self.latency = latency
+        self.latency_per_record = latency_per_record
+
+    def __call__(self, company_file: str) -> FakeQuickBooks:
+        key = (company_file, self.customers, self.items, self.invoices)
+        backend = _FAKE_COMPANIES.get(key)
+        if backend is None:
+            seed = sum(map(ord, os.path.basename(company_file)))
+            backend = FakeQuickBooks(self.latency, self.latency_per_record, seed)
+            backend.generate(self.customers, self.items, self.invoices)
+            _FAKE_COMPANIES[key] = backend
+        return backend
+
+
+#================================================================
+# FUNCTIONS
+#================================================================
+
+def discover_company_files(directory: str=DEFAULT_COMPANY_FILE, patterns=COMPANY_FILE_PATTERNS) -> list[str]:
+    """every company file below directory, sorted by path."""
+    found = set()
+    for pattern in patterns:
+        found.update(glob.glob(os.path.join(directory, "**", pattern), recursive=True))
+    return sorted(found)
+
+
+def company_output(output_dir: str, company_file: str, root: str=None) -> str:
+    """output directory of one company, derived from its path below root."""
+    name = os.path.relpath(company_file, root) if root else os.path.basename(company_file)
+    name = os.path.splitext(name)[0].replace(os.sep, "__").replace("/", "__")
+    return os.path.join(output_dir, name)
+
+
+def _init_worker() -> None:
+    try:
+        import pythoncom
+    except ImportError:
+        return
+    pythoncom.CoInitialize()
+
+
+def _cell(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ""
+    return value
+
+
+def _write_report(report, path: str) -> int:
+    names = [column.title or column.col_type or f"Col{column.col_id}" for column in report.columns]
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(["row_type", "level", "row_data"] + names)
+        values = [column.values for column in report.columns]
+        for index in range(len(report)):
+            writer.writerow([ROW_TYPES[report.row_type[index]], report.level[index], report.row_data[index]]
+                            + [_cell(column[index]) for column in values])
+    return len(report)
+
+
+def run_task(backend, app_name: str, company_file: str, output: str, plan: ExtractionPlan,
+             task: str, report: tuple) -> TaskResult:
+    """run one task of the plan against one company file. Runs in a worker
+    process with its own session; errors are returned, not raised."""
+    result = TaskResult(company_file, task, time.time())
+    start = time.perf_counter()
+    try:
+        os.makedirs(output, exist_ok=True)
+        with RequestProcessor(app_name, backend(company_file), company_file, plan.mode) as processor:
+            if task == ENTITIES_TASK:
+                with SyncStore(os.path.join(output, SYNC_DATABASE)) as store:
+                    sync = IncrementalSync(processor, store, plan.entities, plan.page_size)
+                    for synced in sync.run(plan.full):
+                        result.records += synced.received
+                        result.written += synced.written
+            else:
+                kind, report_type, options = report
+                parsed = run_report(processor, kind, report_type, **options)
+                result.records = result.written = _write_report(parsed, os.path.join(output, f"{task}.csv"))
+    except Exception as e:
+        result.error = f"{type(e).__name__}: {e}"
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+#================================================================
+# CLASSES
+#================================================================
+
+class Orchestrator:
+    def __init__(self, output_dir: str, plan: ExtractionPlan=None, app_name: str="qbdesktop extract",
+                 backend=com_backend, workers: int=None, root: str=DEFAULT_COMPANY_FILE) -> None:
+        """extracts many company files in parallel worker processes.
+
+        Every worker process initializes COM once and opens its own
+        connection and session per task, so no COM object crosses a process
+        boundary. Tasks (one entity sync plus one per report) are handed out
+        round robin over the company files, never more than
+        plan.sessions_per_file at a time for the same file, so a file opened
+        single user is only ever used by one worker.
+
+        Args:
+            output_dir (str): one sub directory per company plus summary.json
+            plan (ExtractionPlan): what to extract, entities only by default
+            app_name (str): application name passed to OpenConnection
+            backend (callable): picklable, called in the worker with the
+                company file and returns a Transport; see FakeBackend
+            workers (int): worker processes, os.cpu_count() by default
+            root (str): directory company outputs are named relative to
+        """
+        self.output_dir = output_dir
+        self.plan = plan or ExtractionPlan()
+        self.app_name = app_name
+        self.backend = backend
+        self.workers = workers or os.cpu_count() or 1
+        self.root = root
+
+    def run(self, company_files: list[str]=None) -> RunSummary:
+        """extract every file, discover_company_files(root) by default, and
+        write the run summary to <output_dir>/summary.json. Without company
+        files or tasks the summary is empty and no worker is started."""
+        if company_files is None:
+            company_files = discover_company_files(self.root)
+        summary = RunSummary(datetime.datetime.now().isoformat(timespec="seconds"))
+        start = time.perf_counter()
+        companies = {}
+        pending = collections.deque()
+        tasks = self.plan.tasks()
+        if tasks:
+            for company_file in company_files:
+                output = company_output(self.output_dir, company_file, self.root)
+                companies[company_file] = CompanySummary(company_file, output)
+                pending.append((company_file, collections.deque(tasks)))
+        if pending:
+            self._run_tasks(pending, companies)
+        summary.companies = list(companies.values())
+        summary.elapsed = time.perf_counter() - start
+        os.makedirs(self.output_dir, exist_ok=True)
+        with open(os.path.join(self.output_dir, SUMMARY_FILE), "w", encoding="utf-8") as file:
+            json.dump(summary.as_dict(), file, indent=2)
+        return summary
+
+    def _run_tasks(self, pending: collections.deque, companies: dict) -> None:
+        running = collections.Counter()
+        futures = {}
+        with ProcessPoolExecutor(self.workers, initializer=_init_worker) as executor:
+            while pending or futures:
+                for _ in range(len(pending)):
+                    if len(futures) >= self.workers * 2:
+                        break
+                    company_file, tasks = pending.popleft()
+                    if running[company_file] < self.plan.sessions_per_file:
+                        task, report = tasks.popleft()
+                        future = executor.submit(run_task, self.backend, self.app_name, company_file,
+                                                 companies[company_file].output, self.plan, task, report)
+                        futures[future] = company_file
+                        running[company_file] += 1
+                    if tasks:
+                        pending.append((company_file, tasks))
+                if not futures:
+                    continue
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    company_file = futures.pop(future)
+                    running[company_file] -= 1
+                    company = companies[company_file]
+                    result = future.result()
+                    company.tasks.append(result)
+                    company.elapsed = (max(task.started + task.elapsed for task in company.tasks)
+                                       - min(task.started for task in company.tasks))
@@ -0,0 +1,370 @@
+import hashlib
+import itertools
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+from qbcache import normalize_request, request_ids, rewrite_request_ids
+from qbtransport import FILE_MODE_SINGLE_USER, Transport
+
+
+#================================================================
+#CONST
+#================================================================
+FILE_MAGIC = b"QBJ1"
+ENTRY_MAGIC = b"QBJE"
+INDEX_SUFFIX = ".idx"
+COMPRESSION_LEVEL = 6
+# preset dictionary: qbXML boilerplate every entry shares, so small
+# request/response pairs compress nearly as well as large ones
+ZDICT = (b'<?xml version="1.0" encoding="utf-8"?>\n<?qbxml version="13.0"?>\n<QBXML>\n<QBXMLMsgsRq onError='
+         b'"stopOnError">\n<QBXMLMsgsRs>\n statusCode="0" statusSeverity="Info" statusMessage="Status OK"'
+         b' requestID="1" iteratorRemainingCount="0" iteratorID=""<MaxReturned></MaxReturned><ListID></ListID>'
+         b'<TxnID></TxnID><TimeCreated></TimeCreated><TimeModified></TimeModified><EditSequence></EditSequence>'
+         b'<Name></Name><FullName></FullName><IsActive>true</IsActive><Sublevel>0</Sublevel><ParentRef>'
+         b'<CustomerRef><ItemRef><BillAddress><Addr1></Addr1><City></City><State></State><PostalCode></PostalCode>'
+         b'</BillAddress><Phone></Phone><Email></Email><Balance></Balance><TotalBalance></TotalBalance>'
+         b'<TxnDate></TxnDate><RefNumber></RefNumber><Amount></Amount><Quantity></Quantity><Rate></Rate>'
+         b'</QBXMLMsgsRs>\n</QBXML>\n')
+# data file entry: magic, compressed length, request length, started (epoch), elapsed seconds
+ENTRY_HEADER = struct.Struct("<4sIIdd")
+# .idx record: key digest, data offset, compressed length, elapsed seconds
+INDEX_RECORD = struct.Struct("<16sQId")
+
+
+#================================================================
+# FUNCTIONS
+#================================================================
+
+def request_key(request: str) -> bytes:
+    """16 byte digest of the normalized request (see qbcache.normalize_request)."""
+    return hashlib.blake2b(normalize_request(request).encode("utf-8"), digest_size=16).digest()
+
+
+def _compressor():
+    return zlib.compressobj(COMPRESSION_LEVEL, zdict=ZDICT)
+
+
+def _decompress(data) -> bytes:
+    decompressor = zlib.decompressobj(zdict=ZDICT)
+    return decompressor.decompress(data) + decompressor.flush()
+
+
+def _split(raw: bytes, request_length: int) -> tuple:
+    return raw[:request_length].decode("utf-8"), raw[request_length:].decode("utf-8")
+
+
+#================================================================
+# CLASSES
+#================================================================
+
+class JournalEntry:
+    """one recorded round trip."""
+    __slots__ = ("number", "request", "response", "started", "elapsed")
+
+    def __init__(self, number: int, request: str, response: str, started: float, elapsed: float) -> None:
+        self.number = number
+        self.request = request
+        self.response = response
+        self.started = started
+        self.elapsed = elapsed
+
+    def __repr__(self) -> str:
+        return f"JournalEntry({self.number}, {len(self.request)}B -> {len(self.response)}B, {self.elapsed:.3f}s)"
+
+
+class Journal:
+    def __init__(self, path: str) -> None:
+        """append-only journal of qbXML round trips.
+
+        Every entry is compressed on its own with zlib and a qbXML preset
+        dictionary and appended to path; a fixed size record with the request
+        key, offset, length and elapsed time is appended to path + ".idx".
+        Existing journals are extended, never rewritten. Safe to share
+        between threads.
+
+        Args:
+            path (str): journal file, e.g. capture.qbj
+        """
+        self.path = path
+        self.index_path = path + INDEX_SUFFIX
+        self.entries = 0
+        self._lock = threading.Lock()
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        if not new:
+            _recover(path)
+        self._data = open(path, "ab")
+        if new:
+            self._data.write(FILE_MAGIC)
+            self._data.flush()
+            open(self.index_path, "wb").close()
+        self._index = open(self.index_path, "ab")
+        self.entries = self._index.tell() // INDEX_RECORD.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def record(self, request: str, response: str, elapsed: float, started: float=None) -> int:
+        """append one round trip and return its entry number."""
+        request_bytes = request.encode("utf-8")
+        compressor = _compressor()
+        payload = compressor.compress(request_bytes) + compressor.compress(response.encode("utf-8"))
+        payload += compressor.flush()
+        key = request_key(request)
+        header = ENTRY_HEADER.pack(ENTRY_MAGIC, len(payload), len(request_bytes),
+                                   started if started is not None else time.time(), elapsed)
+        with self._lock:
+            offset = self._data.tell()
+            self._data.write(header)
+            self._data.write(payload)
+            self._data.flush()
+            self._index.write(INDEX_RECORD.pack(key, offset, ENTRY_HEADER.size + len(payload), elapsed))
+            self._index.flush()
+            self.entries += 1
+            return self.entries - 1
+
+    def close(self) -> None:
+        with self._lock:
+            if not self._data.closed:
+                self._data.close()
+                self._index.close()
+
+
+class JournalReader:
+    def __init__(self, path: str) -> None:
+        """random access to a journal through a memory map of the data file
+        and its index. Entries appended after opening are not visible.
+
+        Args:
+            path (str): journal file written by Journal
+        """
+        self.path = path
+        index_path = path + INDEX_SUFFIX
+        if not os.path.exists(index_path):
+            rebuild_index(path)
+        self._file = open(path, "rb")
+        if self._file.read(len(FILE_MAGIC)) != FILE_MAGIC:
+            self._file.close()
+            raise ValueError(f"{path} is not a qbXML journal")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._index_file = open(index_path, "rb")
+        index_size = os.path.getsize(index_path)
+        self._index = mmap.mmap(self._index_file.fileno(), 0, access=mmap.ACCESS_READ) if index_size else b""
+        count = index_size // INDEX_RECORD.size
+        while count:
+            _, offset, length, _ = INDEX_RECORD.unpack_from(self._index, (count - 1) * INDEX_RECORD.size)
+            if offset + length <= len(self._map):
+                break
+            count -= 1
+        self._count = count
+        self._keys = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def index_record(self, number: int) -> tuple:
+        """(key digest, offset, length, elapsed) of an entry, straight from the index."""
+        if number < 0:
+            number += self._count
+        if not 0 <= number < self._count:
+            raise IndexError(f"journal entry {number} out of range")
+        return INDEX_RECORD.unpack_from(self._index, number * INDEX_RECORD.size)
+
+    def __getitem__(self, number: int) -> JournalEntry:
+        if number < 0:
+            number += self._count
+        _, offset, _, _ = self.index_record(number)
+        _, size, request_length, started, elapsed = ENTRY_HEADER.unpack_from(self._map, offset)
+        start = offset + ENTRY_HEADER.size
+        request, response = _split(_decompress(self._map[start:start + size]), request_length)
+        return JournalEntry(number, request, response, started, elapsed)
+
+    def __iter__(self):
+        for number in range(self._count):
+            yield self[number]
+
+    def lookup(self, key: bytes) -> list:
+        """entry numbers recorded for a request key, oldest first."""
+        if self._keys is None:
+            keys = {}
+            for number in range(self._count):
+                keys.setdefault(self._index[number * INDEX_RECORD.size:number * INDEX_RECORD.size + 16],
+                                []).append(number)
+            self._keys = keys
+        return self._keys.get(key, [])
+
+    def elapsed(self, number: int) -> float:
+        return self.index_record(number)[3]
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            if self._index:
+                self._index.close()
+            self._map = self._index = None
+            self._index_file.close()
+        self._file.close()
+
+
+def iter_entries(path: str):
+    """yield every JournalEntry of a journal in recorded order, e.g. to re-parse
+    a historical extract with a new parser."""
+    with JournalReader(path) as reader:
+        yield from reader
+
+
+def rebuild_index(path: str) -> int:
+    """write path + ".idx" again by scanning the data file; a torn last entry
+    is left out. Returns the number of entries."""
+    count = 0
+    with open(path, "rb") as data, open(path + INDEX_SUFFIX + ".part", "wb") as index:
+        if data.read(len(FILE_MAGIC)) != FILE_MAGIC:
+            raise ValueError(f"{path} is not a qbXML journal")
+        while True:
+            offset = data.tell()
+            header = data.read(ENTRY_HEADER.size)
+            if len(header) < ENTRY_HEADER.size:
+                break
+            magic, size, request_length, _, elapsed = ENTRY_HEADER.unpack(header)
+            payload = data.read(size)
+            if magic != ENTRY_MAGIC or len(payload) < size:
+                break
+            request, _ = _split(_decompress(payload), request_length)
+            index.write(INDEX_RECORD.pack(request_key(request), offset, ENTRY_HEADER.size + size, elapsed))
+            count += 1
+    os.replace(path + INDEX_SUFFIX + ".part", path + INDEX_SUFFIX)
+    return count
+
+
+def _recover(path: str) -> None:
+    """cut a torn tail left by a crash, so appends start on an entry boundary."""
+    index_path = path + INDEX_SUFFIX
+    if not os.path.exists(index_path):
+        rebuild_index(path)
+    size = os.path.getsize(path)
+    with open(index_path, "r+b") as index:
+        count = os.path.getsize(index_path) // INDEX_RECORD.size
+        end = len(FILE_MAGIC)
+        if count:
+            index.seek((count - 1) * INDEX_RECORD.size)
+            _, offset, length, _ = INDEX_RECORD.unpack(index.read(INDEX_RECORD.size))
+            end = offset + length
+        index.truncate(count * INDEX_RECORD.size)
+    if end > size:
+        rebuild_index(path)
+        _recover(path)
+    elif end < size:
+        with open(path, "r+b") as data:
+            data.truncate(end)
+
+
+class RecordingTransport(Transport):
+    def __init__(self, transport: Transport, journal) -> None:
+        """records every process_request of another transport into a journal.
+
+        Args:
+            transport (Transport): e.g. ComTransport or FakeQuickBooks
+            journal (Journal | str): journal or path of one
+        """
+        self.transport = transport
+        self.journal = Journal(journal) if isinstance(journal, str) else journal
+
+    def open_connection(self, app_id: str, app_name: str) -> None:
+        self.transport.open_connection(app_id, app_name)
+
+    def close_connection(self) -> None:
+        self.transport.close_connection()
+
+    def begin_session(self, company_file: str="", mode: int=FILE_MODE_SINGLE_USER) -> str:
+        return self.transport.begin_session(company_file, mode)
+
+    def end_session(self, ticket: str) -> None:
+        self.transport.end_session(ticket)
+
+    def process_request(self, ticket: str, request: str) -> str:
+        started = time.time()
+        start = time.perf_counter()
+        response = self.transport.process_request(ticket, request)
+        self.journal.record(request, response, time.perf_counter() - start, started)
+        return response
+
+    def dispatch(self, prog_id: str):
+        return self.transport.dispatch(prog_id)
+
+
+class ReplayMiss(LookupError):
+    """the journal holds no response for a request."""
+
+
+class ReplayTransport(Transport):
+    def __init__(self, path: str, speed: float=None, strict: bool=True) -> None:
+        """serves recorded responses by normalized request key, without QuickBooks.
+        The requestIDs of a served response are set to those of the request.
+
+        Identical requests get their recorded responses in order, starting
+        over after the last one, so a capture can be replayed in a loop.
+
+        Args:
+            path (str): journal file
+            speed (float): 1.0 sleeps as long as the recorded round trip, 10.0
+                a tenth of it; None answers immediately
+            strict (bool): raise ReplayMiss for unknown requests, otherwise
+                answer with an empty QBXMLMsgsRs
+        """
+        self.reader = JournalReader(path)
+        self.speed = speed
+        self.strict = strict
+        self.requests = 0
+        self.misses = 0
+        self._cursors: dict[bytes, int] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def open_connection(self, app_id: str, app_name: str) -> None:
+        pass
+
+    def close_connection(self) -> None:
+        pass
+
+    def begin_session(self, company_file: str="", mode: int=FILE_MODE_SINGLE_USER) -> str:
+        return f"replay-{next(self._ids)}"
+
+    def end_session(self, ticket: str) -> None:
+        pass
+
+    def process_request(self, ticket: str, request: str) -> str:
+        key = request_key(request)
+        numbers = self.reader.lookup(key)
+        with self._lock:
+            self.requests += 1
+            if not numbers:
+                self.misses += 1
+            else:
+                cursor = self._cursors.get(key, 0)
+                self._cursors[key] = cursor + 1
+        if not numbers:
+            if self.strict:
+                raise ReplayMiss(f"no recorded response for {request[:200]!r}")
+            return '<?xml version="1.0" ?>\n<QBXML>\n<QBXMLMsgsRs>\n</QBXMLMsgsRs>\n</QBXML>\n'
+        number = numbers[cursor % len(numbers)]
+        if self.speed:
+            time.sleep(self.reader.elapsed(number) / self.speed)
+        entry = self.reader[number]
+        if entry.request == request:
+            return entry.response
+        return rewrite_request_ids(entry.response, request_ids(request))
+
+    def close(self) -> None:
+        self.reader.close()
@@ -0,0 +1,475 @@
+import bisect
+import threading
+import time
+
+
+#================================================================
+#CONST
+#================================================================
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BYTE_BUCKETS = tuple(256 * 4 ** power for power in range(11))
+RECORD_BUCKETS = (1, 10, 100, 1_000, 10_000, 100_000, 1_000_000)
+MAX_SPANS = 1_000
+
+
+#================================================================
+# REGISTRY
+#================================================================
+
+class Histogram:
+    """cumulative bucket counts, sum and count, as Prometheus histograms keep them."""
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: tuple) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def buckets(self) -> list:
+        """(upper bound, cumulative count) pairs ending with +Inf."""
+        out = []
+        total = 0
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            total += count
+            out.append((bound, total))
+        return out
+
+
+def _labels(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: tuple, extra: str="") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    def __init__(self, prefix: str="qbxml_") -> None:
+        """in-process store of counters and histograms keyed by name and labels.
+
+        Args:
+            prefix (str): prepended to every metric name in the dumps
+        """
+        self.prefix = prefix
+        self.counters: dict[str, dict] = {}
+        self.histograms: dict[str, dict] = {}
+        self.help: dict[str, str] = {}
+        self._bounds: dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, text: str, buckets: tuple=None) -> None:
+        self.help[name] = text
+        if buckets is not None:
+            self._bounds[name] = buckets
+
+    def inc(self, name: str, value: float=1, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(self._bounds.get(name, TIME_BUCKETS))
+            histogram.observe(value)
+
+    def value(self, name: str, **labels) -> float:
+        return self.counters.get(name, {}).get(_labels(labels), 0)
+
+    def histogram(self, name: str, **labels) -> Histogram:
+        return self.histograms.get(name, {}).get(_labels(labels))
+
+    def clear(self) -> None:
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        with self._lock:
+            for name, series in sorted(self.counters.items()):
+                full = self.prefix + name
+                if name in self.help:
+                    lines.append(f"# HELP {full} {self.help[name]}")
+                lines.append(f"# TYPE {full} counter")
+                for labels, value in sorted(series.items()):
+                    lines.append(f"{full}{_format_labels(labels)} {_format_value(value)}")
+            for name, series in sorted(self.histograms.items()):
+                full = self.prefix + name
+                if name in self.help:
+                    lines.append(f"# HELP {full} {self.help[name]}")
+                lines.append(f"# TYPE {full} histogram")
+                for labels, histogram in sorted(series.items()):
+                    for bound, count in histogram.buckets():
+                        le = 'le="' + _format_value(bound) + '"'
+                        lines.append(f"{full}_bucket{_format_labels(labels, le)} {count}")
+                    lines.append(f"{full}_sum{_format_labels(labels)} {_format_value(histogram.sum)}")
+                    lines.append(f"{full}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "counters": {self.prefix + name: [{"labels": dict(labels), "value": value}
+                                                  for labels, value in sorted(series.items())]
+                             for name, series in sorted(self.counters.items())},
+                "histograms": {self.prefix + name: [{"labels": dict(labels), "count": histogram.count,
+                                                     "sum": histogram.sum,
+                                                     "buckets": [[_format_value(bound), count]
+                                                                 for bound, count in histogram.buckets()]}
+                                                    for labels, histogram in sorted(series.items())]
+                               for name, series in sorted(self.histograms.items())},
+            }
+
+    def to_json(self, indent: int=None) -> str:
+        import json
+
+        return json.dumps(self.to_dict(), indent=indent)
+
+
+#================================================================
+# SPANS
+#================================================================
+
+def request_name(request: str) -> str:
+    """tag of the first message in a qbXML request, e.g. CustomerQueryRq."""
+    start = request.find("<QBXMLMsgsRq")
+    if start < 0:
+        return "unknown"
+    start = request.find("<", start + 12)
+    if start < 0:
+        return "unknown"
+    end = start + 1
+    while end < len(request) and request[end] not in " >/\t\r\n":
+        end += 1
+    return request[start + 1:end]
+
+
+class Span:
+    """one qbXML round trip. The build and parse phases are attributed to the
+    request made by the same thread: envelopes built since its previous
+    request, and the first response parsed after it.
+
+    Attributes:
+        source (str): class that sent the request, e.g. RequestProcessor
+        request (str): first message tag of the request
+        phases (dict): seconds per phase (build, com, parse)
+        request_bytes (int): size of the request text
+        response_bytes (int): size of the response text
+        records (int): records parsed from the response
+        statuses (list[int]): statusCode of every *Rs element
+        reused (bool): the session had served a request before
+        error (str): exception raised by the transport
+        profile (Capture): cProfile/tracemalloc capture when requested
+    """
+    __slots__ = ("source", "request", "started", "phases", "request_bytes", "response_bytes", "records",
+                 "statuses", "reused", "error", "profile")
+
+    def __init__(self, source: str, request: str, reused: bool) -> None:
+        self.source = source
+        self.request = request
+        self.reused = reused
+        self.started = time.time()
+        self.phases = {}
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.records = 0
+        self.statuses = []
+        self.error = None
+        self.profile = None
+
+    @property
+    def elapsed(self) -> float:
+        return sum(self.phases.values())
+
+    def to_dict(self) -> dict:
+        out = {name: getattr(self, name) for name in self.__slots__ if name != "profile"}
+        out["phases"] = dict(self.phases)
+        if self.profile is not None:
+            out["profile"] = self.profile.to_dict()
+        return out
+
+    def __repr__(self) -> str:
+        phases = ", ".join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in self.phases.items())
+        return f"Span({self.request!r}, {phases}, records={self.records})"
+
+
+class Capture:
+    def __init__(self, profile: bool=True, memory: bool=True, limit: int=25) -> None:
+        """cProfile and/or tracemalloc around a block of code.
+
+        Args:
+            profile (bool): collect a cProfile profile
+            memory (bool): trace allocations with tracemalloc
+            limit (int): lines kept in the text reports
+        """
+        self.profile = profile
+        self.memory = memory
+        self.limit = limit
+        self.stats = ""
+        self.peak = 0
+        self.allocated = 0
+        self.top = []
+        self._profiler = None
+        self._tracing = False
+
+    def __enter__(self):
+        if self.memory:
+            import tracemalloc
+
+            self._tracing = not tracemalloc.is_tracing()
+            if self._tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            self._before = tracemalloc.take_snapshot()
+            self._current = tracemalloc.get_traced_memory()[0]
+        if self.profile:
+            import cProfile
+
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._profiler is not None:
+            import io
+            import pstats
+
+            self._profiler.disable()
+            out = io.StringIO()
+            pstats.Stats(self._profiler, stream=out).sort_stats("cumulative").print_stats(self.limit)
+            self.stats = out.getvalue()
+            self._profiler = None
+        if self.memory:
+            import tracemalloc
+
+            current, peak = tracemalloc.get_traced_memory()
+            self.peak = peak - self._current
+            self.allocated = current - self._current
+            after = tracemalloc.take_snapshot()
+            self.top = [str(stat) for stat in after.compare_to(self._before, "lineno")[:self.limit]]
+            self._before = None
+            if self._tracing:
+                tracemalloc.stop()
+
+    def to_dict(self) -> dict:
+        return {"stats": self.stats, "peak": self.peak, "allocated": self.allocated, "top": self.top}
+
+
+#================================================================
+# INSTRUMENTATION
+#================================================================
+
+def _describe(registry: Registry) -> None:
+    registry.describe("requests_total", "qbXML round trips by source, request and outcome")
+    registry.describe("phase_seconds", "seconds spent building, sending and parsing qbXML", TIME_BUCKETS)
+    registry.describe("request_bytes", "size of qbXML requests", BYTE_BUCKETS)
+    registry.describe("response_bytes", "size of qbXML responses", BYTE_BUCKETS)
+    registry.describe("response_records", "records per parsed response", RECORD_BUCKETS)
+    registry.describe("records_total", "records parsed from responses")
+    registry.describe("status_total", "statusCode of every response message")
+    registry.describe("session_requests_total", "requests by whether they reused an open session")
+    registry.describe("retries_total", "busy requests sent again, by company file")
+    registry.describe("circuit_rejected_total", "requests refused by an open circuit, by company file")
+
+
+class Instrumentation:
+    def __init__(self, registry: Registry=None, enabled: bool=False, keep: int=MAX_SPANS) -> None:
+        """collects spans and feeds the registry. While disabled, the hooks in
+        RequestProcessor, SessionManager, WebConnector and ResponseStream cost
+        one attribute check per call.
+
+        Args:
+            registry (Registry): receives the metrics, a new one by default
+            enabled (bool): start recording right away
+            keep (int): finished spans kept in spans for inspection
+        """
+        self.registry = registry or Registry()
+        self.enabled = enabled
+        self.keep = keep
+        self.spans = []
+        self.listeners = []
+        self._captures = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        _describe(self.registry)
+
+    def enable(self) -> "Instrumentation":
+        self.enabled = True
+        return self
+
+    def disable(self) -> "Instrumentation":
+        self.enabled = False
+        return self
+
+    def add_listener(self, listener) -> None:
+        """call listener(span) after every round trip."""
+        self.listeners.append(listener)
+
+    def capture(self, request: str=None, profile: bool=True, memory: bool=True, count: int=1, limit: int=25) -> None:
+        """profile the next count round trips whose first message is request
+        (any when None). The Capture ends up in span.profile.
+
+        Args:
+            request (str): e.g. InvoiceQueryRq
+            profile (bool): collect a cProfile profile
+            memory (bool): trace allocations with tracemalloc
+            count (int): number of matching requests to capture
+            limit (int): lines kept in the text reports
+        """
+        with self._lock:
+            self._captures.append([request, count, profile, memory, limit])
+
+    def built(self, seconds: float) -> None:
+        """account envelope build time to the next request of this thread."""
+        local = self._local
+        local.build = getattr(local, "build", 0.0) + seconds
+
+    def round_trip(self, source: str, send, request: str, reused: bool=False) -> str:
+        """time send(request) as one span and record it.
+
+        Args:
+            source (str): name of the calling class
+            send (callable): does the round trip, e.g. partial(transport.process_request, ticket)
+            request (str): qbXML request
+            reused (bool): the session served an earlier request
+
+        Returns:
+            str: the response
+        """
+        span = Span(source, request_name(request), reused)
+        local = self._local
+        build = getattr(local, "build", 0.0)
+        if build:
+            span.phases["build"] = build
+            local.build = 0.0
+        span.request_bytes = len(request)
+        capture = self._take_capture(span.request)
+        start = time.perf_counter()
+        try:
+            if capture is not None:
+                with capture:
+                    response = send(request)
+                span.profile = capture
+            else:
+                response = send(request)
+        except BaseException as e:
+            span.phases["com"] = time.perf_counter() - start
+            span.error = type(e).__name__
+            self._finish(span)
+            raise
+        span.phases["com"] = time.perf_counter() - start
+        span.response_bytes = len(response) if response is not None else 0
+        local.span = span
+        self._finish(span)
+        return response
+
+    def parsed(self, seconds: float, records: int, statuses: list) -> None:
+        """account a parsed response to the last request of this thread."""
+        local = self._local
+        span = getattr(local, "span", None)
+        local.span = None
+        registry = self.registry
+        request = span.request if span is not None else "unknown"
+        registry.observe("phase_seconds", seconds, phase="parse", request=request)
+        registry.observe("response_records", records, request=request)
+        registry.inc("records_total", records, request=request)
+        for status in statuses:
+            registry.inc("status_total", code=status.code, severity=status.severity)
+        if span is not None:
+            span.phases["parse"] = span.phases.get("parse", 0.0) + seconds
+            span.records += records
+            span.statuses.extend(status.code for status in statuses)
+
+    def instrument_records(self, records, stream=None):
+        """wrap a record generator so its parse time, record count and the
+        statuses of stream reach parsed() once it is exhausted or closed."""
+        seconds = 0.0
+        count = 0
+        iterator = iter(records)
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    record = next(iterator)
+                except StopIteration:
+                    seconds += time.perf_counter() - start
+                    break
+                seconds += time.perf_counter() - start
+                count += 1
+                yield record
+        finally:
+            self.parsed(seconds, count, stream.statuses if stream is not None else [])
+
+    def _take_capture(self, request: str):
+        if not self._captures:
+            return None
+        with self._lock:
+            for entry in self._captures:
+                if entry[0] is None or entry[0] == request:
+                    entry[1] -= 1
+                    if entry[1] <= 0:
+                        self._captures.remove(entry)
+                    return Capture(entry[2], entry[3], entry[4])
+        return None
+
+    def _finish(self, span: Span) -> None:
+        registry = self.registry
+        outcome = "error" if span.error else "ok"
+        registry.inc("requests_total", source=span.source, request=span.request, outcome=outcome)
+        registry.inc("session_requests_total", reused=str(span.reused).lower())
+        for phase, seconds in span.phases.items():
+            registry.observe("phase_seconds", seconds, phase=phase, request=span.request)
+        registry.observe("request_bytes", span.request_bytes, request=span.request)
+        if not span.error:
+            registry.observe("response_bytes", span.response_bytes, request=span.request)
+        with self._lock:
+            self.spans.append(span)
+            if len(self.spans) > self.keep:
+                del self.spans[:len(self.spans) - self.keep]
+        for listener in self.listeners:
+            listener(span)
+
+
+INSTRUMENTATION = Instrumentation()
+
+
+def enable(registry: Registry=None) -> Instrumentation:
+    """switch the shared instrumentation on, optionally with a new registry."""
+    if registry is not None:
+        _describe(registry)
+        INSTRUMENTATION.registry = registry
+    return INSTRUMENTATION.enable()
+
+
+def disable() -> Instrumentation:
+    return INSTRUMENTATION.disable()
+
+
+def capture(profile: bool=True, memory: bool=True, limit: int=25) -> Capture:
+    """context manager profiling any block: with capture() as result: ..."""
+    return Capture(profile, memory, limit)
@@ -0,0 +1,276 @@
+from xml.etree.ElementTree import XMLPullParser
+
+from qbmetrics import INSTRUMENTATION
+
+
+#================================================================
+#CONST
+#================================================================
+DEFAULT_CHUNK_SIZE = 64 * 1024
+DEFAULT_BATCH_SIZE = 10_000
+REPORT_ROWS = frozenset(("DataRow", "TextRow", "SubtotalRow", "TotalRow"))
+
+
+#================================================================
+# TYPES
+#================================================================
+
+class QBStatus:
+    """status attributes of a single *Rs element in a qbXML response."""
+    __slots__ = ("name", "request_id", "code", "severity", "message", "attrib")
+
+    def __init__(self, name: str, attrib: dict) -> None:
+        self.name = name
+        self.attrib = attrib
+        self.request_id = attrib.get("requestID")
+        self.code = int(attrib.get("statusCode", 0))
+        self.severity = attrib.get("statusSeverity", "Info")
+        self.message = attrib.get("statusMessage", "")
+
+    @property
+    def ok(self) -> bool:
+        return self.severity != "Error"
+
+    def __repr__(self) -> str:
+        return f"QBStatus({self.name!r}, code={self.code}, severity={self.severity!r})"
+
+
+class QBRecord:
+    """one *Ret element (or report row) from a qbXML response.
+
+    Args:
+        tag (str): element name, e.g. CustomerRet, InvoiceRet or DataRow
+        fields (dict): child elements, nested aggregates as dicts and
+            repeated children as lists
+        status (QBStatus): status of the enclosing *Rs element
+    """
+    __slots__ = ("tag", "fields", "status")
+
+    def __init__(self, tag: str, fields: dict, status: QBStatus=None) -> None:
+        self.tag = tag
+        self.fields = fields
+        self.status = status
+
+    def __getitem__(self, key):
+        return self.fields[key]
+
+    def get(self, key, default=None):
+        return self.fields.get(key, default)
+
+    def __repr__(self) -> str:
+        return f"QBRecord({self.tag!r}, {self.fields!r})"
+
+
+#================================================================
+# FUNCTIONS
+#================================================================
+
+def element_to_dict(element) -> dict:
+    """convert an element into a dict of its children. Leaves map to their
+    text, aggregates map to dicts and repeated children are collected in lists.
+    """
+    fields = {}
+    for child in element:
+        if len(child):
+            value = element_to_dict(child)
+        else:
+            value = child.text
+        previous = fields.get(child.tag)
+        if previous is None and child.tag not in fields:
+            fields[child.tag] = value
+        elif isinstance(previous, list):
+            previous.append(value)
+        else:
+            fields[child.tag] = [previous, value]
+    return fields
+
+
+def flatten(fields: dict, prefix: str="", out: dict=None) -> dict:
+    """flatten nested record fields into dotted column names,
+    e.g. {"BillAddress": {"City": ...}} -> {"BillAddress.City": ...}"""
+    if out is None:
+        out = {}
+    for key, value in fields.items():
+        name = prefix + key
+        if isinstance(value, dict):
+            flatten(value, name + ".", out)
+        else:
+            out[name] = value
+    return out
+
+
+def _chunks(source, chunk_size: int):
+    if isinstance(source, (str, bytes, bytearray, memoryview)):
+        for start in range(0, len(source), chunk_size):
+            yield source[start:start + chunk_size]
+    else:
+        read = source.read
+        chunk = read(chunk_size)
+        while chunk:
+            yield chunk
+            chunk = read(chunk_size)
+
+
+#================================================================
+# CLASSES
+#================================================================
+
+class ResponseStream:
+    """incremental parser for qbXML responses.
+
+    Feeds the response to an XMLPullParser in fixed size chunks and yields one
+    QBRecord per top level *Ret element and per ReportData row. Elements are
+    discarded as soon as they have been yielded, so memory stays proportional
+    to the largest single record rather than the whole response.
+
+    Args:
+        source (str | bytes | file): the response text or a binary/text file object
+        chunk_size (int): number of characters/bytes fed to the parser at once
+        factory (callable): builds the object yielded for a *Ret element from
+            (element, status). Returning None falls back to a QBRecord.
+    """
+
+    def __init__(self, source, chunk_size: int=DEFAULT_CHUNK_SIZE, factory=None) -> None:
+        self.source = source
+        self.chunk_size = chunk_size
+        self.factory = factory
+        self.statuses: list[QBStatus] = []
+
+    def __iter__(self):
+        return self.records()
+
+    def records(self):
+        if INSTRUMENTATION.enabled:
+            return INSTRUMENTATION.instrument_records(self._records(), self)
+        return self._records()
+
+    def _records(self):
+        parser = XMLPullParser(events=("start", "end"))
+        self.statuses = []
+        # element stack, report columns, current status
+        state = ([], {}, [None])
+        for chunk in _chunks(self.source, self.chunk_size):
+            parser.feed(chunk)
+            yield from self._drain(parser, state)
+        parser.close()
+
+    def _drain(self, parser, state):
+        stack, columns, current = state
+        factory = self.factory
+        for event, element in parser.read_events():
+            if event == "start":
+                if element.tag.endswith("Rs") and stack and stack[-1].tag == "QBXMLMsgsRs":
+                    current[0] = QBStatus(element.tag, dict(element.attrib))
+                    self.statuses.append(current[0])
+                    columns.clear()
+                stack.append(element)
+                continue
+            stack.pop()
+            parent = stack[-1] if stack else None
+            if parent is None:
+                continue
+            tag = element.tag
+            status = current[0]
+            if tag in REPORT_ROWS and parent.tag == "ReportData":
+                yield QBRecord(tag, self._row_fields(element, columns), status)
+            elif tag == "ColDesc":
+                columns[element.get("colID")] = self._column_title(element)
+            elif tag == "ReportRet":
+                pass
+            elif tag.endswith("Ret") and parent.tag.endswith("Rs"):
+                record = factory(element, status) if factory else None
+                yield record if record is not None else QBRecord(tag, element_to_dict(element), status)
+            else:
+                continue
+            element.clear()
+            parent.remove(element)
+
+    @staticmethod
+    def _column_title(element) -> str:
+        titles = [title.get("value") for title in element.iter("ColTitle") if title.get("value")]
+        if titles:
+            return " ".join(titles)
+        return f"Col{element.get('colID')}"
+
+    @staticmethod
+    def _row_fields(element, columns: dict) -> dict:
+        fields = {"rowNumber": element.get("rowNumber")}
+        if element.get("value") is not None:
+            fields["RowData"] = element.get("value")
+        for child in element:
+            if child.tag == "RowData":
+                fields["RowData"] = child.get("value")
+            elif child.tag == "ColData":
+                col = child.get("colID")
+                fields[columns.get(col, f"Col{col}")] = child.get("value")
+        return fields
+
+    def to_dataframe(self, batch_size: int=DEFAULT_BATCH_SIZE):
+        """build a pandas DataFrame from the records, one column batch at a time.
+
+        Args:
+            batch_size (int): number of records collected before a batch is
+                converted into a frame
+
+        Returns:
+            pandas.DataFrame: one row per record, nested fields as dotted columns
+        """
+        import pandas as pd
+
+        frames = []
+        batch = {}
+        count = 0
+        for record in self.records():
+            row = flatten(record.fields if isinstance(record, QBRecord) else record.to_dict())
+            for key, value in row.items():
+                column = batch.get(key)
+                if column is None:
+                    column = batch[key] = [None] * count
+                column.append(value)
+            count += 1
+            for column in batch.values():
+                if len(column) < count:
+                    column.append(None)
+            if count == batch_size:
+                frames.append(pd.DataFrame(batch))
+                batch = {}
+                count = 0
+        if count or not frames:
+            frames.append(pd.DataFrame(batch))
+        if len(frames) == 1:
+            return frames[0]
+        return pd.concat(frames, ignore_index=True)
+
+
+def iter_records(source, chunk_size: int=DEFAULT_CHUNK_SIZE):
+    """yield a QBRecord for every *Ret element and report row in a response."""
+    return ResponseStream(source, chunk_size).records()
+
+
+class ResponseFeeder(ResponseStream):
+    """push counterpart of ResponseStream for responses that arrive in
+    pieces, e.g. inside a SOAP message: feed() text as it comes and get the
+    records completed by it.
+
+    Args:
+        factory (callable): see ResponseStream
+    """
+
+    def __init__(self, factory=None) -> None:
+        super().__init__(None, factory=factory)
+        self._parser = XMLPullParser(events=("start", "end"))
+        self._state = ([], {}, [None])
+        self._started = False
+
+    def feed(self, chunk) -> list:
+        if not self._started:
+            chunk = chunk.lstrip()
+            if not chunk:
+                return []
+            self._started = True
+        self._parser.feed(chunk)
+        return list(self._drain(self._parser, self._state))
+
+    def close(self) -> list:
+        self._parser.close()
+        return list(self._drain(self._parser, self._state))
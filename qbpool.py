@@ -0,0 +1,300 @@
+import contextlib
+import threading
+import time
+
+from qbdesktop import MessageAggregate, QBXMLDocument, RequestProcessor
+from qbparser import ResponseStream
+from qbresilience import UNAVAILABLE, CircuitOpen, QuickBooksError
+from qbtransport import ComTransport, FILE_MODE_SINGLE_USER
+
+
+#================================================================
+#CONST
+#================================================================
+DEFAULT_POOL_SIZE = 4
+DEFAULT_MAX_IDLE = 300.0
+DEFAULT_MAX_LIFETIME = 3600.0
+DEFAULT_HEALTH_CHECK_AFTER = 30.0
+HEALTH_CHECK_REQUEST = QBXMLDocument([MessageAggregate("HostQueryRq")]).read()
+
+
+#================================================================
+# FUNCTIONS
+#================================================================
+
+def is_connection_error(exc: BaseException) -> bool:
+    """True for errors that leave a session unusable: COM errors (anything
+    carrying an hresult), OS level failures and unavailable QuickBooksErrors.
+    Failed statuses and open circuits keep the session."""
+    if isinstance(exc, QuickBooksError):
+        return exc.hresult is not None or (exc.kind == UNAVAILABLE and exc.status is None
+                                           and not isinstance(exc, CircuitOpen))
+    return (hasattr(exc, "hresult") or type(exc).__name__ == "com_error"
+            or isinstance(exc, (OSError, EOFError)))
+
+
+#================================================================
+# CLASSES
+#================================================================
+
+class PoolMetrics:
+    """counters and timings collected by a SessionPool."""
+    __slots__ = ("hits", "misses", "opened", "closed", "evictions", "health_checks",
+                 "open_time", "open_time_max", "wait_time", "wait_time_max")
+
+    def __init__(self) -> None:
+        for name in self.__slots__:
+            setattr(self, name, 0)
+
+    def as_dict(self) -> dict:
+        metrics = {name: getattr(self, name) for name in self.__slots__}
+        metrics["open_latency_avg"] = self.open_time / self.opened if self.opened else 0.0
+        acquired = self.hits + self.misses
+        metrics["wait_time_avg"] = self.wait_time / acquired if acquired else 0.0
+        return metrics
+
+
+class _Entry:
+    __slots__ = ("processor", "created", "last_used", "uses", "thread")
+
+    def __init__(self, processor: RequestProcessor, now: float) -> None:
+        self.processor = processor
+        self.created = now
+        self.last_used = now
+        self.uses = 0
+        self.thread = threading.get_ident()
+
+
+class SessionPool:
+    def __init__(self, app_name: str, transport_factory=ComTransport, company_file: str="",
+                 mode: int=FILE_MODE_SINGLE_USER, max_size: int=DEFAULT_POOL_SIZE,
+                 max_idle: float=DEFAULT_MAX_IDLE, max_lifetime: float=DEFAULT_MAX_LIFETIME,
+                 health_check_after: float=DEFAULT_HEALTH_CHECK_AFTER, evict_on=is_connection_error,
+                 resilience=None, thread_affine: bool=None) -> None:
+        """keeps a bounded number of open connection + session ticket pairs warm
+        so jobs do not pay OpenConnection/BeginSession every time.
+
+        Sessions are lent out as RequestProcessor objects through session().
+        A session idle for longer than health_check_after is checked with a
+        HostQueryRq before it is handed out; sessions past max_idle or
+        max_lifetime, failing the check or raising an error accepted by
+        evict_on are closed and replaced by a fresh one on the next request.
+
+        The QuickBooks COM objects are apartment threaded, so with
+        thread_affine a session is only lent to the thread that opened it.
+        When the pool is full and only other threads' sessions are idle, the
+        least recently used of them is closed to make room. Threads that end
+        while the pool lives on, e.g. workers of a parallel job, call
+        close_thread_sessions() before they CoUninitialize.
+
+        Args:
+            app_name (str): application name passed to OpenConnection
+            transport_factory (callable): returns a new Transport per connection
+            company_file (str): company file to open, "" for the open one
+            mode (int): QBFileMode passed to BeginSession
+            max_size (int): maximum number of open sessions
+            max_idle (float): seconds an unused session is kept open
+            max_lifetime (float): seconds after which a session is always reopened
+            health_check_after (float): idle seconds before a health check, None to disable
+            evict_on (callable): predicate deciding whether an exception raised
+                while a session is lent out should discard the session
+            resilience (Resilience): retry and throttling policy shared by
+                every session, see qbresilience
+            thread_affine (bool): lend sessions only to the thread that opened
+                them, by default when the transport is ComTransport
+        """
+        self.app_name = app_name
+        self.transport_factory = transport_factory
+        self.company_file = company_file
+        self.mode = mode
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.health_check_after = health_check_after
+        self.evict_on = evict_on
+        self.resilience = resilience
+        self.thread_affine = transport_factory is ComTransport if thread_affine is None else thread_affine
+        self.metrics = PoolMetrics()
+        self._idle: list[_Entry] = []
+        self._lent: dict[int, _Entry] = {}
+        self._size = 0
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def idle(self) -> int:
+        return len(self._idle)
+
+    @contextlib.contextmanager
+    def session(self, timeout: float=None):
+        """lend a session for the duration of a with block.
+
+        Args:
+            timeout (float): seconds to wait for a free session, None waits forever
+
+        Raises:
+            TimeoutError: no session became available in time
+        """
+        processor = self.acquire(timeout)
+        try:
+            yield processor
+        except BaseException as e:
+            self.release(processor, broken=self.evict_on(e))
+            raise
+        else:
+            self.release(processor)
+
+    def acquire(self, timeout: float=None) -> RequestProcessor:
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+        while True:
+            entry, stale = self._checkout(deadline)
+            for old in stale:
+                self._close(old)
+            if entry is None:
+                entry = self._open()
+                with self._condition:
+                    self.metrics.misses += 1
+            elif not self._healthy(entry):
+                self._discard(entry)
+                continue
+            else:
+                with self._condition:
+                    self.metrics.hits += 1
+            waited = time.monotonic() - start
+            with self._condition:
+                self.metrics.wait_time += waited
+                self.metrics.wait_time_max = max(self.metrics.wait_time_max, waited)
+                entry.uses += 1
+                self._lent[id(entry.processor)] = entry
+            return entry.processor
+
+    def release(self, processor: RequestProcessor, broken: bool=False) -> None:
+        with self._condition:
+            entry = self._lent.pop(id(processor))
+            now = time.monotonic()
+            if broken:
+                self.metrics.evictions += 1
+            elif not self._closed and now - entry.created < self.max_lifetime:
+                entry.last_used = now
+                self._idle.append(entry)
+                self._condition.notify()
+                return
+        self._discard(entry)
+
+    def close(self) -> None:
+        """close every idle session. Lent sessions are closed when released."""
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._condition.notify_all()
+        for entry in idle:
+            self._discard(entry)
+
+    def close_thread_sessions(self) -> None:
+        """close the idle sessions opened on the calling thread."""
+        thread = threading.get_ident()
+        with self._condition:
+            mine = [entry for entry in self._idle if entry.thread == thread]
+            self._idle = [entry for entry in self._idle if entry.thread != thread]
+        for entry in mine:
+            self._discard(entry)
+
+    def _checkout(self, deadline: float) -> tuple:
+        stale = []
+        thread = threading.get_ident()
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise RuntimeError("session pool is closed")
+                now = time.monotonic()
+                for index in range(len(self._idle) - 1, -1, -1):
+                    entry = self._idle[index]
+                    if now - entry.last_used >= self.max_idle or now - entry.created >= self.max_lifetime:
+                        del self._idle[index]
+                        self._size -= 1
+                        stale.append(entry)
+                        # the slot is free now, a waiter may open a new session in it
+                        self._condition.notify()
+                    elif not self.thread_affine or entry.thread == thread:
+                        del self._idle[index]
+                        return entry, stale
+                if self._size >= self.max_size and self._idle:
+                    # full, but the idle sessions belong to other threads
+                    stale.append(self._idle.pop(0))
+                    self._size -= 1
+                if self._size < self.max_size:
+                    self._size += 1
+                    return None, stale
+                remaining = None if deadline is None else deadline - now
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError("no QuickBooks session available after waiting")
+                self._condition.wait(remaining)
+
+    def _open(self) -> _Entry:
+        start = time.monotonic()
+        connected = False
+        try:
+            processor = RequestProcessor(self.app_name, self.transport_factory(), self.company_file, self.mode,
+                                         resilience=self.resilience)
+            processor.open_connection()
+            connected = True
+            processor.begin_session()
+        except BaseException:
+            if connected:
+                try:
+                    processor.close_connection()
+                except Exception:
+                    pass
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+        now = time.monotonic()
+        with self._condition:
+            self.metrics.opened += 1
+            self.metrics.open_time += now - start
+            self.metrics.open_time_max = max(self.metrics.open_time_max, now - start)
+        return _Entry(processor, now)
+
+    def _healthy(self, entry: _Entry) -> bool:
+        if self.health_check_after is None or time.monotonic() - entry.last_used < self.health_check_after:
+            return True
+        with self._condition:
+            self.metrics.health_checks += 1
+        try:
+            stream = ResponseStream(entry.processor.process_request(HEALTH_CHECK_REQUEST))
+            for _ in stream:
+                pass
+        except Exception:
+            with self._condition:
+                self.metrics.evictions += 1
+            return False
+        return True
+
+    def _discard(self, entry: _Entry) -> None:
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+        self._close(entry)
+
+    def _close(self, entry: _Entry) -> None:
+        processor = entry.processor
+        with self._condition:
+            self.metrics.closed += 1
+        try:
+            if processor.ticket is not None:
+                processor.end_session()
+            processor.close_connection()
+        except Exception:
+            pass
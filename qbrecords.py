@@ -0,0 +1,331 @@
+import datetime
+import weakref
+from decimal import Decimal
+from sys import intern
+
+from qbparser import ResponseStream, DEFAULT_CHUNK_SIZE, element_to_dict
+
+
+#================================================================
+#CONST
+#================================================================
+INTERN_MAX_LENGTH = 16
+
+
+#================================================================
+# CONVERTERS
+#================================================================
+
+def _bool(value: str) -> bool:
+    return value == "true"
+
+
+def _datetime(value: str) -> datetime.datetime:
+    return datetime.datetime.fromisoformat(value)
+
+
+CONVERTERS = {
+    "str": None,
+    "int": int,
+    "decimal": Decimal,
+    "bool": _bool,
+    "date": datetime.date.fromisoformat,
+    "datetime": _datetime,
+}
+
+
+#================================================================
+# REFS
+#================================================================
+
+class Ref:
+    """a ListID/FullName reference such as CustomerRef or ItemRef. Equal refs
+    are interned, so thousands of invoice lines pointing at the same item share
+    one object."""
+    __slots__ = ("ListID", "FullName", "__weakref__")
+
+    def __init__(self, list_id: str=None, full_name: str=None) -> None:
+        self.ListID = list_id
+        self.FullName = full_name
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Ref) and (self.ListID, self.FullName) == (other.ListID, other.FullName)
+
+    def __hash__(self) -> int:
+        return hash((self.ListID, self.FullName))
+
+    def __repr__(self) -> str:
+        return f"Ref({self.ListID!r}, {self.FullName!r})"
+
+    def to_dict(self) -> dict:
+        return {key: value for key, value in (("ListID", self.ListID), ("FullName", self.FullName)) if value is not None}
+
+
+_refs = weakref.WeakValueDictionary()
+
+
+def intern_ref(list_id: str, full_name: str) -> Ref:
+    key = (list_id, full_name)
+    ref = _refs.get(key)
+    if ref is None:
+        ref = _refs[key] = Ref(list_id, full_name)
+    return ref
+
+
+#================================================================
+# RECORDS
+#================================================================
+
+class LazyField:
+    """descriptor in front of a slot holding the raw qbXML text. The text is
+    converted on first access and the converted value replaces it."""
+    __slots__ = ("slot", "convert")
+
+    def __init__(self, slot, convert) -> None:
+        self.slot = slot
+        self.convert = convert
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        value = self.slot.__get__(obj, owner)
+        if value.__class__ is str and self.convert is not None:
+            value = self.convert(value)
+            self.slot.__set__(obj, value)
+        return value
+
+    def __set__(self, obj, value) -> None:
+        self.slot.__set__(obj, value)
+
+
+class RetRecord:
+    """base class of the generated record classes. Subclasses have one slot
+    per known field; unknown children end up in extra as raw dicts, repeated
+    ones as lists, like qbparser.element_to_dict. Short
+    values (flags, states, amounts) are interned when a record is built."""
+    __slots__ = ("_extra",)
+    tag = None
+    fields: tuple = ()
+    _spec: dict = {}
+
+    def __init__(self, **values) -> None:
+        for name in self.fields:
+            setattr(self, name, values.pop(name, None))
+        self._extra = values or None
+
+    @classmethod
+    def from_element(cls, element) -> "RetRecord":
+        record = cls.__new__(cls)
+        spec = cls._spec
+        values = dict.fromkeys(cls.fields)
+        extra = None
+        for child in element:
+            tag = child.tag
+            kind = spec.get(tag)
+            if kind is None:
+                if extra is None:
+                    extra = {}
+                value = _raw(child)
+                previous = extra.get(tag)
+                if previous is None and tag not in extra:
+                    extra[tag] = value
+                elif previous.__class__ is list:
+                    previous.append(value)
+                else:
+                    extra[tag] = [previous, value]
+            elif kind == "ref":
+                values[tag] = intern_ref(child.findtext("ListID"), child.findtext("FullName"))
+            elif isinstance(kind, list):
+                if values[tag] is None:
+                    values[tag] = []
+                values[tag].append(kind[0].from_element(child))
+            elif isinstance(kind, type):
+                values[tag] = kind.from_element(child)
+            else:
+                text = child.text
+                if text is not None and len(text) <= INTERN_MAX_LENGTH:
+                    text = intern(text)
+                values[tag] = text
+        for name, value in values.items():
+            if value.__class__ is list:
+                value = tuple(value)
+            object.__setattr__(record, "_" + name, value)
+        record._extra = extra
+        return record
+
+    @property
+    def extra(self) -> dict:
+        return self._extra or {}
+
+    def to_dict(self) -> dict:
+        out = {}
+        for name in self.fields:
+            value = getattr(self, name)
+            if value is None:
+                continue
+            if isinstance(value, (RetRecord, Ref)):
+                value = value.to_dict()
+            elif isinstance(value, tuple):
+                value = [item.to_dict() for item in value]
+            out[name] = value
+        out.update(self.extra)
+        return out
+
+    def __repr__(self) -> str:
+        key = getattr(self, "ListID", None) or getattr(self, "TxnID", None) or getattr(self, "FullName", None)
+        return f"{type(self).__name__}({key!r})"
+
+
+def _raw(element):
+    if len(element):
+        return element_to_dict(element)
+    return element.text
+
+
+def define_record(tag: str, spec: dict) -> type:
+    """generate a compact record class.
+
+    Args:
+        tag (str): element name, e.g. CustomerRet
+        spec (dict): field name -> "str", "int", "decimal", "bool", "date",
+            "datetime", "ref", a record class for a nested aggregate or
+            [record class] for a repeated one
+
+    Returns:
+        type: RetRecord subclass with __slots__ and lazy converting fields
+    """
+    fields = tuple(spec)
+    cls = type(tag, (RetRecord,), {"__slots__": tuple("_" + name for name in fields)})
+    cls.tag = tag
+    cls.fields = fields
+    cls._spec = spec
+    for name, kind in spec.items():
+        convert = CONVERTERS.get(kind) if isinstance(kind, str) else None
+        setattr(cls, name, LazyField(cls.__dict__["_" + name], convert))
+    RECORD_TYPES[tag] = cls
+    return cls
+
+
+RECORD_TYPES: dict[str, type] = {}
+
+LIST_HEADER = {
+    "ListID": "str", "TimeCreated": "datetime", "TimeModified": "datetime", "EditSequence": "str",
+    "Name": "str", "FullName": "str", "IsActive": "bool", "ParentRef": "ref", "Sublevel": "int",
+}
+TXN_HEADER = {
+    "TxnID": "str", "TimeCreated": "datetime", "TimeModified": "datetime", "EditSequence": "str",
+    "TxnNumber": "int", "TxnDate": "date", "RefNumber": "str", "CurrencyRef": "ref",
+    "ExchangeRate": "decimal",
+}
+
+Address = define_record("Address", {
+    "Addr1": "str", "Addr2": "str", "Addr3": "str", "Addr4": "str", "Addr5": "str",
+    "City": "str", "State": "str", "PostalCode": "str", "Country": "str", "Note": "str",
+})
+SalesOrPurchase = define_record("SalesOrPurchase", {
+    "Desc": "str", "Price": "decimal", "PricePercent": "decimal", "AccountRef": "ref",
+})
+SalesAndPurchase = define_record("SalesAndPurchase", {
+    "SalesDesc": "str", "SalesPrice": "decimal", "IncomeAccountRef": "ref", "PurchaseDesc": "str",
+    "PurchaseCost": "decimal", "ExpenseAccountRef": "ref", "PrefVendorRef": "ref",
+})
+
+CustomerRet = define_record("CustomerRet", {
+    **LIST_HEADER,
+    "CompanyName": "str", "Salutation": "str", "FirstName": "str", "MiddleName": "str",
+    "LastName": "str", "BillAddress": Address, "ShipAddress": Address, "Phone": "str",
+    "AltPhone": "str", "Fax": "str", "Email": "str", "Contact": "str", "CustomerTypeRef": "ref",
+    "TermsRef": "ref", "SalesRepRef": "ref", "Balance": "decimal", "TotalBalance": "decimal",
+    "SalesTaxCodeRef": "ref", "ItemSalesTaxRef": "ref", "ResaleNumber": "str",
+    "AccountNumber": "str", "CreditLimit": "decimal", "PreferredPaymentMethodRef": "ref",
+    "JobStatus": "str", "Notes": "str", "ClassRef": "ref", "CurrencyRef": "ref",
+})
+VendorRet = define_record("VendorRet", {
+    **LIST_HEADER,
+    "CompanyName": "str", "VendorAddress": Address, "Phone": "str", "Fax": "str", "Email": "str",
+    "Contact": "str", "NameOnCheck": "str", "AccountNumber": "str", "VendorTypeRef": "ref",
+    "TermsRef": "ref", "CreditLimit": "decimal", "Balance": "decimal",
+    "IsVendorEligibleFor1099": "bool", "CurrencyRef": "ref",
+})
+AccountRet = define_record("AccountRet", {
+    **LIST_HEADER,
+    "AccountType": "str", "AccountNumber": "str", "Desc": "str", "Balance": "decimal",
+    "TotalBalance": "decimal", "CashFlowClassification": "str", "CurrencyRef": "ref",
+})
+ItemServiceRet = define_record("ItemServiceRet", {
+    **LIST_HEADER,
+    "UnitOfMeasureSetRef": "ref", "SalesTaxCodeRef": "ref", "SalesOrPurchase": SalesOrPurchase,
+    "SalesAndPurchase": SalesAndPurchase, "ClassRef": "ref",
+})
+ItemNonInventoryRet = define_record("ItemNonInventoryRet", {
+    **LIST_HEADER,
+    "ManufacturerPartNumber": "str", "UnitOfMeasureSetRef": "ref", "SalesTaxCodeRef": "ref",
+    "SalesOrPurchase": SalesOrPurchase, "SalesAndPurchase": SalesAndPurchase, "ClassRef": "ref",
+})
+ItemInventoryRet = define_record("ItemInventoryRet", {
+    **LIST_HEADER,
+    "ManufacturerPartNumber": "str", "UnitOfMeasureSetRef": "ref", "SalesTaxCodeRef": "ref",
+    "SalesDesc": "str", "SalesPrice": "decimal", "IncomeAccountRef": "ref", "PurchaseDesc": "str",
+    "PurchaseCost": "decimal", "COGSAccountRef": "ref", "PrefVendorRef": "ref",
+    "AssetAccountRef": "ref", "ReorderPoint": "decimal", "QuantityOnHand": "decimal",
+    "AverageCost": "decimal", "QuantityOnOrder": "decimal", "QuantityOnSalesOrder": "decimal",
+})
+
+InvoiceLineRet = define_record("InvoiceLineRet", {
+    "TxnLineID": "str", "ItemRef": "ref", "Desc": "str", "Quantity": "decimal",
+    "UnitOfMeasure": "str", "Rate": "decimal", "RatePercent": "decimal", "ClassRef": "ref",
+    "Amount": "decimal", "ServiceDate": "date", "SalesTaxCodeRef": "ref", "Other1": "str",
+    "Other2": "str",
+})
+InvoiceRet = define_record("InvoiceRet", {
+    **TXN_HEADER,
+    "CustomerRef": "ref", "ClassRef": "ref", "ARAccountRef": "ref", "TemplateRef": "ref",
+    "BillAddress": Address, "ShipAddress": Address, "IsPending": "bool", "PONumber": "str",
+    "TermsRef": "ref", "DueDate": "date", "SalesRepRef": "ref", "FOB": "str", "ShipDate": "date",
+    "ShipMethodRef": "ref", "Subtotal": "decimal", "ItemSalesTaxRef": "ref",
+    "SalesTaxPercentage": "decimal", "SalesTaxTotal": "decimal", "AppliedAmount": "decimal",
+    "BalanceRemaining": "decimal", "Memo": "str", "IsPaid": "bool", "CustomerMsgRef": "ref",
+    "IsToBePrinted": "bool", "IsToBeEmailed": "bool", "CustomerSalesTaxCodeRef": "ref",
+    "InvoiceLineRet": [InvoiceLineRet],
+})
+SalesReceiptLineRet = define_record("SalesReceiptLineRet", dict(InvoiceLineRet._spec))
+SalesReceiptRet = define_record("SalesReceiptRet", {
+    **TXN_HEADER,
+    "CustomerRef": "ref", "ClassRef": "ref", "TemplateRef": "ref", "BillAddress": Address,
+    "ShipAddress": Address, "IsPending": "bool", "CheckNumber": "str", "PaymentMethodRef": "ref",
+    "DueDate": "date", "SalesRepRef": "ref", "ShipDate": "date", "Subtotal": "decimal",
+    "SalesTaxTotal": "decimal", "TotalAmount": "decimal", "Memo": "str",
+    "DepositToAccountRef": "ref", "SalesReceiptLineRet": [SalesReceiptLineRet],
+})
+ExpenseLineRet = define_record("ExpenseLineRet", {
+    "TxnLineID": "str", "AccountRef": "ref", "Amount": "decimal", "Memo": "str",
+    "CustomerRef": "ref", "ClassRef": "ref",
+})
+ItemLineRet = define_record("ItemLineRet", {
+    "TxnLineID": "str", "ItemRef": "ref", "Desc": "str", "Quantity": "decimal", "Cost": "decimal",
+    "Amount": "decimal", "CustomerRef": "ref", "ClassRef": "ref",
+})
+BillRet = define_record("BillRet", {
+    **TXN_HEADER,
+    "VendorRef": "ref", "APAccountRef": "ref", "DueDate": "date", "AmountDue": "decimal",
+    "Memo": "str", "IsPaid": "bool", "OpenAmount": "decimal",
+    "ExpenseLineRet": [ExpenseLineRet], "ItemLineRet": [ItemLineRet],
+})
+
+
+#================================================================
+# FUNCTIONS
+#================================================================
+
+def make_record(element, status=None):
+    """ResponseStream factory building the typed record for known *Ret tags."""
+    cls = RECORD_TYPES.get(element.tag)
+    if cls is None:
+        return None
+    return cls.from_element(element)
+
+
+def iter_typed(source, chunk_size: int=DEFAULT_CHUNK_SIZE):
+    """like qbparser.iter_records() but yields the compact record classes for
+    known entities (CustomerRet, InvoiceRet, ...) and QBRecord for the rest."""
+    return ResponseStream(source, chunk_size, factory=make_record).records()
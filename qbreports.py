@@ -0,0 +1,406 @@
+import math
+from array import array
+from xml.parsers import expat
+
+from qbdesktop import (Element, MessageAggregate, QBAgingRequest, QBXMLDocument, QBXML_VERSION,
+                       build_nodes)
+from qbparser import DEFAULT_CHUNK_SIZE, QBStatus, _chunks
+from qbresilience import QuickBooksError
+
+
+#================================================================
+#CONST
+#================================================================
+REPORT_REQUESTS = {
+    "Aging": "AgingReportQueryRq",
+    "BudgetSummary": QBAgingRequest.BudgetSummary,
+    "CustomDetail": QBAgingRequest.CustomDetail,
+    "CustomSummary": QBAgingRequest.CustomSummary,
+    "GeneralDetail": QBAgingRequest.GeneralDetail,
+    "GeneralSummary": QBAgingRequest.GeneralSummary,
+    "Job": QBAgingRequest.Job,
+    "PayrollDetail": QBAgingRequest.PayrollDetail,
+    "PayrollSummary": QBAgingRequest.PayrollSummary,
+    "Time": QBAgingRequest.Time,
+}
+
+REPORT_TYPES = {
+    "Aging": ("APAgingDetail", "APAgingSummary", "ARAgingDetail", "ARAgingSummary", "CollectionsReport"),
+    "BudgetSummary": ("BalanceSheetBudgetOverview", "BalanceSheetBudgetVsActual",
+                      "ProfitAndLossBudgetOverview", "ProfitAndLossBudgetPerformance",
+                      "ProfitAndLossBudgetVsActual"),
+    "CustomDetail": ("CustomTxnDetail",),
+    "CustomSummary": ("CustomSummary",),
+    "GeneralDetail": ("1099Detail", "AuditTrail", "BalanceSheetDetail", "CheckDetail",
+                      "CustomerBalanceDetail", "DepositDetail", "EstimatesByJob", "ExpenseByVendorDetail",
+                      "GeneralLedger", "IncomeByCustomerDetail", "IncomeTaxDetail", "InventoryValuationDetail",
+                      "JobProgressInvoicesVsEstimates", "Journal", "MissingChecks", "OpenInvoices",
+                      "OpenPOs", "OpenPOsByJob", "OpenSalesOrderByCustomer", "OpenSalesOrderByItem",
+                      "PendingSales", "ProfitAndLossDetail", "PurchaseByItemDetail",
+                      "PurchaseByVendorDetail", "SalesByCustomerDetail", "SalesByItemDetail",
+                      "SalesByRepDetail", "TxnDetailByAccount", "TxnListByCustomer", "TxnListByDate",
+                      "TxnListByVendor", "UnpaidBillsDetail", "UnbilledCostsByJob", "VendorBalanceDetail"),
+    "GeneralSummary": ("BalanceSheetByClass", "BalanceSheetPrevYearComp", "BalanceSheetStandard",
+                       "BalanceSheetSummary", "CustomerBalanceSummary", "ExpenseByVendorSummary",
+                       "IncomeByCustomerSummary", "InventoryStockStatusByItem",
+                       "InventoryStockStatusByVendor", "IncomeTaxSummary", "InventoryValuationSummary",
+                       "PhysicalInventoryWorksheet", "ProfitAndLossByClass", "ProfitAndLossByJob",
+                       "ProfitAndLossPrevYearComp", "ProfitAndLossStandard", "ProfitAndLossYTDComp",
+                       "PurchaseByItemSummary", "PurchaseByVendorSummary", "SalesByCustomerSummary",
+                       "SalesByItemSummary", "SalesByRepSummary", "SalesTaxLiability",
+                       "SalesTaxRevenueSummary", "TrialBalance", "VendorBalanceSummary"),
+    "Job": ("ItemEstimatesVsActuals", "ItemProfitability", "JobEstimatesVsActualsDetail",
+            "JobEstimatesVsActualsSummary", "JobProfitabilityDetail", "JobProfitabilitySummary"),
+    "PayrollDetail": ("EmployeeStateTaxesDetail", "PayrollItemDetail", "PayrollReviewDetail",
+                      "PayrollTransactionDetail", "PayrollTransactionsByPayee"),
+    "PayrollSummary": ("EmployeeEarningsSummary", "PayrollLiabilityBalances", "PayrollSummary"),
+    "Time": ("TimeByItem", "TimeByJobDetail", "TimeByJobSummary", "TimeByName"),
+}
+
+ROW_TYPES = ("DataRow", "TextRow", "SubtotalRow", "TotalRow")
+DATA_ROW, TEXT_ROW, SUBTOTAL_ROW, TOTAL_ROW = range(len(ROW_TYPES))
+_ROW_CODES = {name: code for code, name in enumerate(ROW_TYPES)}
+
+NUMERIC_COL_TYPES = frozenset((
+    "Amount", "AmountDifference", "AverageCost", "Balance", "CalculatedAmount", "CostPrice",
+    "Credit", "Debit", "ExchangeRate", "Hours", "IncomeSubjectToTax", "Percent", "PercentChange",
+    "PercentOfTotal", "Price", "Quantity", "QuantityAvailable", "QuantityOnHand", "Rate",
+    "SalesPrice", "UnitPrice",
+))
+DATE_COL_TYPES = frozenset(("BilledDate", "Date", "DeliveryDate", "DueDate", "EarliestReceiptDate", "ShipDate"))
+
+
+#================================================================
+# REQUESTS
+#================================================================
+
+def build_report_request(kind: str, report_type: str, from_date: str=None, to_date: str=None,
+                         date_macro: str=None, filters: dict=None, include_columns=(),
+                         basis: str=None, version: str=QBXML_VERSION) -> str:
+    """build the qbXML request for one report.
+
+    Args:
+        kind (str): report family, a key of REPORT_REQUESTS (GeneralDetail, Aging, ...)
+        report_type (str): e.g. GeneralLedger or ProfitAndLossStandard
+        from_date (str): ReportPeriod start, YYYY-MM-DD
+        to_date (str): ReportPeriod end, YYYY-MM-DD
+        date_macro (str): ReportDateMacro used when no dates are given, e.g. ThisFiscalYear
+        filters (dict): further report elements in schema order, see build_nodes()
+        include_columns (iterable[str]): IncludeColumn values, e.g. TxnID
+        basis (str): ReportBasis, Accrual or Cash
+        version (str): qbXML version
+
+    Raises:
+        ValueError: unknown report family or type
+
+    Returns:
+        str: the request document
+    """
+    if kind not in REPORT_REQUESTS:
+        raise ValueError(f"unknown report family {kind!r}")
+    if report_type not in REPORT_TYPES[kind]:
+        raise ValueError(f"{report_type!r} is not a {kind} report")
+    nodes = [Element(f"{kind}ReportType", report_type)]
+    if from_date or to_date:
+        nodes += build_nodes({"ReportPeriod": {"FromReportDate": from_date, "ToReportDate": to_date}})
+    elif date_macro:
+        nodes.append(Element("ReportDateMacro", date_macro))
+    nodes += build_nodes(filters or {})
+    nodes += build_nodes({"IncludeColumn": list(include_columns), "ReportBasis": basis})
+    return QBXMLDocument([MessageAggregate(REPORT_REQUESTS[kind], nodes)], version).read()
+
+
+#================================================================
+# COLUMNAR REPORTS
+#================================================================
+
+def _to_float(value: str) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+class ReportColumn:
+    """one report column. Numeric columns are array('d') with NaN for empty
+    cells, the others are lists of pooled strings with None for empty cells."""
+    __slots__ = ("col_id", "title", "col_type", "numeric", "values", "missing", "_pool")
+
+    def __init__(self, col_id: str, title: str, col_type: str) -> None:
+        self.col_id = col_id
+        self.title = title
+        self.col_type = col_type
+        self.numeric = col_type in NUMERIC_COL_TYPES
+        self.values = array("d") if self.numeric else []
+        self.missing = math.nan if self.numeric else None
+        self._pool = {}
+
+    def convert(self, value: str):
+        if self.numeric:
+            return _to_float(value)
+        return self._pool.setdefault(value, value)
+
+    def __repr__(self) -> str:
+        return f"ReportColumn({self.col_id!r}, {self.title!r}, {self.col_type!r})"
+
+
+class Report:
+    """a parsed ReportRet in columnar form.
+
+    Attributes:
+        title (str): ReportTitle
+        subtitle (str): ReportSubtitle
+        basis (str): ReportBasis
+        columns (list[ReportColumn]): in ColDesc order
+        row_type (array): ROW_TYPES index of every row
+        level (array): hierarchy level of every row
+        row_number (array): rowNumber attribute of every row
+        row_data (list[str]): RowData value (DataRow) or row label (TextRow/SubtotalRow/TotalRow)
+    """
+
+    def __init__(self) -> None:
+        self.title = None
+        self.subtitle = None
+        self.basis = None
+        self.columns: list[ReportColumn] = []
+        self.row_type = array("b")
+        self.level = array("H")
+        self.row_number = array("l")
+        self.row_data: list[str] = []
+
+    def __len__(self) -> int:
+        return len(self.row_type)
+
+    def __repr__(self) -> str:
+        return f"Report({self.title!r}, rows={len(self)}, columns={len(self.columns)})"
+
+    def column(self, title: str) -> ReportColumn:
+        for column in self.columns:
+            if column.title == title or column.col_type == title:
+                return column
+        raise KeyError(title)
+
+    def extend(self, other: "Report", rows=None) -> None:
+        """append rows of a report with the same columns, e.g. another date
+        range of the same report. Row numbers continue from this report.
+
+        Args:
+            other (Report): report to copy rows from
+            rows (iterable[int]): row indexes of other to copy, all by default
+        """
+        if not self.columns and not len(self):
+            self.title, self.subtitle, self.basis = other.title, other.subtitle, other.basis
+            self.columns = [ReportColumn(column.col_id, column.title, column.col_type) for column in other.columns]
+        if rows is None:
+            rows = range(len(other))
+        pairs = [(column, other.column_by_id(column.col_id)) for column in self.columns]
+        number = self.row_number[-1] if len(self) else 0
+        for index in rows:
+            number += 1
+            self.row_type.append(other.row_type[index])
+            self.level.append(other.level[index])
+            self.row_number.append(number)
+            self.row_data.append(other.row_data[index])
+            for column, source in pairs:
+                column.values.append(source.values[index] if source is not None else column.missing)
+
+    def column_by_id(self, col_id: str) -> ReportColumn:
+        for column in self.columns:
+            if column.col_id == col_id:
+                return column
+        return None
+
+    def _names(self) -> list[str]:
+        names = []
+        for column in self.columns:
+            name = column.title or column.col_type or f"Col{column.col_id}"
+            while name in names:
+                name += f"_{column.col_id}"
+            names.append(name)
+        return names
+
+    def to_numpy(self) -> dict:
+        """columns as NumPy arrays: float64 for numeric, datetime64[D] for dates
+        and object for text, plus row_type, level, row_number and row_data."""
+        import numpy as np
+
+        arrays = {
+            "row_type": np.frombuffer(self.row_type, dtype=np.int8),
+            "level": np.frombuffer(self.level, dtype=np.uint16),
+            "row_number": np.asarray(self.row_number, dtype=np.int64),
+            "row_data": np.array(self.row_data, dtype=object),
+        }
+        for name, column in zip(self._names(), self.columns):
+            if column.numeric:
+                arrays[name] = np.frombuffer(column.values, dtype=np.float64)
+            elif column.col_type in DATE_COL_TYPES:
+                arrays[name] = np.array([value or "NaT" for value in column.values], dtype="datetime64[D]")
+            else:
+                arrays[name] = np.array(column.values, dtype=object)
+        return arrays
+
+    def to_arrow(self):
+        """the report as a pyarrow.Table."""
+        import pyarrow as pa
+
+        data = {
+            "row_type": pa.DictionaryArray.from_arrays(pa.array(self.row_type, pa.int8()), pa.array(ROW_TYPES)),
+            "level": pa.array(self.level, pa.uint16()),
+            "row_number": pa.array(self.row_number, pa.int64()),
+            "row_data": pa.array(self.row_data, pa.string()),
+        }
+        for name, column in zip(self._names(), self.columns):
+            if column.numeric:
+                data[name] = pa.array(column.values, pa.float64(), from_pandas=True)
+            elif column.col_type in DATE_COL_TYPES:
+                data[name] = pa.array(column.values, pa.string()).cast(pa.date32())
+            else:
+                data[name] = pa.array(column.values, pa.string()).dictionary_encode()
+        return pa.table(data)
+
+    def to_dataframe(self):
+        import pandas as pd
+
+        frame = pd.DataFrame(self.to_numpy())
+        frame["row_type"] = pd.Categorical.from_codes(frame["row_type"], ROW_TYPES)
+        return frame
+
+
+class _ReportHandler:
+    """expat callbacks filling Report objects. No element tree is built, so
+    memory only grows with the columns themselves."""
+
+    TEXT_FIELDS = frozenset(("ReportTitle", "ReportSubtitle", "ReportBasis", "ColType"))
+
+    def __init__(self) -> None:
+        self.finished: list[Report] = []
+        self.report = None
+        self.by_id: dict[str, ReportColumn] = {}
+        self.depth = 0
+        self.index = -1
+        self.label = None
+        self.code = None
+        self.desc = None
+        self.text = None
+
+    def start(self, tag: str, attrib: dict) -> None:
+        if tag == "ColData":
+            column = self.by_id.get(attrib.get("colID"))
+            if column is not None:
+                column.values[self.index] = column.convert(attrib.get("value"))
+        elif tag in _ROW_CODES:
+            self._begin_row(_ROW_CODES[tag], attrib)
+        elif tag == "RowData":
+            self.label = attrib.get("value")
+        elif tag in self.TEXT_FIELDS:
+            self.text = []
+        elif tag == "ColTitle":
+            if attrib.get("value"):
+                self.desc[1].append(attrib["value"])
+        elif tag == "ColDesc":
+            self.desc = [attrib.get("colID"), [], ""]
+        elif tag == "ReportRet":
+            self.report = Report()
+            self.by_id = {}
+            self.depth = 0
+        elif tag.endswith("ReportQueryRs"):
+            status = QBStatus(tag, attrib)
+            if not status.ok:
+                raise QuickBooksError.from_status(status)
+
+    def end(self, tag: str) -> None:
+        if tag in _ROW_CODES:
+            self._end_row()
+        elif self.text is not None:
+            text = "".join(self.text)
+            self.text = None
+            if tag == "ColType":
+                self.desc[2] = text
+            elif self.report is not None:
+                setattr(self.report, tag[6:].lower(), text)
+        elif tag == "ColDesc":
+            col_id, titles, col_type = self.desc
+            column = ReportColumn(col_id, " ".join(titles), col_type)
+            self.report.columns.append(column)
+            self.by_id[col_id] = column
+        elif tag == "ReportRet":
+            self.finished.append(self.report)
+            self.report = None
+
+    def characters(self, data: str) -> None:
+        if self.text is not None:
+            self.text.append(data)
+
+    def _begin_row(self, code: int, attrib: dict) -> None:
+        report = self.report
+        if code == SUBTOTAL_ROW and self.depth:
+            self.depth -= 1
+        report.row_type.append(code)
+        report.level.append(0 if code == TOTAL_ROW else self.depth)
+        report.row_number.append(int(attrib.get("rowNumber", 0)))
+        for column in report.columns:
+            column.values.append(column.missing)
+        self.index = len(report.row_type) - 1
+        self.code = code
+        self.label = attrib.get("value")
+
+    def _end_row(self) -> None:
+        report = self.report
+        label = self.label
+        if label is None and report.columns:
+            first = report.columns[0].values[self.index]
+            label = first if isinstance(first, str) else None
+        report.row_data.append(label)
+        if self.code == TEXT_ROW:
+            self.depth += 1
+
+
+def iter_reports(source, chunk_size: int=DEFAULT_CHUNK_SIZE):
+    """parse every ReportRet of a response in one streaming pass.
+
+    Column descriptors are decoded once per report and every ColData goes
+    straight into its column, without building elements for the rows.
+    Hierarchy levels follow the report layout: a TextRow opens a section,
+    the matching SubtotalRow closes it, TotalRow is always level 0.
+
+    Args:
+        source (str | bytes | file): response text or a file-like object
+        chunk_size (int): bytes fed to the parser at a time
+
+    Raises:
+        QuickBooksError: QuickBooks reported an error for a report request
+
+    Yields:
+        Report: one per ReportRet
+    """
+    handler = _ReportHandler()
+    parser = expat.ParserCreate()
+    parser.buffer_text = True
+    parser.StartElementHandler = handler.start
+    parser.EndElementHandler = handler.end
+    parser.CharacterDataHandler = handler.characters
+    for chunk in _chunks(source, chunk_size):
+        parser.Parse(chunk, False)
+        while handler.finished:
+            yield handler.finished.pop(0)
+    parser.Parse(b"", True)
+    yield from handler.finished
+
+
+def parse_report(source, chunk_size: int=DEFAULT_CHUNK_SIZE) -> Report:
+    """the first report of a response, see iter_reports()."""
+    for report in iter_reports(source, chunk_size):
+        return report
+    return Report()
+
+
+def run_report(processor, kind: str, report_type: str, **options) -> Report:
+    """build, send and parse a report request.
+
+    Args:
+        processor: anything with process_request(xml), e.g. a RequestProcessor
+        kind (str): report family, e.g. GeneralDetail
+        report_type (str): e.g. GeneralLedger
+        **options: passed on to build_report_request()
+    """
+    return parse_report(processor.process_request(build_report_request(kind, report_type, **options)))
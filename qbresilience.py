@@ -0,0 +1,483 @@
+import random
+import re
+import threading
+import time
+
+from qbmetrics import INSTRUMENTATION
+
+
+#================================================================
+#CONST
+#================================================================
+OK = "ok"
+RETRYABLE = "retryable"
+UNAVAILABLE = "unavailable"
+FATAL = "fatal"
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half-open"
+
+DEFAULT_RETRIES = 5
+DEFAULT_BACKOFF = 0.2
+DEFAULT_MAX_BACKOFF = 10.0
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_AFTER = 30.0
+DEFAULT_INITIAL_LIMIT = 4
+DEFAULT_MAX_LIMIT = 16
+DEFAULT_DECREASE = 0.75
+ERROR_RATE_SMOOTHING = 0.1
+BASELINE_DRIFT = 0.01
+
+
+def _signed(value: int) -> int:
+    return value - (1 << 32) if value >= 1 << 31 else value
+
+
+# statusCode of a message QuickBooks could not run because another user held
+# the record or list it needed; the same message usually succeeds later
+BUSY_STATUS_CODES = frozenset((3175, 3176, 3180))
+# message skipped after an earlier one in the envelope failed (stopOnError)
+STATUS_NOT_PROCESSED = 3231
+
+DISP_E_EXCEPTION = _signed(0x80020009)
+RPC_E_CALL_REJECTED = _signed(0x80010001)
+RPC_E_SERVERCALL_RETRYLATER = _signed(0x8001010A)
+RPC_E_DISCONNECTED = _signed(0x80010108)
+RPC_S_SERVER_UNAVAILABLE = _signed(0x800706BA)
+RPC_S_CALL_FAILED = _signed(0x800706BE)
+QB_E_COULD_NOT_START = _signed(0x80040408)
+QB_E_FILE_MODE = _signed(0x80040410)
+QB_E_SHARED_ACCESS = _signed(0x80040422)
+QB_E_NOT_INITIALIZED = _signed(0x80040424)
+
+# COM failures worth repeating on the same session: QuickBooks had a modal
+# dialog open or was still starting up
+RETRYABLE_HRESULTS = frozenset((RPC_E_CALL_REJECTED, RPC_E_SERVERCALL_RETRYLATER, QB_E_NOT_INITIALIZED))
+# the session or QuickBooks itself is gone, or another user holds the company
+# file in a conflicting mode; only a new session can help
+UNAVAILABLE_HRESULTS = frozenset((RPC_E_DISCONNECTED, RPC_S_SERVER_UNAVAILABLE, RPC_S_CALL_FAILED,
+                                  QB_E_COULD_NOT_START, QB_E_FILE_MODE, QB_E_SHARED_ACCESS))
+
+_STATUS_RE = re.compile(r"<(\w+Rs)\s([^>]*)>")
+_ATTR_RE = re.compile(r'(\w+)="([^"]*)"')
+
+
+#================================================================
+# ERRORS
+#================================================================
+
+class QuickBooksError(Exception):
+    """an error reported by QuickBooks: a failed statusCode in a qbXML response
+    or a COM failure of the request processor.
+
+    Args:
+        message (str): statusMessage or the COM error text
+        code (int): statusCode, None for COM failures
+        hresult (int): signed HRESULT, None for status errors
+        kind (str): RETRYABLE, UNAVAILABLE or FATAL, classified from code and hresult by default
+        status (QBStatus): the failed status, if any
+        response (str): the qbXML response the status was read from, if any
+    """
+
+    def __init__(self, message: str, code: int=None, hresult: int=None, kind: str=None, status=None,
+                 response: str=None) -> None:
+        super().__init__(message)
+        self.message = message
+        self.code = code
+        self.hresult = hresult
+        self.status = status
+        self.response = response
+        self.kind = kind or (classify_hresult(hresult) if hresult is not None else classify_code(code))
+
+    @property
+    def retryable(self) -> bool:
+        return self.kind == RETRYABLE
+
+    @classmethod
+    def from_status(cls, status) -> "QuickBooksError":
+        """error for a failed QBStatus."""
+        return cls(status.message, code=status.code, status=status)
+
+    @classmethod
+    def from_exception(cls, exc: BaseException, message: str=None) -> "QuickBooksError":
+        """error for an exception raised by a transport, keeping its HRESULT."""
+        hresult = hresult_of(exc)
+        kind = classify_exception(exc)
+        text = getattr(exc, "strerror", None) or str(exc)
+        return cls(f"{message}: {text}" if message else text, hresult=hresult, kind=kind)
+
+
+class CircuitOpen(QuickBooksError):
+    """raised without contacting QuickBooks while the circuit of a company file is open."""
+
+    def __init__(self, company_file: str, retry_after: float) -> None:
+        super().__init__(f"circuit open for company file {company_file!r}, retry in {retry_after:.1f}s",
+                         kind=UNAVAILABLE)
+        self.company_file = company_file
+        self.retry_after = retry_after
+
+
+#================================================================
+# CLASSIFICATION
+#================================================================
+
+def hresult_of(exc: BaseException) -> int:
+    """signed HRESULT of a COM error, None for other exceptions. QBXMLRP2
+    reports its own failures as DISP_E_EXCEPTION with the real code in excepinfo."""
+    hresult = getattr(exc, "hresult", None)
+    if hresult is None:
+        if type(exc).__name__ != "com_error" or not exc.args or not isinstance(exc.args[0], int):
+            return None
+        hresult = exc.args[0]
+    hresult = _signed(hresult & 0xFFFFFFFF)
+    if hresult == DISP_E_EXCEPTION and len(exc.args) > 2:
+        excepinfo = exc.args[2]
+        if excepinfo and len(excepinfo) > 5 and excepinfo[5]:
+            return _signed(excepinfo[5] & 0xFFFFFFFF)
+    return hresult
+
+
+def classify_code(code: int) -> str:
+    return RETRYABLE if code in BUSY_STATUS_CODES else FATAL
+
+
+def classify_hresult(hresult: int) -> str:
+    if hresult in RETRYABLE_HRESULTS:
+        return RETRYABLE
+    if hresult in UNAVAILABLE_HRESULTS:
+        return UNAVAILABLE
+    return FATAL
+
+
+def classify_exception(exc: BaseException) -> str:
+    """RETRYABLE, UNAVAILABLE or FATAL for an exception raised while sending a request."""
+    if isinstance(exc, QuickBooksError):
+        return exc.kind
+    hresult = hresult_of(exc)
+    if hresult is not None:
+        return classify_hresult(hresult)
+    if isinstance(exc, (OSError, EOFError)):
+        return UNAVAILABLE
+    return FATAL
+
+
+def response_statuses(response: str) -> list[tuple]:
+    """(element name, attributes) of every *Rs element, found without parsing the records."""
+    return [(match.group(1), dict(_ATTR_RE.findall(match.group(2))))
+            for match in _STATUS_RE.finditer(response)]
+
+
+def retryable_failure(response: str) -> QuickBooksError:
+    """the busy status that makes a whole envelope worth sending again.
+
+    An envelope is only resent when every failed message failed with a busy
+    code and nothing in it changed QuickBooks: no Add/Mod/Del message
+    succeeded and no iterator advanced. Otherwise resending would apply
+    writes twice or skip a page, and the response is left to the caller.
+
+    Returns:
+        QuickBooksError: the first busy status, with the response attached,
+        None when the response is fine or must not be resent
+    """
+    if 'statusSeverity="Error"' not in response:
+        return None
+    busy = None
+    for name, attrib in response_statuses(response):
+        if attrib.get("statusSeverity") != "Error":
+            if not name.endswith("QueryRs") or "iteratorID" in attrib:
+                return None
+            continue
+        code = int(attrib.get("statusCode", 0))
+        if code == STATUS_NOT_PROCESSED:
+            continue
+        if code not in BUSY_STATUS_CODES:
+            return None
+        if busy is None:
+            busy = QuickBooksError(attrib.get("statusMessage", ""), code=code, response=response)
+    return busy
+
+
+#================================================================
+# CLASSES
+#================================================================
+
+class AdaptiveLimit:
+    def __init__(self, initial: int=DEFAULT_INITIAL_LIMIT, minimum: int=1, maximum: int=DEFAULT_MAX_LIMIT,
+                 decrease: float=DEFAULT_DECREASE, latency_tolerance: float=None) -> None:
+        """concurrency limit for requests sharing one QuickBooks company file,
+        adjusted additive-increase/multiplicative-decrease.
+
+        Every successful answer adds 1/limit while the limit is in use, about
+        one slot per round of requests. A busy or unavailable answer
+        multiplies the limit by decrease, at most once per round: answers to
+        requests that started before the last decrease are not counted again.
+
+        Latency is ignored by default, as a health check and a large query
+        share one baseline. With latency_tolerance set, an answer slower than
+        that many times the baseline (the lowest latency seen, slowly
+        forgotten) counts as contention too; only use it for traffic of one
+        kind, e.g. a pool that runs a single paged query.
+
+        Args:
+            initial (int): starting limit
+            minimum (int): lowest limit
+            maximum (int): highest limit
+            decrease (float): factor applied on contention
+            latency_tolerance (float): latency over baseline counted as contention, None to ignore latency
+        """
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.inflight = 0
+        self.baseline = None
+        self.error_rate = 0.0
+        self.decreases = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self, timeout: float=None) -> float:
+        """wait for a free slot.
+
+        Raises:
+            TimeoutError: no slot became free in time
+
+        Returns:
+            float: token for release()
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self.inflight < int(self.limit), timeout):
+                raise TimeoutError(f"{self.inflight} QuickBooks requests in flight, limit {int(self.limit)}")
+            self.inflight += 1
+            return time.monotonic()
+
+    def release(self, token: float, outcome: str=None) -> None:
+        """free the slot taken by acquire() and learn from the outcome.
+
+        Args:
+            token (float): returned by acquire()
+            outcome (str): OK, RETRYABLE, UNAVAILABLE or FATAL, None when the
+                request was never sent
+        """
+        now = time.monotonic()
+        with self._condition:
+            saturated = self.inflight >= int(self.limit)
+            self.inflight -= 1
+            if outcome is not None:
+                self._learn(token, now, outcome, saturated)
+            self._condition.notify_all()
+
+    def _learn(self, started: float, now: float, outcome: str, saturated: bool) -> None:
+        failed = outcome in (RETRYABLE, UNAVAILABLE)
+        self.error_rate += ERROR_RATE_SMOOTHING * (failed - self.error_rate)
+        latency = now - started
+        if not failed:
+            if self.baseline is None or latency < self.baseline:
+                self.baseline = latency
+            else:
+                self.baseline += (latency - self.baseline) * BASELINE_DRIFT
+        slow = (not failed and self.latency_tolerance is not None
+                and latency > self.baseline * self.latency_tolerance)
+        if failed or slow:
+            if started >= self._last_decrease:
+                self.limit = max(float(self.minimum), self.limit * self.decrease)
+                self._last_decrease = now
+                self.decreases += 1
+        elif saturated:
+            self.limit = min(float(self.maximum), self.limit + 1 / self.limit)
+
+
+class CircuitBreaker:
+    def __init__(self, name: str="", threshold: int=DEFAULT_FAILURE_THRESHOLD,
+                 reset_after: float=DEFAULT_RESET_AFTER) -> None:
+        """stops sending to a company file after threshold requests in a row
+        failed as unavailable or stayed busy through their retries. After
+        reset_after seconds one probe request is let through: its success
+        closes the circuit, a failure opens it again.
+
+        Args:
+            name (str): company file, used in errors
+            threshold (int): consecutive failures that open the circuit
+            reset_after (float): seconds the circuit stays open
+        """
+        self.name = name
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.state = CIRCUIT_CLOSED
+        self.failures = 0
+        self.opened = 0
+        self._opened_at = 0.0
+        self._probe_at = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> None:
+        """let a request through or raise CircuitOpen. A probe that never
+        reported back is replaced after reset_after."""
+        with self._lock:
+            if self.state == CIRCUIT_CLOSED:
+                return
+            now = time.monotonic()
+            if self.state == CIRCUIT_OPEN:
+                wait = self._opened_at + self.reset_after - now
+                if wait > 0:
+                    raise CircuitOpen(self.name, wait)
+                self.state = CIRCUIT_HALF_OPEN
+            elif self._probe_at is not None and now - self._probe_at < self.reset_after:
+                raise CircuitOpen(self.name, self._probe_at + self.reset_after - now)
+            self._probe_at = now
+
+    def success(self) -> None:
+        with self._lock:
+            self.state = CIRCUIT_CLOSED
+            self.failures = 0
+            self._probe_at = None
+
+    def failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == CIRCUIT_HALF_OPEN or self.failures >= self.threshold:
+                if self.state != CIRCUIT_OPEN:
+                    self.opened += 1
+                self.state = CIRCUIT_OPEN
+                self._opened_at = time.monotonic()
+                self._probe_at = None
+
+
+class ResilienceMetrics:
+    """counters collected by a Resilience policy."""
+    __slots__ = ("requests", "attempts", "retries", "retry_wait", "failures", "rejected")
+
+    def __init__(self) -> None:
+        for name in self.__slots__:
+            setattr(self, name, 0)
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class Resilience:
+    def __init__(self, retries: int=DEFAULT_RETRIES, backoff: float=DEFAULT_BACKOFF,
+                 max_backoff: float=DEFAULT_MAX_BACKOFF, limit: AdaptiveLimit=None,
+                 threshold: int=DEFAULT_FAILURE_THRESHOLD, reset_after: float=DEFAULT_RESET_AFTER,
+                 acquire_timeout: float=None, seed: int=None) -> None:
+        """retry, throttling and circuit breaking around qbXML round trips.
+        One policy is meant to be shared by every session of a worker, e.g.
+        RequestProcessor(..., resilience=policy) for each session of a pool,
+        so the limit and the breakers see all traffic.
+
+        Busy answers (BUSY_STATUS_CODES, RETRYABLE_HRESULTS) are retried up to
+        retries times after a full-jitter delay, uniform between 0 and
+        backoff * 2 ** attempt capped at max_backoff, so workers that hit the
+        same lock do not come back in step. Envelopes are only resent under
+        the conditions of retryable_failure(). Unavailable and fatal errors
+        are raised at once as QuickBooksError, busy answers once the retries
+        are used up, as a RETRYABLE QuickBooksError whose response holds the
+        last busy response.
+
+        Args:
+            retries (int): resends of a busy request
+            backoff (float): base delay in seconds
+            max_backoff (float): longest delay in seconds
+            limit (AdaptiveLimit): shared concurrency limit, a new one by default
+            threshold (int): consecutive failures opening a company file's circuit
+            reset_after (float): seconds before an open circuit lets a probe through
+            acquire_timeout (float): seconds to wait for a slot under the limit, None waits forever
+            seed (int): seed of the jitter
+        """
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.limit = limit or AdaptiveLimit()
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.acquire_timeout = acquire_timeout
+        self.metrics = ResilienceMetrics()
+        self.breakers: dict[str, CircuitBreaker] = {}
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def breaker(self, company_file: str="") -> CircuitBreaker:
+        with self._lock:
+            breaker = self.breakers.get(company_file)
+            if breaker is None:
+                breaker = self.breakers[company_file] = CircuitBreaker(company_file, self.threshold,
+                                                                       self.reset_after)
+            return breaker
+
+    def delay(self, attempt: int) -> float:
+        """full-jitter delay before retry number attempt (1 based)."""
+        with self._lock:
+            return self.random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+    def call(self, send, request: str, company_file: str="") -> str:
+        """send(request) under the limit and the company file's breaker,
+        retrying busy answers.
+
+        Args:
+            send (callable): one round trip, returns the response
+            request (str): qbXML request
+            company_file (str): key of the circuit breaker
+
+        Raises:
+            CircuitOpen: the company file's circuit is open
+            QuickBooksError: the transport failed with an unavailable or fatal
+                error, or stayed busy after the last retry
+            TimeoutError: no slot under the limit within acquire_timeout
+
+        Returns:
+            str: the response
+        """
+        breaker = self.breaker(company_file)
+        self._add("requests")
+        attempt = 0
+        while True:
+            token = self.limit.acquire(self.acquire_timeout)
+            outcome = error = response = None
+            try:
+                if not attempt:
+                    try:
+                        breaker.allow()
+                    except CircuitOpen:
+                        self._add("rejected")
+                        self._count("circuit_rejected_total", company_file)
+                        raise
+                self._add("attempts")
+                try:
+                    response = send(request)
+                except Exception as e:
+                    error, outcome = e, classify_exception(e)
+                else:
+                    error = retryable_failure(response)
+                    outcome = OK if error is None else RETRYABLE
+            finally:
+                self.limit.release(token, outcome)
+            if error is None or outcome == FATAL:
+                breaker.success()
+            if error is None:
+                return response
+            if outcome != RETRYABLE or attempt >= self.retries:
+                if outcome != FATAL:
+                    breaker.failure()
+                self._add("failures")
+                if isinstance(error, QuickBooksError):
+                    raise error
+                if outcome == FATAL and hresult_of(error) is None:
+                    raise error
+                raise QuickBooksError.from_exception(error) from error
+            attempt += 1
+            wait = self.delay(attempt)
+            self._add("retries")
+            self._add("retry_wait", wait)
+            self._count("retries_total", company_file)
+            time.sleep(wait)
+
+    def _add(self, name: str, value: float=1) -> None:
+        with self._lock:
+            setattr(self.metrics, name, getattr(self.metrics, name) + value)
+
+    @staticmethod
+    def _count(name: str, company_file: str) -> None:
+        if INSTRUMENTATION.enabled:
+            INSTRUMENTATION.registry.inc(name, company_file=company_file)
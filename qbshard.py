@@ -0,0 +1,347 @@
+import collections
+import datetime
+import math
+import threading
+import time
+from concurrent.futures import Future
+
+from qbdesktop import MessageAggregate, Param, QBXMLDocument, QBXML_VERSION, build_nodes
+from qbparser import ResponseStream
+from qbreports import DATA_ROW, TEXT_ROW, Report, build_report_request, parse_report
+from qbresilience import FATAL, QuickBooksError, classify_exception
+
+
+#================================================================
+#CONST
+#================================================================
+DEFAULT_SHARD_ROWS = 2_000
+DEFAULT_PROBE_DAYS = 30
+DEFAULT_SHARD_RETRIES = 3
+DEFAULT_RETRY_BACKOFF = 0.5
+SHARDABLE_REQUESTS = ("TransactionQueryRq", "GeneralDetailReportQueryRq")
+# children of TransactionQueryRq in schema order; QuickBooks rejects other orders
+TRANSACTION_QUERY_ORDER = (
+    "MaxReturned", "RefNumber", "RefNumberCaseSensitive", "RefNumberFilter", "RefNumberRangeFilter",
+    "TransactionModifiedDateRangeFilter", "TransactionDateRangeFilter", "TransactionEntityFilter",
+    "TransactionAccountFilter", "TransactionItemFilter", "TransactionClassFilter", "TransactionTypeFilter",
+    "TransactionDetailLevelFilter", "TransactionPostingStatusFilter", "TransactionPaidStatusFilter",
+    "CurrencyFilter", "IncludeRetElement",
+)
+_TRANSACTION_QUERY_POSITION = {name: position for position, name in enumerate(TRANSACTION_QUERY_ORDER)}
+
+
+#================================================================
+# FUNCTIONS
+#================================================================
+
+def _date(value) -> datetime.date:
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.date.fromisoformat(value)
+
+
+def transaction_query_fields(filters: dict, from_date: str, to_date: str) -> dict:
+    """TransactionQueryRq fields for one date range, in schema order. Filters
+    the schema does not know keep their order ahead of the date range.
+
+    Args:
+        filters (dict): further query elements, see build_nodes()
+        from_date (str): FromTxnDate, YYYY-MM-DD
+        to_date (str): ToTxnDate, YYYY-MM-DD
+
+    Returns:
+        dict: fields for build_nodes()
+    """
+    fields = dict(filters)
+    fields["TransactionDateRangeFilter"] = {"FromTxnDate": from_date, "ToTxnDate": to_date}
+    known = _TRANSACTION_QUERY_POSITION
+    return dict(sorted(fields.items(), key=lambda item: known.get(item[0], -1)))
+
+
+def date_windows(from_date, to_date, days: int) -> list[tuple]:
+    """split an inclusive date range into consecutive windows of at most days days.
+
+    Returns:
+        list[tuple[datetime.date, datetime.date]]: inclusive (from, to) pairs
+    """
+    start, end = _date(from_date), _date(to_date)
+    step = datetime.timedelta(days=max(days, 1))
+    windows = []
+    while start <= end:
+        stop = min(start + step - datetime.timedelta(days=1), end)
+        windows.append((start, stop))
+        start = stop + datetime.timedelta(days=1)
+    return windows
+
+
+def plan_windows(counts: list[tuple], target_rows: int) -> list[tuple]:
+    """turn per window transaction counts into shard windows of about
+    target_rows each: dense windows are split by days, runs of sparse
+    windows are merged.
+
+    Args:
+        counts (list[tuple]): (from_date, to_date, count) in date order
+        target_rows (int): rows wanted per shard
+
+    Returns:
+        list[tuple]: (from_date, to_date, estimated_rows) in date order
+    """
+    planned = []
+    pending = None
+    for start, end, count in counts:
+        if count > target_rows:
+            if pending:
+                planned.append(pending)
+                pending = None
+            days = (end - start).days + 1
+            pieces = min(math.ceil(count / target_rows), days)
+            for piece_start, piece_end in date_windows(start, end, math.ceil(days / pieces)):
+                share = count * ((piece_end - piece_start).days + 1) / days
+                planned.append((piece_start, piece_end, round(share)))
+        elif pending and pending[2] + count <= target_rows:
+            pending = (pending[0], end, pending[2] + count)
+        else:
+            if pending:
+                planned.append(pending)
+            pending = (start, end, count)
+    if pending:
+        planned.append(pending)
+    return planned
+
+
+#================================================================
+# CLASSES
+#================================================================
+
+class Shard:
+    """one date window of a sharded query and how it went."""
+    __slots__ = ("index", "from_date", "to_date", "estimate", "attempts", "rows", "elapsed", "errors")
+
+    def __init__(self, index: int, from_date: datetime.date, to_date: datetime.date, estimate: int=None) -> None:
+        self.index = index
+        self.from_date = from_date
+        self.to_date = to_date
+        self.estimate = estimate
+        self.attempts = 0
+        self.rows = 0
+        self.elapsed = 0.0
+        self.errors: list[Exception] = []
+
+    def __repr__(self) -> str:
+        return (f"Shard({self.index}, {self.from_date.isoformat()}..{self.to_date.isoformat()}, "
+                f"rows={self.rows}, attempts={self.attempts}, elapsed={self.elapsed:.3f})")
+
+
+class ShardedQuery:
+    def __init__(self, pool, request_name: str, from_date, to_date, filters: dict=None,
+                 report_type: str="GeneralLedger", target_rows: int=DEFAULT_SHARD_ROWS,
+                 probe_days: int=DEFAULT_PROBE_DAYS, workers: int=None, retries: int=DEFAULT_SHARD_RETRIES,
+                 backoff: float=DEFAULT_RETRY_BACKOFF, version: str=QBXML_VERSION) -> None:
+        """runs one long TransactionQueryRq or GeneralDetailReportQueryRq as
+        many short date-range requests spread over the sessions of a pool.
+
+        The range is first probed with one envelope of MetaDataOnly
+        TransactionQueryRq messages, one per probe_days window, which only
+        return retCount. Dense windows are then split and sparse ones merged
+        so each shard holds about target_rows transactions; without counts
+        the probe windows are used as they are. Shards run concurrently on
+        worker threads that initialize COM and close the sessions they opened
+        before they end; a shard failing with a busy or unavailable error is
+        retried on its own with exponential backoff, and the results come back
+        in date order.
+        Rows of a shard whose TxnID already appeared in the previous shard
+        are dropped, so nothing is reported twice at window edges.
+
+        TransactionQueryRq filters are sent in the element order of the qbXML
+        schema (TRANSACTION_QUERY_ORDER) around the date range of each shard,
+        and the probe counts with the same filters.
+
+        Args:
+            pool: anything with a session() context manager lending a processor, e.g. a SessionPool
+            request_name (str): TransactionQueryRq or GeneralDetailReportQueryRq
+            from_date (str | datetime.date): first day, inclusive
+            to_date (str | datetime.date): last day, inclusive
+            filters (dict): further request elements, see build_nodes()
+            report_type (str): GeneralDetailReportType for report requests
+            target_rows (int): rows wanted per shard
+            probe_days (int): days per density probe window
+            workers (int): shards in flight, pool.max_size by default
+            retries (int): extra attempts per shard
+            backoff (float): seconds before the first retry, doubled after each
+            version (str): qbXML version
+
+        Raises:
+            ValueError: request_name cannot be sharded
+        """
+        if request_name not in SHARDABLE_REQUESTS:
+            raise ValueError(f"{request_name} cannot be sharded by date, use one of {SHARDABLE_REQUESTS}")
+        self.pool = pool
+        self.request_name = request_name
+        self.from_date = _date(from_date)
+        self.to_date = _date(to_date)
+        self.filters = filters or {}
+        self.report_type = report_type
+        self.target_rows = target_rows
+        self.probe_days = probe_days
+        self.workers = workers or getattr(pool, "max_size", 4)
+        self.retries = retries
+        self.backoff = backoff
+        self.version = version
+        self.shards: list[Shard] = []
+
+    def probe(self) -> list[tuple]:
+        """(from_date, to_date, count) per probe window, None if QuickBooks
+        did not return counts."""
+        windows = date_windows(self.from_date, self.to_date, self.probe_days)
+        filters = self.filters if self.request_name == "TransactionQueryRq" else {}
+        filters = {name: value for name, value in filters.items()
+                   if name not in ("MaxReturned", "IncludeRetElement")}
+        messages = []
+        for index, (start, end) in enumerate(windows):
+            fields = transaction_query_fields(filters, start.isoformat(), end.isoformat())
+            messages.append(MessageAggregate("TransactionQueryRq", build_nodes(fields),
+                                             params=[Param("requestID", index), Param("metaData", "MetaDataOnly")]))
+        request = QBXMLDocument(messages, self.version, on_error="continueOnError").read()
+        with self.pool.session() as processor:
+            stream = ResponseStream(processor.process_request(request))
+            for _ in stream:
+                pass
+        counts = {}
+        for status in stream.statuses:
+            if not status.ok or "retCount" not in status.attrib:
+                return None
+            counts[int(status.request_id)] = int(status.attrib["retCount"])
+        if len(counts) != len(windows):
+            return None
+        return [(start, end, counts[index]) for index, (start, end) in enumerate(windows)]
+
+    def plan(self) -> list[Shard]:
+        counts = self.probe()
+        if counts is None:
+            windows = [(start, end, None) for start, end in date_windows(self.from_date, self.to_date, self.probe_days)]
+        else:
+            windows = plan_windows(counts, self.target_rows)
+        self.shards = [Shard(index, *window) for index, window in enumerate(windows)]
+        return self.shards
+
+    def request(self, shard: Shard) -> str:
+        start, end = shard.from_date.isoformat(), shard.to_date.isoformat()
+        if self.request_name == "GeneralDetailReportQueryRq":
+            columns = list(self.filters.get("IncludeColumn", ()))
+            if "TxnID" not in columns:
+                columns.append("TxnID")
+            filters = {name: value for name, value in self.filters.items() if name != "IncludeColumn"}
+            return build_report_request("GeneralDetail", self.report_type, start, end, filters=filters,
+                                        include_columns=columns, version=self.version)
+        message = MessageAggregate(self.request_name, build_nodes(transaction_query_fields(self.filters, start, end)))
+        return QBXMLDocument([message], self.version).read()
+
+    def _fetch(self, shard: Shard):
+        request = self.request(shard)
+        started = time.perf_counter()
+        while True:
+            shard.attempts += 1
+            try:
+                with self.pool.session() as processor:
+                    response = processor.process_request(request)
+                result = self._parse(response)
+                break
+            except Exception as e:
+                shard.errors.append(e)
+                if shard.attempts > self.retries or classify_exception(e) == FATAL:
+                    raise
+                time.sleep(self.backoff * 2 ** (shard.attempts - 1))
+        shard.rows = len(result)
+        shard.elapsed = time.perf_counter() - started
+        return result
+
+    def _parse(self, response: str):
+        if self.request_name == "GeneralDetailReportQueryRq":
+            return parse_report(response)
+        stream = ResponseStream(response)
+        records = list(stream)
+        for status in stream.statuses:
+            if not status.ok:
+                raise QuickBooksError.from_status(status)
+        return records
+
+    def _results(self):
+        shards = self.plan()
+        futures = [Future() for _ in shards]
+        jobs = collections.deque(zip(shards, futures))
+        threads = [threading.Thread(target=self._work, args=(jobs,), name=f"qbxml-shard-{number}", daemon=True)
+                   for number in range(min(self.workers, len(shards)))]
+        for thread in threads:
+            thread.start()
+        try:
+            for future in futures:
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+            for thread in threads:
+                thread.join()
+
+    def _work(self, jobs: collections.deque) -> None:
+        # COM is initialized per worker thread, and the sessions it opened are
+        # closed on it before it ends (see SessionPool thread_affine)
+        try:
+            import pythoncom
+        except ImportError:
+            pythoncom = None
+        if pythoncom is not None:
+            pythoncom.CoInitialize()
+        try:
+            while True:
+                try:
+                    shard, future = jobs.popleft()
+                except IndexError:
+                    return
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    future.set_result(self._fetch(shard))
+                except BaseException as e:
+                    future.set_exception(e)
+        finally:
+            close = getattr(self.pool, "close_thread_sessions", None)
+            if close is not None:
+                close()
+            if pythoncom is not None:
+                pythoncom.CoUninitialize()
+
+    def records(self):
+        """TransactionRet records of the whole range in shard order."""
+        if self.request_name != "TransactionQueryRq":
+            raise ValueError("records() needs a TransactionQueryRq, use report() for reports")
+        previous = set()
+        for records in self._results():
+            seen = set()
+            for record in records:
+                key = record.get("TxnID")
+                if key is not None:
+                    if key in previous:
+                        continue
+                    seen.add(key)
+                yield record
+            previous = seen
+
+    def report(self) -> Report:
+        """the report of the whole range. DataRows and the TextRows opening
+        their sections (e.g. the account of a GeneralLedger) are merged;
+        SubtotalRows and TotalRows are left out, since those of a shard do not
+        add up to those of the range. Each shard repeats the sections it has
+        rows for, so a section can appear once per shard."""
+        if self.request_name != "GeneralDetailReportQueryRq":
+            raise ValueError("report() needs a GeneralDetailReportQueryRq, use records() for transactions")
+        merged = Report()
+        previous = set()
+        for report in self._results():
+            try:
+                ids = report.column("TxnID").values
+            except KeyError:
+                ids = [None] * len(report)
+            rows = [index for index in range(len(report)) if report.row_type[index] in (DATA_ROW, TEXT_ROW)]
+            merged.extend(report, [index for index in rows if ids[index] is None or ids[index] not in previous])
+            previous = {ids[index] for index in rows if ids[index] is not None}
+        return merged
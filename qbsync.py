@@ -0,0 +1,223 @@
+import datetime
+import json
+import sqlite3
+import time
+
+from qbdesktop import PagedQuery, build_nodes, MessageAggregate, QBXMLDocument
+from qbparser import ResponseStream
+from qbresilience import QuickBooksError
+from qbtransport import id_field, parse_time
+
+
+#================================================================
+#CONST
+#================================================================
+DEFAULT_SYNC_ENTITIES = (
+    "Account", "Customer", "Vendor", "Employee", "ItemService", "ItemInventory",
+    "ItemNonInventory", "Invoice", "SalesReceipt", "ReceivePayment", "Bill", "Check",
+    "JournalEntry",
+)
+DEFAULT_SYNC_PAGE_SIZE = 500
+DEFAULT_SYNC_BATCH = 1_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS marks (
+    entity TEXT PRIMARY KEY,
+    time_modified TEXT NOT NULL,
+    edit_sequence TEXT,
+    synced_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS records (
+    entity TEXT NOT NULL,
+    id TEXT NOT NULL,
+    edit_sequence TEXT,
+    time_modified TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (entity, id)
+) WITHOUT ROWID;
+"""
+
+UPSERT = """
+INSERT INTO records (entity, id, edit_sequence, time_modified, data) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (entity, id) DO UPDATE SET
+    edit_sequence = excluded.edit_sequence,
+    time_modified = excluded.time_modified,
+    data = excluded.data
+WHERE records.edit_sequence IS NOT excluded.edit_sequence
+"""
+
+
+#================================================================
+# CLASSES
+#================================================================
+
+class SyncStore:
+    def __init__(self, path: str) -> None:
+        """local SQLite copy of a company file: one row per record keyed by
+        entity and ListID/TxnID, plus the high-water mark of every entity.
+
+        Args:
+            path (str): database file, ":memory:" for a throwaway store
+        """
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def mark(self, entity: str):
+        """(TimeModified, EditSequence) of the newest record seen, or None."""
+        row = self.connection.execute(
+            "SELECT time_modified, edit_sequence FROM marks WHERE entity = ?", (entity,)).fetchone()
+        return row
+
+    def set_mark(self, entity: str, time_modified: str, edit_sequence: str) -> None:
+        self.connection.execute(
+            "INSERT OR REPLACE INTO marks VALUES (?, ?, ?, ?)",
+            (entity, time_modified, edit_sequence, datetime.datetime.now().isoformat(timespec="seconds")))
+
+    def upsert(self, entity: str, rows: list) -> int:
+        """insert or update (id, edit_sequence, time_modified, data) rows.
+        Rows whose EditSequence did not change are left alone.
+
+        Returns:
+            int: number of rows actually written
+        """
+        before = self.connection.total_changes
+        self.connection.executemany(UPSERT, ((entity,) + row for row in rows))
+        return self.connection.total_changes - before
+
+    def delete(self, entity: str, ids: list) -> int:
+        before = self.connection.total_changes
+        self.connection.executemany("DELETE FROM records WHERE entity = ? AND id = ?",
+                                    ((entity, key) for key in ids))
+        return self.connection.total_changes - before
+
+    def clear(self, entity: str) -> None:
+        self.connection.execute("DELETE FROM records WHERE entity = ?", (entity,))
+        self.connection.execute("DELETE FROM marks WHERE entity = ?", (entity,))
+
+    def get(self, entity: str, key: str) -> dict:
+        row = self.connection.execute(
+            "SELECT data FROM records WHERE entity = ? AND id = ?", (entity, key)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def records(self, entity: str):
+        for (data,) in self.connection.execute("SELECT data FROM records WHERE entity = ?", (entity,)):
+            yield json.loads(data)
+
+    def count(self, entity: str) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM records WHERE entity = ?", (entity,)).fetchone()[0]
+
+
+class SyncResult:
+    __slots__ = ("entity", "full", "received", "written", "deleted", "elapsed", "mark")
+
+    def __init__(self, entity: str, full: bool) -> None:
+        self.entity = entity
+        self.full = full
+        self.received = 0
+        self.written = 0
+        self.deleted = 0
+        self.elapsed = 0.0
+        self.mark = None
+
+    def __repr__(self) -> str:
+        return (f"SyncResult({self.entity!r}, received={self.received}, written={self.written}, "
+                f"deleted={self.deleted}, elapsed={self.elapsed:.3f})")
+
+
+class IncrementalSync:
+    def __init__(self, processor, store: SyncStore, entities=DEFAULT_SYNC_ENTITIES,
+                 page_size: int=DEFAULT_SYNC_PAGE_SIZE, batch_size: int=DEFAULT_SYNC_BATCH) -> None:
+        """keeps a SyncStore up to date with a company file.
+
+        The first run of an entity pulls everything. Later runs only ask for
+        records modified since the stored high-water mark (FromModifiedDate for
+        lists, ModifiedDateRangeFilter for transactions), upsert them by
+        ListID/TxnID and remove records reported by ListDeletedQueryRq or
+        TxnDeletedQueryRq. The mark only moves once an entity synced completely.
+
+        Args:
+            processor: anything with process_request(xml), e.g. a RequestProcessor
+            store (SyncStore): local store
+            entities (tuple[str]): entity names, e.g. Customer or Invoice
+            page_size (int): MaxReturned of the first iterator page
+            batch_size (int): records written per executemany call
+        """
+        self.processor = processor
+        self.store = store
+        self.entities = entities
+        self.page_size = page_size
+        self.batch_size = batch_size
+
+    def run(self, full: bool=False) -> list[SyncResult]:
+        return [self.sync_entity(entity, full) for entity in self.entities]
+
+    def sync_entity(self, entity: str, full: bool=False) -> SyncResult:
+        start = time.perf_counter()
+        result = SyncResult(entity, full)
+        key = id_field(entity)
+        mark = None if full else self.store.mark(entity)
+        best = (parse_time(mark[0]), mark) if mark else None
+        with self.store.connection:
+            if full:
+                self.store.clear(entity)
+            batch = []
+            for record in PagedQuery(f"{entity}QueryRq", self._filters(entity, mark),
+                                     self.page_size).records_from(self.processor):
+                fields = record.fields
+                modified = fields.get("TimeModified")
+                batch.append((fields.get(key), fields.get("EditSequence"), modified,
+                              json.dumps(fields, separators=(",", ":"))))
+                if modified:
+                    stamp = parse_time(modified)
+                    if best is None or stamp > best[0]:
+                        best = (stamp, (modified, fields.get("EditSequence")))
+                if len(batch) >= self.batch_size:
+                    result.written += self.store.upsert(entity, batch)
+                    result.received += len(batch)
+                    batch = []
+            result.written += self.store.upsert(entity, batch)
+            result.received += len(batch)
+            if mark:
+                result.deleted = self.store.delete(entity, self._deleted(entity, mark[0]))
+            if best is not None:
+                result.mark = best[1]
+                self.store.set_mark(entity, *best[1])
+        result.elapsed = time.perf_counter() - start
+        return result
+
+    @staticmethod
+    def _filters(entity: str, mark) -> dict:
+        if id_field(entity) == "ListID":
+            filters = {"ActiveStatus": "All"}
+            if mark:
+                filters["FromModifiedDate"] = mark[0]
+            return filters
+        filters = {}
+        if mark:
+            filters["ModifiedDateRangeFilter"] = {"FromModifiedDate": mark[0]}
+        filters["IncludeLineItems"] = True
+        return filters
+
+    def _deleted(self, entity: str, since: str) -> list[str]:
+        kind = "List" if id_field(entity) == "ListID" else "Txn"
+        message = MessageAggregate(f"{kind}DeletedQueryRq", build_nodes({
+            f"{kind}DelType": entity,
+            "DeletedDateRangeFilter": {"FromDeletedDate": since},
+        }))
+        stream = ResponseStream(self.processor.process_request(QBXMLDocument([message]).read()))
+        deleted = [record.fields.get(f"{kind}ID") for record in stream]
+        if stream.statuses and not stream.statuses[0].ok:
+            raise QuickBooksError.from_status(stream.statuses[0])
+        return deleted
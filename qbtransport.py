@@ -0,0 +1,636 @@
+import datetime
+import itertools
+import threading
+import time
+from xml.etree import ElementTree
+
+
+#================================================================
+#CONST
+#================================================================
+QBXMLRP2 = "QBXMLRP2.RequestProcessor"
+REQUEST_PROCESSOR_DIALOG = "QBXMLRP2UI.RequestProcessorDialog"
+WEB_CONNECTOR = "QBWebConnector.QBWebConnectorSvc"
+
+FILE_MODE_SINGLE_USER = 0
+FILE_MODE_MULTI_USER = 1
+FILE_MODE_DO_NOT_CARE = 2
+
+E_INVALIDARG = -2147024809
+RPC_E_CALL_REJECTED = -2147418111
+
+LIST_ENTITIES = frozenset((
+    "Account", "Class", "Customer", "CustomerType", "Employee", "ItemDiscount",
+    "ItemGroup", "ItemInventory", "ItemInventoryAssembly", "ItemNonInventory",
+    "ItemOtherCharge", "ItemPayment", "ItemSalesTax", "ItemService", "ItemSubtotal",
+    "OtherName", "PaymentMethod", "SalesRep", "StandardTerms", "Vendor", "VendorType",
+))
+
+STATUS_OK = (0, "Info", "Status OK")
+STATUS_NO_MATCH = (1, "Info", "A query request did not find a matching object in QuickBooks")
+STATUS_NOT_FOUND = (500, "Error", "The object specified in the request cannot be found.")
+STATUS_OUT_OF_DATE = (3200, "Error", "The provided edit sequence is out-of-date.")
+STATUS_UNSUPPORTED = (1000, "Error", "The request is not supported by the fake backend.")
+STATUS_IN_USE = (3175, "Error", "The record cannot be changed because it is in use by another user.")
+
+FAKE_EPOCH = datetime.datetime(2020, 1, 1, 8, 0, 0)
+_ATTR_ENTITIES = {'"': "&quot;"}
+
+
+#================================================================
+# FUNCTIONS
+#================================================================
+
+def escape(data: str, entities: dict=None) -> str:
+    """escape &, < and > plus any extra entities, like xml.sax.saxutils.escape
+    without importing urllib (and with it http and email) at startup."""
+    data = data.replace("&", "&amp;").replace(">", "&gt;").replace("<", "&lt;")
+    if entities:
+        for key, value in entities.items():
+            data = data.replace(key, value)
+    return data
+
+
+def id_field(entity: str) -> str:
+    """ListID for list entities, TxnID for transactions."""
+    return "ListID" if entity in LIST_ENTITIES or entity.startswith("Item") else "TxnID"
+
+
+def parse_time(value: str) -> datetime.datetime:
+    """parse a qbXML date or datetime, ignoring the UTC offset."""
+    return datetime.datetime.fromisoformat(value).replace(tzinfo=None)
+
+
+def element_fields(element) -> dict:
+    """children of a request element as a dict, repeated children as lists."""
+    fields = {}
+    for child in element:
+        value = element_fields(child) if len(child) else (child.text or "")
+        if child.tag in fields:
+            previous = fields[child.tag]
+            if not isinstance(previous, list):
+                previous = fields[child.tag] = [previous]
+            previous.append(value)
+        else:
+            fields[child.tag] = value
+    return fields
+
+
+def write_fields(out: list, fields: dict) -> None:
+    for name, value in fields.items():
+        values = value if isinstance(value, list) else (value,)
+        for item in values:
+            if isinstance(item, dict):
+                out.append(f"<{name}>")
+                write_fields(out, item)
+                out.append(f"</{name}>")
+            else:
+                out.append(f"<{name}>{escape(str(item))}</{name}>")
+
+
+#================================================================
+# CLASSES
+#================================================================
+
+class Transport:
+    """the calls every QuickBooks client class needs. Implementations are
+    handed to RequestProcessor, SessionManager, RequestProcessorDialog,
+    WebConnector and RequestAllData through their transport argument."""
+
+    def open_connection(self, app_id: str, app_name: str) -> None:
+        raise NotImplementedError
+
+    def close_connection(self) -> None:
+        raise NotImplementedError
+
+    def begin_session(self, company_file: str="", mode: int=FILE_MODE_SINGLE_USER) -> str:
+        raise NotImplementedError
+
+    def end_session(self, ticket: str) -> None:
+        raise NotImplementedError
+
+    def process_request(self, ticket: str, request: str) -> str:
+        raise NotImplementedError
+
+    def dispatch(self, prog_id: str):
+        """create a helper object such as the request processor dialog."""
+        raise NotImplementedError(f"{type(self).__name__} cannot create {prog_id}")
+
+
+class ComTransport(Transport):
+    def __init__(self, prog_id: str=QBXMLRP2) -> None:
+        """talks to QuickBooks through the QBXMLRP2 COM request processor.
+        win32com is only imported when the first COM object is created.
+
+        Args:
+            prog_id (str): request processor to dispatch, None for a transport
+                only used to create helper objects
+        """
+        self.prog_id = prog_id
+        self.qbxmlrp = self.dispatch(prog_id) if prog_id else None
+
+    def dispatch(self, prog_id: str):
+        from win32com import client
+        return client.Dispatch(prog_id)
+
+    def open_connection(self, app_id: str, app_name: str) -> None:
+        self.qbxmlrp.OpenConnection(app_id, app_name)
+
+    def close_connection(self) -> None:
+        self.qbxmlrp.CloseConnection()
+
+    def begin_session(self, company_file: str="", mode: int=FILE_MODE_SINGLE_USER) -> str:
+        return self.qbxmlrp.BeginSession(company_file, mode)
+
+    def end_session(self, ticket: str) -> None:
+        self.qbxmlrp.EndSession(ticket)
+
+    def process_request(self, ticket: str, request: str) -> str:
+        return self.qbxmlrp.ProcessRequest(ticket, request)
+
+
+class FakeComError(Exception):
+    """raised by the fake backend where COM would raise pywintypes.com_error.
+    args follow the com_error layout: (hresult, message, excepinfo, argerror)."""
+
+    def __init__(self, hresult: int, message: str) -> None:
+        super().__init__(hresult, message, None, None)
+        self.hresult = hresult
+        self.strerror = message
+
+
+class FakeQuickBooks(Transport):
+    def __init__(self, latency: float=0.0, latency_per_record: float=0.0, seed: int=0,
+                 latency_exponent: float=1.0) -> None:
+        """pure Python stand-in for QuickBooks holding an in-memory company.
+
+        Answers <Entity>QueryRq (with iterators, MaxReturned, ListID/TxnID,
+        FullName/RefNumber, ActiveStatus, modified date and TxnDate filters),
+        <Entity>AddRq, <Entity>ModRq (EditSequence checked), ListDelRq and
+        TxnDelRq, ListDeletedQueryRq and TxnDeletedQueryRq, TransactionQueryRq
+        (TransactionDateRangeFilter) and a flat GeneralDetailReportQueryRq over
+        ReportPeriod. Queries with metaData="MetaDataOnly" only return retCount.
+        Every request sleeps latency seconds plus latency_per_record for each
+        record returned, raised to latency_exponent, so throughput code can be
+        measured off Windows.
+
+        Args:
+            latency (float): simulated seconds per request
+            latency_per_record (float): simulated seconds per returned record
+            seed (int): seed for generated data and ids
+            latency_exponent (float): above 1.0 large results get slower per
+                record, like long running QuickBooks operations do
+        """
+        self.latency = latency
+        self.latency_per_record = latency_per_record
+        self.latency_exponent = latency_exponent
+        import random
+        self.random = random.Random(seed)
+        self.entities: dict[str, dict[str, dict]] = {}
+        self.iterators: dict[str, list] = {}
+        self.tickets: dict[str, str] = {}
+        self.connected = False
+        self.requests = 0
+        self.last_error = ""
+        self.deleted: list[dict] = []
+        self.fault_rate = 0.0
+        self.fault_status = STATUS_IN_USE
+        self.fault_hresult_rate = 0.0
+        self.fault_hresult = RPC_E_CALL_REJECTED
+        self.fault_contention = 0.0
+        self.faults = 0
+        self._fault_random = random.Random(seed)
+        self._inflight = 0
+        self._clock = FAKE_EPOCH
+        self._ids = itertools.count(1)
+        self._lock = threading.RLock()
+
+    #----------------------------------------------------------------
+    # transport
+    #----------------------------------------------------------------
+
+    def open_connection(self, app_id: str, app_name: str) -> None:
+        self.connected = True
+
+    def close_connection(self) -> None:
+        self.connected = False
+
+    def begin_session(self, company_file: str="", mode: int=FILE_MODE_SINGLE_USER) -> str:
+        with self._lock:
+            ticket = self._new_id()
+            self.tickets[ticket] = company_file
+        return ticket
+
+    def end_session(self, ticket: str) -> None:
+        with self._lock:
+            self.tickets.pop(ticket, None)
+
+    def process_request(self, ticket: str, request: str) -> str:
+        if ticket not in self.tickets:
+            raise FakeComError(E_INVALIDARG, "The ticket parameter is invalid.")
+        root = ElementTree.fromstring(request)
+        messages = root.find("QBXMLMsgsRq")
+        on_error = messages.get("onError", "stopOnError")
+        out = ['<?xml version="1.0" ?>\n<QBXML>\n<QBXMLMsgsRs>\n']
+        returned = 0
+        with self._lock:
+            self.requests += 1
+            self._inflight += 1
+        try:
+            with self._lock:
+                if self.fault_hresult_rate and self._fault(self.fault_hresult_rate):
+                    raise FakeComError(self.fault_hresult, "QuickBooks is busy and rejected the call.")
+                for message in messages:
+                    if (self.fault_rate or self.fault_contention) and self._fault(
+                            self.fault_rate + self.fault_contention * (self._inflight - 1)):
+                        status, records, extra = self.fault_status, [], {}
+                    else:
+                        status, records, extra = self._handle(message)
+                    returned += len(records)
+                    self._write_response(out, message, status, records, extra)
+                    if status[1] == "Error" and on_error != "continueOnError":
+                        break
+            out.append("</QBXMLMsgsRs>\n</QBXML>\n")
+            delay = self.latency + self.latency_per_record * returned ** self.latency_exponent
+            if delay:
+                time.sleep(delay)
+        finally:
+            with self._lock:
+                self._inflight -= 1
+        return "".join(out)
+
+    def inject_faults(self, rate: float=0.0, status: tuple=STATUS_IN_USE, hresult_rate: float=0.0,
+                      hresult: int=RPC_E_CALL_REJECTED, contention: float=0.0) -> "FakeQuickBooks":
+        """fail like a company file shared with other users, to exercise retry
+        and throttling code.
+
+        Every message fails with status with probability rate plus contention
+        for every other request in flight, so more concurrent clients see more
+        lock errors. A whole request raises FakeComError(hresult) before any
+        message runs with probability hresult_rate.
+        Messages before a failed one still run, as they do in QuickBooks.
+
+        Args:
+            rate (float): chance of a failed message
+            status (tuple): (statusCode, statusSeverity, statusMessage) of the failure
+            hresult_rate (float): chance of a failed request
+            hresult (int): HRESULT of the failed request
+            contention (float): extra chance per concurrent request
+        """
+        self.fault_rate = rate
+        self.fault_status = status
+        self.fault_hresult_rate = hresult_rate
+        self.fault_hresult = hresult
+        self.fault_contention = contention
+        return self
+
+    def _fault(self, rate: float) -> bool:
+        if self._fault_random.random() < rate:
+            self.faults += 1
+            return True
+        return False
+
+    def dispatch(self, prog_id: str):
+        if prog_id == REQUEST_PROCESSOR_DIALOG:
+            return FakeRequestProcessorDialog(self)
+        if prog_id == WEB_CONNECTOR:
+            return FakeWebConnectorSvc(self)
+        return super().dispatch(prog_id)
+
+    #----------------------------------------------------------------
+    # data
+    #----------------------------------------------------------------
+
+    def _new_id(self) -> str:
+        value = f"{self.random.getrandbits(128):032x}"
+        return f"{value[:8]}-{value[8:12]}-{value[12:16]}-{value[16:20]}-{value[20:]}"
+
+    def _tick(self) -> str:
+        self._clock += datetime.timedelta(seconds=1)
+        return self._clock.isoformat()
+
+    def add(self, entity: str, fields: dict) -> dict:
+        """store a new record and return it with ids, times and EditSequence set."""
+        with self._lock:
+            now = self._tick()
+            number = next(self._ids)
+            record = {
+                id_field(entity): f"{number:X}-{1000000000 + number}",
+                "TimeCreated": now,
+                "TimeModified": now,
+                "EditSequence": str(1000000000 + number),
+            }
+            for name, value in fields.items():
+                if isinstance(value, list) and name.endswith("Add"):
+                    name = name[:-3] + "Ret"
+                    value = [dict({"TxnLineID": f"{number:X}-{i + 1}"}, **line) for i, line in enumerate(value)]
+                elif isinstance(value, dict) and name.endswith("LineAdd"):
+                    name = name[:-3] + "Ret"
+                    value = [dict({"TxnLineID": f"{number:X}-1"}, **value)]
+                record[name] = value
+            self.entities.setdefault(entity, {})[record[id_field(entity)]] = record
+            return record
+
+    def generate(self, customers: int=0, items: int=0, invoices: int=0, lines: int=3,
+                 start: datetime.date=datetime.date(2020, 1, 1), days: int=365) -> "FakeQuickBooks":
+        """fill the company with reproducible synthetic customers, service items
+        and invoices spread over days days from start."""
+        rnd = self.random
+        for i in range(customers):
+            self.add("Customer", {
+                "Name": f"Customer {i:06d}", "FullName": f"Customer {i:06d}", "IsActive": "true",
+                "CompanyName": f"Company {i:06d}",
+                "BillAddress": {"Addr1": f"{rnd.randint(1, 9999)} Main St", "City": "Springfield",
+                                "State": "IL", "PostalCode": f"{rnd.randint(10000, 99999)}"},
+                "Phone": f"555-{rnd.randint(1000, 9999)}", "Balance": "0.00",
+            })
+        for i in range(items):
+            self.add("ItemService", {
+                "Name": f"Item {i:05d}", "FullName": f"Item {i:05d}", "IsActive": "true",
+                "SalesOrPurchase": {"Desc": f"Service {i}", "Price": f"{rnd.randint(5, 500)}.00"},
+            })
+        customer_refs = [{"ListID": r["ListID"], "FullName": r["FullName"]}
+                         for r in self.entities.get("Customer", {}).values()]
+        item_refs = [{"ListID": r["ListID"], "FullName": r["FullName"]}
+                     for r in self.entities.get("ItemService", {}).values()]
+        for i in range(invoices):
+            invoice_lines = []
+            for _ in range(lines):
+                quantity = rnd.randint(1, 10)
+                rate = rnd.randint(5, 500)
+                invoice_lines.append({
+                    "ItemRef": rnd.choice(item_refs) if item_refs else {"FullName": "Services"},
+                    "Desc": "Synthetic line", "Quantity": str(quantity),
+                    "Rate": f"{rate}.00", "Amount": f"{quantity * rate}.00",
+                })
+            self.add("Invoice", {
+                "CustomerRef": rnd.choice(customer_refs) if customer_refs else {"FullName": "Cash"},
+                "TxnDate": (start + datetime.timedelta(days=rnd.randrange(days))).isoformat(),
+                "RefNumber": str(10000 + i),
+                "Subtotal": f"{sum(int(line['Amount'][:-3]) for line in invoice_lines)}.00",
+                "InvoiceLineAdd": invoice_lines,
+            })
+        return self
+
+    #----------------------------------------------------------------
+    # requests
+    #----------------------------------------------------------------
+
+    def _handle(self, message) -> tuple:
+        tag = message.tag
+        if tag in ("ListDelRq", "TxnDelRq"):
+            return self._delete(message)
+        if tag in ("ListDeletedQueryRq", "TxnDeletedQueryRq"):
+            return self._query_deleted(message)
+        if tag.endswith("ReportQueryRq"):
+            return self._report(message)
+        if tag.endswith("QueryRq"):
+            return self._query(tag[:-7], message)
+        if tag.endswith("AddRq"):
+            entity = tag[:-5]
+            body = message.find(f"{entity}Add")
+            if body is None:
+                return STATUS_UNSUPPORTED, [], {}
+            return STATUS_OK, [(f"{entity}Ret", self.add(entity, element_fields(body)))], {}
+        if tag.endswith("ModRq"):
+            return self._modify(tag[:-5], message)
+        return STATUS_UNSUPPORTED, [], {}
+
+    def _matches(self, entity: str, record: dict, filters: dict) -> bool:
+        if "ListID" in filters or "TxnID" in filters:
+            wanted = filters.get("ListID", filters.get("TxnID"))
+            return record.get(id_field(entity)) in (wanted if isinstance(wanted, list) else [wanted])
+        if "FullName" in filters:
+            wanted = filters["FullName"]
+            return record.get("FullName") in (wanted if isinstance(wanted, list) else [wanted])
+        if "RefNumber" in filters:
+            wanted = filters["RefNumber"]
+            return record.get("RefNumber") in (wanted if isinstance(wanted, list) else [wanted])
+        active = filters.get("ActiveStatus", "ActiveOnly")
+        if "IsActive" in record and active != "All":
+            if (record["IsActive"] == "true") != (active == "ActiveOnly"):
+                return False
+        modified = filters.get("ModifiedDateRangeFilter", filters)
+        if "FromModifiedDate" in modified and parse_time(record["TimeModified"]) < parse_time(modified["FromModifiedDate"]):
+            return False
+        if "ToModifiedDate" in modified and parse_time(record["TimeModified"]) > parse_time(modified["ToModifiedDate"]):
+            return False
+        dates = filters.get("TxnDateRangeFilter", filters.get("TransactionDateRangeFilter"))
+        if dates and "TxnDate" in record:
+            if "FromTxnDate" in dates and record["TxnDate"] < dates["FromTxnDate"]:
+                return False
+            if "ToTxnDate" in dates and record["TxnDate"] > dates["ToTxnDate"]:
+                return False
+        return True
+
+    def _entity_names(self, entity: str) -> list:
+        if entity == "Item":
+            return [name for name in self.entities if name.startswith("Item")]
+        if entity == "Transaction":
+            return [name for name in self.entities if id_field(name) == "TxnID"]
+        return [entity]
+
+    def _select(self, entity: str, filters: dict) -> list:
+        if entity != "Transaction":
+            return [(f"{name}Ret", record) for name in self._entity_names(entity)
+                    for record in self.entities.get(name, {}).values()
+                    if self._matches(name, record, filters)]
+        records = []
+        for name in self._entity_names(entity):
+            for record in self.entities[name].values():
+                if self._matches(name, record, filters):
+                    records.append(("TransactionRet", {
+                        "TxnType": name, "TxnID": record["TxnID"], "TimeCreated": record["TimeCreated"],
+                        "TimeModified": record["TimeModified"], "EntityRef": record.get("CustomerRef", {}),
+                        "TxnDate": record.get("TxnDate"), "RefNumber": record.get("RefNumber"),
+                        "Amount": record.get("Subtotal", "0.00"),
+                    }))
+        records.sort(key=lambda pair: (pair[1]["TxnDate"] or "", pair[1]["TxnID"]))
+        return records
+
+    def _query(self, entity: str, message) -> tuple:
+        filters = element_fields(message)
+        maximum = int(filters.get("MaxReturned", 0)) or None
+        iterator = message.get("iterator")
+        if iterator == "Continue":
+            iterator_id = message.get("iteratorID")
+            pending = self.iterators.get(iterator_id)
+            if pending is None:
+                return (3170, "Error", f"Invalid iteratorID {iterator_id}"), [], {}
+        else:
+            records = self._select(entity, filters)
+            if message.get("metaData") == "MetaDataOnly":
+                return STATUS_OK, [], {"retCount": len(records)}
+            if iterator != "Start":
+                records = records[:maximum]
+                return (STATUS_OK if records else STATUS_NO_MATCH), records, {}
+            iterator_id = "{" + self._new_id() + "}"
+            pending = self.iterators[iterator_id] = records
+        page = pending[:maximum]
+        del pending[:len(page)]
+        if not pending:
+            self.iterators.pop(iterator_id, None)
+        extra = {"iteratorRemainingCount": len(pending), "iteratorID": iterator_id}
+        return (STATUS_OK if page else STATUS_NO_MATCH), page, extra
+
+    def _modify(self, entity: str, message) -> tuple:
+        body = message.find(f"{entity}Mod")
+        if body is None:
+            return STATUS_UNSUPPORTED, [], {}
+        fields = element_fields(body)
+        key = fields.pop(id_field(entity), None)
+        record = self.entities.get(entity, {}).get(key)
+        if record is None:
+            return STATUS_NOT_FOUND, [], {}
+        if fields.pop("EditSequence", None) != record["EditSequence"]:
+            return STATUS_OUT_OF_DATE, [], {}
+        record.update(fields)
+        record["TimeModified"] = self._tick()
+        record["EditSequence"] = str(int(record["EditSequence"]) + 1)
+        return STATUS_OK, [(f"{entity}Ret", record)], {}
+
+    def _delete(self, message) -> tuple:
+        kind = "List" if message.tag == "ListDelRq" else "Txn"
+        entity = message.findtext(f"{kind}DelType")
+        key = message.findtext(f"{kind}ID")
+        record = self.entities.get(entity, {}).pop(key, None)
+        if record is None:
+            return STATUS_NOT_FOUND, [], {}
+        fields = {f"{kind}DelType": entity, f"{kind}ID": key, "TimeCreated": record["TimeCreated"],
+                  "TimeDeleted": self._tick()}
+        name = "FullName" if kind == "List" else "RefNumber"
+        if name in record:
+            fields[name] = record[name]
+        self.deleted.append(fields)
+        return STATUS_OK, [(None, fields)], {}
+
+    def _query_deleted(self, message) -> tuple:
+        kind = "List" if message.tag == "ListDeletedQueryRq" else "Txn"
+        types = {element.text for element in message.iter(f"{kind}DelType")}
+        dates = element_fields(message).get("DeletedDateRangeFilter", {})
+        records = []
+        for fields in self.deleted:
+            if fields.get(f"{kind}DelType") not in types:
+                continue
+            deleted = parse_time(fields["TimeDeleted"])
+            if "FromDeletedDate" in dates and deleted < parse_time(dates["FromDeletedDate"]):
+                continue
+            if "ToDeletedDate" in dates and deleted > parse_time(dates["ToDeletedDate"]):
+                continue
+            records.append((f"{kind}DeletedRet", fields))
+        return (STATUS_OK if records else STATUS_NO_MATCH), records, {}
+
+    def _report(self, message) -> tuple:
+        if message.tag != "GeneralDetailReportQueryRq":
+            return STATUS_UNSUPPORTED, [], {}
+        period = element_fields(message).get("ReportPeriod", {})
+        filters = {"TransactionDateRangeFilter": {key.replace("Report", "Txn"): value
+                                                  for key, value in period.items()}}
+        columns = ["TxnType", "Date", "RefNumber", "Name", "Amount"]
+        if "TxnID" in {element.text for element in message.iter("IncludeColumn")}:
+            columns.insert(0, "TxnID")
+        head = [f"<ReportRet><ReportTitle>{escape(message.findtext('GeneralDetailReportType', ''))}</ReportTitle>"
+                f"<ReportBasis>Accrual</ReportBasis><NumColumns>{len(columns)}</NumColumns>"]
+        for number, name in enumerate(columns, 1):
+            head.append(f'<ColDesc colID="{number}"><ColTitle titleRow="1" value="{name}" />'
+                        f'<ColType>{name}</ColType></ColDesc>')
+        head.append("<ReportData>")
+        rows = [(None, "".join(head))]
+        total = 0.0
+        for number, (_, txn) in enumerate(self._select("Transaction", filters), 1):
+            values = {"TxnID": txn["TxnID"], "TxnType": txn["TxnType"], "Date": txn["TxnDate"],
+                      "RefNumber": txn["RefNumber"], "Name": txn["EntityRef"].get("FullName"),
+                      "Amount": txn["Amount"]}
+            total += float(txn["Amount"])
+            cells = "".join(f'<ColData colID="{col}" value="{escape(values[name], _ATTR_ENTITIES)}" />'
+                            for col, name in enumerate(columns, 1) if values[name] is not None)
+            rows.append((None, f'<DataRow rowNumber="{number}">{cells}</DataRow>'))
+        amount = columns.index("Amount") + 1
+        rows.append((None, f'<TotalRow rowNumber="{len(rows)}"><ColData colID="1" value="TOTAL" />'
+                           f'<ColData colID="{amount}" value="{total:.2f}" /></TotalRow></ReportData></ReportRet>'))
+        return STATUS_OK, rows, {}
+
+    def _write_response(self, out: list, message, status: tuple, records: list, extra: dict) -> None:
+        code, severity, text = status
+        name = message.tag[:-2] + "Rs"
+        attributes = f'statusCode="{code}" statusSeverity="{severity}" statusMessage="{escape(text)}"'
+        if message.get("requestID") is not None:
+            attributes = f'requestID="{escape(message.get("requestID"))}" ' + attributes
+        for key, value in extra.items():
+            attributes += f' {key}="{value}"'
+        out.append(f"<{name} {attributes}>")
+        for ret, record in records:
+            if ret is None:
+                if isinstance(record, str):
+                    out.append(record)
+                else:
+                    write_fields(out, record)
+                continue
+            out.append(f"<{ret}>")
+            write_fields(out, record)
+            out.append(f"</{ret}>")
+        out.append(f"</{name}>\n")
+
+
+class FakeRequestProcessorDialog:
+    """stand-in for QBXMLRP2UI.RequestProcessorDialog backed by a FakeQuickBooks."""
+
+    def __init__(self, backend: FakeQuickBooks) -> None:
+        self.backend = backend
+        self.Response = None
+        self._done = threading.Event()
+        self._ticket = None
+
+    def Reset(self) -> None:
+        self.Response = None
+        self._done.clear()
+
+    def Init(self, app_id, app_name, company_file_path) -> None:
+        self._ticket = self.backend.begin_session(company_file_path)
+
+    def Show(self, xml_request) -> None:
+        def run():
+            self.Response = self.backend.process_request(self._ticket, xml_request)
+            self._done.set()
+        threading.Thread(target=run, daemon=True).start()
+
+    def IsDone(self) -> bool:
+        return self._done.is_set()
+
+    def EndSession(self) -> None:
+        self.backend.end_session(self._ticket)
+
+
+class FakeWebConnectorSvc:
+    """stand-in for QBWebConnector.QBWebConnectorSvc backed by a FakeQuickBooks."""
+
+    def __init__(self, backend: FakeQuickBooks) -> None:
+        self.backend = backend
+        self.responses: dict[str, list] = {}
+
+    def get_Version(self) -> str:
+        return "2.3.0.215"
+
+    def get_Error(self) -> str:
+        return self.backend.last_error
+
+    def get_Ticket(self) -> str:
+        return self.backend.begin_session()
+
+    def closeConnection(self, ticket) -> str:
+        self.backend.end_session(ticket)
+        return "OK"
+
+    def processRequest(self, ticket, request, url) -> str:
+        return self.backend.process_request(ticket, request)
+
+    def receiveResponse(self, ticket, response, hresult, message, url) -> bool:
+        if hresult:
+            self.backend.last_error = message
+        self.responses.setdefault(ticket, []).append(response)
+        return not hresult
+
+    def sendRequest(self, ticket, company_file_path, qb_file_mode, request, url) -> bool:
+        response = self.backend.process_request(ticket, request)
+        self.responses.setdefault(ticket, []).append(response)
+        return True
@@ -0,0 +1,524 @@
+import asyncio
+import collections
+import itertools
+import os
+import time
+from xml.etree import ElementTree
+from xml.parsers import expat
+
+from qbdesktop import DEFAULT_BATCH_BYTES, DEFAULT_BATCH_SIZE, QBXML_VERSION, pack_envelopes
+from qbparser import ResponseFeeder
+from qbtransport import escape
+
+
+#================================================================
+#CONST
+#================================================================
+QBWC_NAMESPACE = "http://developer.intuit.com/"
+SOAP_NAMESPACE = "http://schemas.xmlsoap.org/soap/envelope/"
+SERVER_VERSION = "1.0"
+NO_WORK = "none"
+NOT_VALID_USER = "nvu"
+DONE = "done"
+DEFAULT_TICKET_TTL = 3600.0
+READ_SIZE = 64 * 1024
+E_FAIL = -2147467259
+_SEPARATOR = "|"
+# result of a method when its handler fails, per QBWC convention
+FAILED_RESULTS = {"authenticate": ["", NOT_VALID_USER], "sendRequestXML": "", "receiveResponseXML": -1,
+                  "connectionError": DONE}
+
+
+#================================================================
+# FUNCTIONS
+#================================================================
+
+def soap_envelope(body: str) -> str:
+    return ('<?xml version="1.0" encoding="utf-8"?>'
+            f'<soap:Envelope xmlns:soap="{SOAP_NAMESPACE}"><soap:Body>{body}</soap:Body></soap:Envelope>')
+
+
+def soap_call(method: str, **params) -> str:
+    """SOAP request for one QBWC method, as the Web Connector sends it."""
+    fields = "".join(f"<{name}>{escape(str(value))}</{name}>" for name, value in params.items())
+    return soap_envelope(f'<{method} xmlns="{QBWC_NAMESPACE}">{fields}</{method}>')
+
+
+def soap_result(method: str, result) -> str:
+    """SOAP response of one QBWC method; lists become string arrays."""
+    if isinstance(result, (list, tuple)):
+        value = "".join(f"<string>{escape(str(item))}</string>" for item in result)
+    else:
+        value = escape(str(result))
+    return soap_envelope(f'<{method}Response xmlns="{QBWC_NAMESPACE}">'
+                         f'<{method}Result>{value}</{method}Result></{method}Response>')
+
+
+def _local(name: str) -> str:
+    return name.rsplit(_SEPARATOR, 1)[-1]
+
+
+def _take(pending: collections.deque):
+    while pending:
+        yield pending.popleft()
+
+
+#================================================================
+# CLASSES
+#================================================================
+
+class TicketState:
+    """one Web Connector session: who it is, what is left to send and how far it got."""
+    __slots__ = ("ticket", "user", "company_file", "pending", "envelopes", "in_flight", "next_id",
+                 "total", "done", "records", "errors", "last_error", "created", "last_seen")
+
+    def __init__(self, ticket: str, user: str, company_file: str, payloads) -> None:
+        self.ticket = ticket
+        self.user = user
+        self.company_file = company_file
+        self.pending = collections.deque(payloads)
+        self.envelopes = None
+        self.in_flight = None
+        self.next_id = 0
+        self.total = len(self.pending)
+        self.done = 0
+        self.records = 0
+        self.errors = 0
+        self.last_error = ""
+        self.created = self.last_seen = time.monotonic()
+
+    @property
+    def percent(self) -> int:
+        if self.done >= self.total and not self.pending:
+            return 100
+        return min(99, self.done * 100 // max(self.total, 1))
+
+    def enqueue(self, payloads) -> None:
+        before = len(self.pending)
+        self.pending.extend(payloads)
+        self.total += len(self.pending) - before
+
+    def __repr__(self) -> str:
+        return f"TicketState({self.ticket!r}, user={self.user!r}, {self.done}/{self.total}, records={self.records})"
+
+
+class _SoapCall:
+    """expat callbacks for one SOAP request. Parameters are collected as text,
+    except the response of receiveResponseXML, which is fed to a
+    ResponseFeeder as it arrives. A response that does not parse is kept in
+    error rather than raised: after a QuickBooks failure Web Connector sends
+    an empty response, and the hresult and message that follow it explain
+    why."""
+
+    def __init__(self, server: "QBWCServer") -> None:
+        self.server = server
+        self.method = None
+        self.params = {}
+        self.depth = 0
+        self.field = None
+        self.text = []
+        self.state = None
+        self.feeder = None
+        self.error = None
+        self.parser = expat.ParserCreate(namespace_separator=_SEPARATOR)
+        self.parser.buffer_text = True
+        self.parser.StartElementHandler = self.start
+        self.parser.EndElementHandler = self.end
+        self.parser.CharacterDataHandler = self.characters
+
+    def feed(self, data: bytes, final: bool=False) -> None:
+        self.parser.Parse(data, final)
+
+    def start(self, name: str, attrib: dict) -> None:
+        self.depth += 1
+        local = _local(name)
+        if self.method is None and self.depth == 3:
+            self.method = local
+        elif self.method is not None and self.depth == 4:
+            self.field = local
+            self.text = []
+            if local == "response" and self.method == "receiveResponseXML":
+                self.state = self.server.tickets.get(self.params.get("ticket"))
+                if self.state is not None and self.state.in_flight is not None:
+                    self.feeder = ResponseFeeder()
+
+    def end(self, name: str) -> None:
+        if self.depth == 4 and self.field is not None:
+            if self.field == "response" and self.feeder is not None:
+                try:
+                    self._records(self.feeder.close())
+                except ElementTree.ParseError as e:
+                    self.error = e
+                self.feeder = None
+            else:
+                self.params[self.field] = "".join(self.text)
+            self.field = None
+        self.depth -= 1
+
+    def characters(self, data: str) -> None:
+        if self.field is None:
+            return
+        if self.field == "response" and self.feeder is not None:
+            try:
+                self._records(self.feeder.feed(data))
+            except ElementTree.ParseError as e:
+                self.error = e
+                self.feeder = None
+        elif self.field != "response":
+            self.text.append(data)
+
+    def _records(self, records: list) -> None:
+        if not records:
+            return
+        self.state.records += len(records)
+        on_record = self.server.on_record
+        if on_record is not None:
+            for record in records:
+                on_record(self.state, record)
+
+
+class QBWCServer:
+    def __init__(self, authenticate, work=None, on_record=None, on_close=None,
+                 batch_size: int=DEFAULT_BATCH_SIZE, max_bytes: int=DEFAULT_BATCH_BYTES,
+                 on_error: str="continueOnError", version: str=QBXML_VERSION,
+                 ticket_ttl: float=DEFAULT_TICKET_TTL) -> None:
+        """asyncio SOAP endpoint speaking the QuickBooks Web Connector protocol.
+
+        Web Connector polls this server: authenticate opens a ticket holding
+        the user's queue of request messages, sendRequestXML hands out the next
+        batched envelope (see pack_envelopes), receiveResponseXML streams the
+        response through a ResponseFeeder into on_record and answers with the
+        completion percentage, closeConnection drops the ticket. Tickets only
+        keep their queue and a few counters, so thousands can be open at once;
+        tickets idle for longer than ticket_ttl are dropped.
+
+        Args:
+            authenticate (callable): (user, password) -> company file path, ""
+                for the open company, or None to reject the user
+            work (callable): user -> iterable of request messages (MessageAggregate or XML)
+            on_record (callable): (TicketState, record) for every record received
+            on_close (callable): called with the TicketState when a session ends
+            batch_size (int): maximum messages per envelope
+            max_bytes (int): maximum utf-8 size of an envelope
+            on_error (str): onError attribute of the envelopes
+            version (str): qbXML version of the envelopes
+            ticket_ttl (float): seconds an idle ticket is kept
+        """
+        self.authenticator = authenticate
+        self.work = work or (lambda user: ())
+        self.on_record = on_record
+        self.on_close = on_close
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.on_error = on_error
+        self.version = version
+        self.ticket_ttl = ticket_ttl
+        self.tickets: dict[str, TicketState] = {}
+        self.requests = 0
+        self._server = None
+        self._swept = time.monotonic()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def start(self, host: str="127.0.0.1", port: int=8080) -> int:
+        """listen for Web Connector requests and return the bound port."""
+        self._server = await asyncio.start_server(self._connection, host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def enqueue(self, ticket: str, payloads) -> None:
+        """add request messages to an open session."""
+        self.tickets[ticket].enqueue(payloads)
+
+    def progress(self) -> dict:
+        """completion percentage per open ticket."""
+        return {ticket: state.percent for ticket, state in self.tickets.items()}
+
+    #----------------------------------------------------------------
+    # QBWC methods
+    #----------------------------------------------------------------
+
+    def serverVersion(self, params: dict) -> str:
+        return SERVER_VERSION
+
+    def clientVersion(self, params: dict) -> str:
+        return ""
+
+    def authenticate(self, params: dict) -> list:
+        self._sweep()
+        user = params.get("strUserName", "")
+        ticket = os.urandom(16).hex()
+        company_file = self.authenticator(user, params.get("strPassword", ""))
+        if company_file is None:
+            return [ticket, NOT_VALID_USER]
+        state = TicketState(ticket, user, company_file, self.work(user) or ())
+        if not state.total:
+            return [ticket, NO_WORK]
+        self.tickets[ticket] = state
+        return [ticket, company_file]
+
+    def sendRequestXML(self, params: dict) -> str:
+        state = self._state(params)
+        if state is None:
+            return ""
+        while True:
+            if state.envelopes is None:
+                if not state.pending:
+                    return ""
+                state.envelopes = pack_envelopes(_take(state.pending), self.batch_size, self.max_bytes,
+                                                 self.on_error, self.version, state.next_id)
+            try:
+                xml, items = next(state.envelopes)
+            except StopIteration:
+                state.envelopes = None
+                continue
+            state.in_flight = items
+            state.next_id = items[-1][0] + 1
+            return xml
+
+    def receiveResponseXML(self, params: dict) -> int:
+        state = self._state(params)
+        if state is None:
+            return -1
+        items, state.in_flight = state.in_flight or [], None
+        state.done += len(items)
+        if params.get("hresult"):
+            state.errors += 1
+            state.last_error = params.get("message", "")
+            return -1
+        return state.percent
+
+    def connectionError(self, params: dict) -> str:
+        state = self._state(params)
+        if state is not None:
+            state.last_error = params.get("message", "")
+            state.errors += 1
+        return DONE
+
+    def getLastError(self, params: dict) -> str:
+        state = self._state(params)
+        return state.last_error if state is not None else "unknown ticket"
+
+    def closeConnection(self, params: dict) -> str:
+        state = self.tickets.pop(params.get("ticket"), None)
+        if state is None:
+            return "unknown ticket"
+        if self.on_close is not None:
+            self.on_close(state)
+        return f"OK, {state.done} of {state.total} requests, {state.records} records"
+
+    def _state(self, params: dict) -> TicketState:
+        state = self.tickets.get(params.get("ticket"))
+        if state is not None:
+            state.last_seen = time.monotonic()
+        return state
+
+    def _sweep(self) -> None:
+        now = time.monotonic()
+        if now - self._swept < self.ticket_ttl / 10:
+            return
+        self._swept = now
+        for ticket in [ticket for ticket, state in self.tickets.items() if now - state.last_seen > self.ticket_ttl]:
+            state = self.tickets.pop(ticket)
+            if self.on_close is not None:
+                self.on_close(state)
+
+    #----------------------------------------------------------------
+    # HTTP
+    #----------------------------------------------------------------
+
+    async def _connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                method = line.split(b" ", 1)[0]
+                headers = {}
+                while True:
+                    header = await reader.readline()
+                    if header in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = header.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                if headers.get("expect", "").lower() == "100-continue":
+                    writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+                if method != b"POST":
+                    await self._discard(reader, headers)
+                    await self._respond(writer, "405 Method Not Allowed", b"")
+                    continue
+                if "content-length" not in headers:
+                    # the body cannot be skipped without its length, so the connection goes too
+                    await self._respond(writer, "411 Length Required", b"")
+                    break
+                body = await self._handle(reader, int(headers["content-length"]))
+                await self._respond(writer, "200 OK", body.encode("utf-8"))
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.LimitOverrunError, ValueError):
+            # a request line or header too long, or a Content-Length we cannot read
+            writer.write(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle(self, reader: asyncio.StreamReader, length: int) -> str:
+        self.requests += 1
+        call = _SoapCall(self)
+        try:
+            while length > 0:
+                chunk = await reader.read(min(READ_SIZE, length))
+                if not chunk:
+                    raise asyncio.IncompleteReadError(b"", length)
+                length -= len(chunk)
+                call.feed(chunk)
+            call.feed(b"", True)
+        except expat.ExpatError as e:
+            # the rest of the body must go, or it is read as the next request
+            await self._skip(reader, length)
+            if call.state is not None:
+                call.state.last_error = f"could not parse the response: {e}"
+                call.state.in_flight = None
+                return soap_result(call.method, -1)
+            return soap_result(call.method or "error", f"E: {e}")
+        if call.error is not None and not call.params.get("hresult"):
+            state = call.state
+            state.done += len(state.in_flight or ())
+            state.in_flight = None
+            state.errors += 1
+            state.last_error = f"could not parse the response: {call.error}"
+            return soap_result(call.method, -1)
+        handler = getattr(self, call.method or "", None)
+        if handler is None or call.method.startswith("_"):
+            return soap_result(call.method or "error", f"E: unknown method {call.method}")
+        try:
+            result = handler(call.params)
+        except Exception as e:
+            state = self.tickets.get(call.params.get("ticket"))
+            if state is not None:
+                state.last_error = f"{type(e).__name__}: {e}"
+                state.errors += 1
+            result = FAILED_RESULTS.get(call.method, f"E: {e}")
+        return soap_result(call.method, result)
+
+    @staticmethod
+    async def _discard(reader: asyncio.StreamReader, headers: dict) -> None:
+        await QBWCServer._skip(reader, int(headers.get("content-length", 0)))
+
+    @staticmethod
+    async def _skip(reader: asyncio.StreamReader, length: int) -> None:
+        while length > 0:
+            chunk = await reader.read(min(READ_SIZE, length))
+            if not chunk:
+                raise asyncio.IncompleteReadError(b"", length)
+            length -= len(chunk)
+
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, status: str, body: bytes) -> None:
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: text/xml; charset=utf-8\r\n"
+                     f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+        await writer.drain()
+
+
+class SimulatedWebConnector:
+    def __init__(self, host: str, port: int, user: str, password: str, backend, delay: float=0.0) -> None:
+        """plays the Web Connector against a QBWCServer for load tests: one
+        keep-alive HTTP connection, the QBWC call sequence, and a
+        FakeQuickBooks (or any Transport) answering the request envelopes.
+
+        Args:
+            host (str): server host
+            port (int): server port
+            user (str): strUserName sent to authenticate
+            password (str): strPassword sent to authenticate
+            backend (Transport): processes the envelopes, e.g. FakeQuickBooks
+            delay (float): seconds to wait between round trips, like QBWC does
+        """
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.backend = backend
+        self.delay = delay
+        self.round_trips = 0
+        self.progress: list[int] = []
+        self._reader = None
+        self._writer = None
+
+    async def call(self, method: str, **params):
+        """send one SOAP call and return its result: a string, or a list for string arrays."""
+        body = soap_call(method, **params).encode("utf-8")
+        self._writer.write(f"POST / HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: text/xml; charset=utf-8\r\n"
+                           f'SOAPAction: "{QBWC_NAMESPACE}{method}"\r\nContent-Length: {len(body)}\r\n\r\n'
+                           .encode("latin-1") + body)
+        await self._writer.drain()
+        self.round_trips += 1
+        await self._reader.readline()
+        length = 0
+        while True:
+            header = await self._reader.readline()
+            if header in (b"\r\n", b""):
+                break
+            name, _, value = header.decode("latin-1").partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+        root = ElementTree.fromstring(await self._reader.readexactly(length))
+        result = root.find(f".//{{{QBWC_NAMESPACE}}}{method}Result")
+        strings = result.findall(f"{{{QBWC_NAMESPACE}}}string")
+        return [item.text or "" for item in strings] if strings else (result.text or "")
+
+    async def run(self) -> int:
+        """one scheduled Web Connector run.
+
+        Returns:
+            int: the last completion percentage, -1 after an error
+        """
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            await self.call("serverVersion")
+            await self.call("clientVersion", strVersion="2.3.0.215")
+            ticket, company = (await self.call("authenticate", strUserName=self.user, strPassword=self.password))[:2]
+            if company in (NO_WORK, NOT_VALID_USER):
+                return 100 if company == NO_WORK else -1
+            session = self.backend.begin_session(company)
+            percent = 0
+            try:
+                while percent < 100:
+                    request = await self.call("sendRequestXML", ticket=ticket, strHCPResponse="",
+                                              strCompanyFileName=company, qbXMLCountry="US",
+                                              qbXMLMajorVers=13, qbXMLMinorVers=0)
+                    if not request:
+                        await self.call("getLastError", ticket=ticket)
+                        break
+                    hresult = message = ""
+                    try:
+                        response = await asyncio.to_thread(self.backend.process_request, session, request)
+                    except Exception as e:
+                        # reported like Web Connector does: no response, the HRESULT in hex
+                        code = getattr(e, "hresult", None)
+                        response, hresult = "", f"0x{(code if code is not None else E_FAIL) & 0xFFFFFFFF:08X}"
+                        message = getattr(e, "strerror", None) or str(e)
+                    percent = int(await self.call("receiveResponseXML", ticket=ticket, response=response,
+                                                  hresult=hresult, message=message))
+                    self.progress.append(percent)
+                    if percent < 0:
+                        await self.call("getLastError", ticket=ticket)
+                        break
+                    if self.delay:
+                        await asyncio.sleep(self.delay)
+            finally:
+                self.backend.end_session(session)
+            await self.call("closeConnection", ticket=ticket)
+            return percent
+        finally:
+            self._writer.close()
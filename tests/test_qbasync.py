@@ -0,0 +1,183 @@
+import asyncio
+import threading
+
+import pytest
+
+from qbasync import PRIORITY_BULK, PRIORITY_INTERACTIVE, PRIORITY_NORMAL, AsyncRequestProcessor
+from qbdesktop import RequestProcessor
+from qbtransport import Transport
+
+
+class BlockingTransport(Transport):
+    """answers every request with "<request>-ok" once the gate is open and
+    records what it was asked, in order."""
+
+    def __init__(self) -> None:
+        self.gate = threading.Event()
+        self.entered = threading.Event()
+        self.seen = []
+        self.fail = set()
+
+    def open_connection(self, app_id: str, app_name: str) -> None:
+        pass
+
+    def close_connection(self) -> None:
+        pass
+
+    def begin_session(self, company_file: str="", mode: int=0) -> str:
+        return "ticket"
+
+    def end_session(self, ticket: str) -> None:
+        pass
+
+    def process_request(self, ticket: str, request: str) -> str:
+        self.seen.append(request)
+        self.entered.set()
+        self.gate.wait(5)
+        if request in self.fail:
+            raise OSError(f"{request} failed")
+        return f"{request}-ok"
+
+
+def _processor(transport: BlockingTransport, **options) -> AsyncRequestProcessor:
+    return AsyncRequestProcessor(lambda: RequestProcessor("test", transport=transport), **options)
+
+
+async def _until(predicate, timeout: float=2.0) -> None:
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not predicate():
+        assert loop.time() < deadline, "condition not reached"
+        await asyncio.sleep(0.005)
+
+
+async def _blocked(processor: AsyncRequestProcessor, transport: BlockingTransport):
+    """occupy the worker with a request that waits for the gate."""
+    task = asyncio.ensure_future(processor.process_request("blocker"))
+    await asyncio.get_running_loop().run_in_executor(None, transport.entered.wait, 2)
+    return task
+
+
+def test_priority_order():
+    async def main():
+        transport = BlockingTransport()
+        async with _processor(transport) as processor:
+            blocker = await _blocked(processor, transport)
+            tasks = [asyncio.ensure_future(processor.process_request(name, priority))
+                     for name, priority in (("bulk", PRIORITY_BULK), ("normal", PRIORITY_NORMAL),
+                                            ("interactive", PRIORITY_INTERACTIVE), ("normal2", PRIORITY_NORMAL))]
+            await _until(lambda: processor._queue.qsize() == 4)
+            transport.gate.set()
+            results = await asyncio.gather(blocker, *tasks)
+        assert results == ["blocker-ok", "bulk-ok", "normal-ok", "interactive-ok", "normal2-ok"]
+        assert transport.seen == ["blocker", "interactive", "normal", "normal2", "bulk"]
+
+    asyncio.run(main())
+
+
+def test_backpressure_bounds_pending_requests():
+    async def main():
+        transport = BlockingTransport()
+        async with _processor(transport, max_pending=2) as processor:
+            tasks = [asyncio.ensure_future(processor.process_request(f"r{i}")) for i in range(6)]
+            await _until(lambda: transport.entered.is_set())
+            await asyncio.sleep(0.05)
+            # one request on the worker, one queued, the rest wait for a slot
+            assert processor._queue.qsize() == 1
+            assert processor._slots.locked()
+            assert transport.seen == ["r0"]
+            transport.gate.set()
+            results = await asyncio.gather(*tasks)
+        assert results == [f"r{i}-ok" for i in range(6)]
+
+    asyncio.run(main())
+
+
+def test_timeout_of_queued_request_skips_it():
+    async def main():
+        transport = BlockingTransport()
+        async with _processor(transport) as processor:
+            blocker = await _blocked(processor, transport)
+            with pytest.raises(asyncio.TimeoutError):
+                await processor.process_request("late", timeout=0.05)
+            transport.gate.set()
+            assert await blocker == "blocker-ok"
+            assert await processor.process_request("after") == "after-ok"
+        assert transport.seen == ["blocker", "after"]
+
+    asyncio.run(main())
+
+
+def test_cancel_of_queued_request_skips_it():
+    async def main():
+        transport = BlockingTransport()
+        async with _processor(transport) as processor:
+            blocker = await _blocked(processor, transport)
+            queued = asyncio.ensure_future(processor.process_request("cancelled"))
+            await _until(lambda: processor._queue.qsize() == 1)
+            queued.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await queued
+            transport.gate.set()
+            await blocker
+            assert await processor.process_request("after") == "after-ok"
+        assert transport.seen == ["blocker", "after"]
+
+    asyncio.run(main())
+
+
+def test_timeout_of_running_request_keeps_worker_usable():
+    async def main():
+        transport = BlockingTransport()
+        async with _processor(transport, max_pending=1) as processor:
+            with pytest.raises(asyncio.TimeoutError):
+                await processor.process_request("slow", timeout=0.05)
+            # the slot is released although the worker is still busy
+            assert not processor._slots.locked()
+            transport.gate.set()
+            assert await processor.process_request("next") == "next-ok"
+        assert transport.seen == ["slow", "next"]
+
+    asyncio.run(main())
+
+
+def test_timing_hooks():
+    timings = []
+
+    async def main():
+        transport = BlockingTransport()
+        transport.gate.set()
+        transport.fail.add("broken")
+        extra = []
+        async with _processor(transport, on_timing=timings.append) as processor:
+            processor.add_timing_hook(extra.append)
+            assert await processor.process_request("fine", PRIORITY_INTERACTIVE) == "fine-ok"
+            with pytest.raises(OSError):
+                await processor.process_request("broken")
+            await _until(lambda: len(timings) == 2 and len(extra) == 2)
+        return extra
+
+    extra = asyncio.run(main())
+    fine, broken = timings
+    assert extra == timings
+    assert fine.priority == PRIORITY_INTERACTIVE
+    assert fine.request_bytes == len("fine") and fine.response_bytes == len("fine-ok")
+    assert fine.queued <= fine.started <= fine.finished
+    assert fine.wait >= 0 and fine.run >= 0
+    assert fine.error is None
+    assert isinstance(broken.error, OSError) and broken.response_bytes == 0
+
+
+def test_failed_start_leaves_the_processor_stopped():
+    def broken():
+        raise OSError("QuickBooks is not running")
+
+    async def main():
+        processor = AsyncRequestProcessor(broken)
+        with pytest.raises(OSError):
+            await processor.start()
+        with pytest.raises(RuntimeError):
+            await asyncio.wait_for(processor.process_request("lost"), 1)
+        await processor.close()
+
+    asyncio.run(main())
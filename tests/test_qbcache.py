@@ -0,0 +1,65 @@
+from qbcache import CachingProcessor
+from qbdesktop import MessageAggregate, QBXMLDocument, RequestProcessor, build_nodes
+from qbparser import ResponseStream
+from qbtransport import FakeQuickBooks
+
+ITEMS = ('<?xml version="1.0" ?><QBXML><QBXMLMsgsRs>'
+         '<ItemQueryRs statusCode="0" statusSeverity="Info" statusMessage="Status OK">'
+         '<ItemServiceRet><ListID>80000001-1</ListID><TimeModified>2024-01-02T10:00:00</TimeModified>'
+         '<Name>Labor</Name></ItemServiceRet></ItemQueryRs></QBXMLMsgsRs></QBXML>')
+NOTHING = ('<?xml version="1.0" ?><QBXML><QBXMLMsgsRs>'
+           '<ItemQueryRs statusCode="1" statusSeverity="Info" statusMessage="no match" />'
+           '<ListDeletedQueryRs statusCode="1" statusSeverity="Info" statusMessage="no match" />'
+           '</QBXMLMsgsRs></QBXML>')
+DELETED = ('<?xml version="1.0" ?><QBXML><QBXMLMsgsRs>'
+           '<ItemQueryRs statusCode="1" statusSeverity="Info" statusMessage="no match" />'
+           '<ListDeletedQueryRs statusCode="0" statusSeverity="Info" statusMessage="Status OK">'
+           '<ListDeletedRet><ListDelType>ItemService</ListDelType><ListID>80000001-1</ListID>'
+           '<TimeDeleted>2024-01-03T10:00:00</TimeDeleted></ListDeletedRet></ListDeletedQueryRs>'
+           '</QBXMLMsgsRs></QBXML>')
+
+
+def _query(name: str, **filters) -> str:
+    return QBXMLDocument([MessageAggregate(name, build_nodes(filters))]).read()
+
+
+class ItemServer:
+    """answers ItemQueryRq with one service item and revalidation requests
+    with DELETED once the item was deleted, NOTHING before."""
+
+    def __init__(self) -> None:
+        self.deleted = False
+        self.requests = []
+
+    def process_request(self, request: str) -> str:
+        self.requests.append(request)
+        if "ListDeletedQueryRq" not in request:
+            return ITEMS
+        return DELETED if self.deleted and "<ListDelType>ItemService</ListDelType>" in request else NOTHING
+
+
+def test_error_responses_are_not_cached():
+    backend = FakeQuickBooks().generate(customers=3).inject_faults(rate=1.0)
+    request = _query("CustomerQueryRq")
+    with RequestProcessor("test", transport=backend) as qb:
+        cache = CachingProcessor(qb)
+        busy = ResponseStream(cache.process_request(request))
+        assert not list(busy) and busy.statuses[0].code == 3175
+        backend.inject_faults()
+        fine = ResponseStream(cache.process_request(request))
+        assert len(list(fine)) == 3 and fine.statuses[0].ok
+        assert len(list(ResponseStream(cache.process_request(request)))) == 3
+    assert cache.stats["misses"] == 2 and cache.stats["hits"] == 1
+
+
+def test_revalidation_notices_deleted_items():
+    server = ItemServer()
+    cache = CachingProcessor(server, ttl={"Item": 0}, revalidate=True)
+    request = _query("ItemQueryRq")
+    assert cache.process_request(request) == ITEMS
+    assert cache.process_request(request) == ITEMS
+    assert cache.revalidations == 1
+    server.deleted = True
+    assert cache.process_request(request) == ITEMS
+    assert cache.revalidations == 1 and cache.misses == 2
+    assert "<ListDelType>ItemInventory</ListDelType>" in server.requests[-2]
@@ -0,0 +1,34 @@
+import csv
+import json
+
+from qbexport import CSVSink, export
+from qbparser import QBRecord
+
+
+def _read(path) -> list:
+    with open(path, newline="", encoding="utf-8") as handle:
+        return list(csv.DictReader(handle))
+
+
+def test_fields_after_the_first_batch_go_to_extra(tmp_path):
+    records = [QBRecord("EmployeeRet", {"ListID": "1", "Name": "Acme"}),
+               QBRecord("EmployeeRet", {"ListID": "2", "Name": "Bolt"}),
+               QBRecord("EmployeeRet", {"ListID": "3", "Name": "Cask", "EmployeeAddress": {"City": "Oslo"}})]
+    path = tmp_path / "employees.csv"
+    result = export(records, [CSVSink(str(path))], batch_size=2)
+    rows = _read(path)
+    assert result.records == 3
+    assert list(rows[0]) == ["ListID", "Name", "extra"]
+    assert [row["extra"] for row in rows[:2]] == ["", ""]
+    assert json.loads(rows[2]["extra"]) == {"EmployeeAddress.City": "Oslo"}
+
+
+def test_report_rows_keep_late_columns_in_extra(tmp_path):
+    records = [QBRecord("TextRow", {"value": "Checking"}),
+               QBRecord("DataRow", {"value": "Checking", "Amount": "10.00"})]
+    path = tmp_path / "report.csv"
+    export(records, [CSVSink(str(path))], batch_size=1)
+    rows = _read(path)
+    assert list(rows[0]) == ["RowType", "value", "extra"]
+    assert [row["RowType"] for row in rows] == ["TextRow", "DataRow"]
+    assert json.loads(rows[1]["extra"]) == {"Amount": "10.00"}
@@ -0,0 +1,34 @@
+import json
+import os
+
+import pytest
+
+from qbextract import ExtractionPlan, FakeBackend, Orchestrator
+
+
+def test_empty_plan_returns_an_empty_summary(tmp_path):
+    orchestrator = Orchestrator(str(tmp_path), ExtractionPlan(entities=()), backend=FakeBackend())
+    summary = orchestrator.run(["a.qbw", "b.qbw"])
+    assert summary.companies == [] and summary.failed == []
+    assert json.loads((tmp_path / "summary.json").read_text())["companies"] == []
+
+
+def test_no_company_files_returns_an_empty_summary(tmp_path):
+    orchestrator = Orchestrator(str(tmp_path / "out"), root=str(tmp_path), backend=FakeBackend())
+    assert orchestrator.run().companies == []
+
+
+def test_sessions_per_file_must_be_positive():
+    with pytest.raises(ValueError):
+        ExtractionPlan(sessions_per_file=0)
+
+
+def test_run_extracts_every_company(tmp_path):
+    plan = ExtractionPlan(entities=("Customer",), reports=(("GeneralDetail", "TxnListByDate"),))
+    orchestrator = Orchestrator(str(tmp_path), plan, backend=FakeBackend(customers=20, items=5, invoices=30),
+                                workers=2, root="")
+    summary = orchestrator.run(["a.qbw", "b.qbw"])
+    assert not summary.failed
+    assert sorted(task.task for company in summary.companies for task in company.tasks) == \
+        ["GeneralDetail-TxnListByDate"] * 2 + ["entities"] * 2
+    assert all(os.path.exists(os.path.join(company.output, "sync.sqlite")) for company in summary.companies)
@@ -0,0 +1,256 @@
+import time
+
+import pytest
+
+from qbdesktop import Aggregate, Element, MessageAggregate, RequestProcessor
+from qbresilience import (CIRCUIT_CLOSED, CIRCUIT_HALF_OPEN, CIRCUIT_OPEN, DISP_E_EXCEPTION, FATAL,
+                          QB_E_SHARED_ACCESS, RETRYABLE, RPC_E_CALL_REJECTED, UNAVAILABLE, AdaptiveLimit,
+                          CircuitBreaker, CircuitOpen, QuickBooksError, Resilience, classify_code,
+                          classify_exception, classify_hresult, hresult_of, retryable_failure)
+from qbtransport import FakeComError, FakeQuickBooks
+
+BUSY = '<CustomerAddRs requestID="{}" statusCode="3175" statusSeverity="Error" statusMessage="in use" />'
+SKIPPED = '<CustomerAddRs requestID="{}" statusCode="3231" statusSeverity="Error" statusMessage="not processed" />'
+ADDED = '<CustomerAddRs requestID="{}" statusCode="0" statusSeverity="Info" statusMessage="Status OK" />'
+PAGE = ('<CustomerQueryRs requestID="{}" statusCode="0" statusSeverity="Info" statusMessage="Status OK" '
+        'iteratorRemainingCount="5" iteratorID="abc" />')
+QUERY = '<CustomerQueryRs requestID="{}" statusCode="0" statusSeverity="Info" statusMessage="Status OK" />'
+
+
+def _response(*messages: str) -> str:
+    body = "".join(message.format(number) for number, message in enumerate(messages, 1))
+    return f'<?xml version="1.0" ?><QBXML><QBXMLMsgsRs>{body}</QBXMLMsgsRs></QBXML>'
+
+
+def _customer_add(i: int) -> MessageAggregate:
+    return MessageAggregate("CustomerAddRq", [Aggregate("CustomerAdd", [Element("Name", f"Bulk {i}")])])
+
+
+class Script:
+    """a send() answering with the given responses or raising the given
+    exceptions, one per call."""
+
+    def __init__(self, *answers) -> None:
+        self.answers = list(answers)
+        self.calls = 0
+
+    def __call__(self, request: str) -> str:
+        self.calls += 1
+        answer = self.answers.pop(0) if len(self.answers) > 1 else self.answers[0]
+        if isinstance(answer, BaseException):
+            raise answer
+        return answer
+
+
+def _policy(**options) -> Resilience:
+    options.setdefault("backoff", 0.0001)
+    options.setdefault("limit", AdaptiveLimit())
+    return Resilience(seed=0, **options)
+
+
+#----------------------------------------------------------------
+# classification
+#----------------------------------------------------------------
+
+def test_classification():
+    assert classify_code(3175) == RETRYABLE
+    assert classify_code(3100) == FATAL
+    assert classify_hresult(RPC_E_CALL_REJECTED) == RETRYABLE
+    assert classify_hresult(QB_E_SHARED_ACCESS) == UNAVAILABLE
+    assert classify_hresult(-1) == FATAL
+    assert classify_exception(FakeComError(RPC_E_CALL_REJECTED, "busy")) == RETRYABLE
+    assert classify_exception(ConnectionResetError()) == UNAVAILABLE
+    assert classify_exception(ValueError()) == FATAL
+    assert classify_exception(QuickBooksError("in use", code=3176)) == RETRYABLE
+
+
+def test_hresult_of_unwraps_dispatch_exceptions():
+    class com_error(Exception):
+        pass
+
+    wrapped = com_error(DISP_E_EXCEPTION & 0xFFFFFFFF, "Exception occurred.",
+                        (0, "QBXMLRP2", "in use", None, 0, QB_E_SHARED_ACCESS & 0xFFFFFFFF), None)
+    assert hresult_of(wrapped) == QB_E_SHARED_ACCESS
+    assert hresult_of(com_error("not a COM call")) is None
+    assert hresult_of(ValueError(1)) is None
+
+
+def test_retryable_failure_only_for_envelopes_that_changed_nothing():
+    busy = _response(BUSY, SKIPPED)
+    error = retryable_failure(busy)
+    assert error.code == 3175 and error.kind == RETRYABLE and error.response == busy
+    assert retryable_failure(_response(QUERY, BUSY)).code == 3175
+    assert retryable_failure(_response(ADDED)) is None
+    # resending would add the first customer twice or skip a page
+    assert retryable_failure(_response(ADDED, BUSY)) is None
+    assert retryable_failure(_response(PAGE, BUSY)) is None
+    assert retryable_failure(_response(BUSY.replace("3175", "3100"))) is None
+
+
+#----------------------------------------------------------------
+# backoff
+#----------------------------------------------------------------
+
+def test_delay_is_full_jitter_under_the_cap():
+    policy = Resilience(backoff=0.1, max_backoff=1.0, seed=1)
+    for attempt, cap in ((1, 0.1), (2, 0.2), (3, 0.4), (4, 0.8), (5, 1.0), (10, 1.0)):
+        delays = [policy.delay(attempt) for _ in range(200)]
+        assert all(0 <= delay <= cap for delay in delays)
+        assert max(delays) > cap * 0.8 and min(delays) < cap * 0.2
+    assert [Resilience(seed=3).delay(2) for _ in range(2)] == [Resilience(seed=3).delay(2)] * 2
+
+
+#----------------------------------------------------------------
+# adaptive limit
+#----------------------------------------------------------------
+
+def test_limit_grows_only_while_saturated():
+    limit = AdaptiveLimit(initial=2, maximum=3)
+    token = limit.acquire()
+    limit.release(token, "ok")
+    assert limit.limit == 2
+    tokens = [limit.acquire(), limit.acquire()]
+    limit.release(tokens[0], "ok")
+    assert limit.limit == 2.5
+    limit.release(tokens[1], "ok")
+    assert limit.limit == 2.5
+    for _ in range(10):
+        tokens = [limit.acquire() for _ in range(int(limit.limit))]
+        for token in tokens:
+            limit.release(token, "ok")
+    assert limit.limit == 3
+    with pytest.raises(TimeoutError):
+        [limit.acquire(timeout=0.01) for _ in range(4)]
+
+
+def test_limit_decreases_once_per_round():
+    limit = AdaptiveLimit(initial=8, minimum=2, decrease=0.5)
+    tokens = [limit.acquire() for _ in range(4)]
+    for token in tokens:
+        limit.release(token, RETRYABLE)
+    # the three answers to requests sent before the first decrease are not counted again
+    assert limit.limit == 4 and limit.decreases == 1
+    limit.release(limit.acquire(), UNAVAILABLE)
+    assert limit.limit == 2
+    limit.release(limit.acquire(), UNAVAILABLE)
+    assert limit.limit == 2
+    limit.release(limit.acquire(), FATAL)
+    limit.release(limit.acquire(), None)
+    assert limit.limit == 2 and limit.decreases == 3
+
+
+def test_latency_is_ignored_by_default():
+    limit = AdaptiveLimit(initial=8, decrease=0.5)
+    limit.release(limit.acquire(), "ok")
+    for _ in range(6):
+        token = limit.acquire()
+        limit.release(token - 1.0, "ok")
+    assert limit.limit == 8 and limit.decreases == 0
+
+
+def test_slow_answers_count_as_contention_when_asked():
+    limit = AdaptiveLimit(initial=8, decrease=0.5, latency_tolerance=2.0)
+    limit.release(limit.acquire(), "ok")
+    baseline = limit.baseline
+    token = limit.acquire()
+    limit.release(token - max(baseline, 0.001) * 10, "ok")
+    assert limit.limit == 4
+    assert limit.baseline == pytest.approx(baseline, abs=0.01)
+
+
+#----------------------------------------------------------------
+# circuit breaker
+#----------------------------------------------------------------
+
+def test_breaker_opens_and_probes_half_open():
+    breaker = CircuitBreaker("company.qbw", threshold=2, reset_after=0.05)
+    breaker.failure()
+    breaker.allow()
+    breaker.failure()
+    assert breaker.state == CIRCUIT_OPEN and breaker.opened == 1
+    with pytest.raises(CircuitOpen) as info:
+        breaker.allow()
+    assert info.value.kind == UNAVAILABLE and 0 < info.value.retry_after <= 0.05
+    time.sleep(0.06)
+    breaker.allow()
+    assert breaker.state == CIRCUIT_HALF_OPEN
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+    breaker.failure()
+    assert breaker.state == CIRCUIT_OPEN and breaker.opened == 2
+    time.sleep(0.06)
+    breaker.allow()
+    breaker.success()
+    assert breaker.state == CIRCUIT_CLOSED and breaker.failures == 0
+    breaker.allow()
+
+
+def test_call_opens_the_circuit_after_consecutive_failures():
+    policy = _policy(threshold=2, reset_after=60)
+    send = Script(ConnectionResetError("gone"))
+    for _ in range(2):
+        with pytest.raises(QuickBooksError) as info:
+            policy.call(send, "<QBXML />", "company.qbw")
+        assert info.value.kind == UNAVAILABLE
+    with pytest.raises(CircuitOpen):
+        policy.call(send, "<QBXML />", "company.qbw")
+    assert send.calls == 2 and policy.metrics.rejected == 1
+    assert policy.call(Script("fine"), "<QBXML />", "other.qbw") == "fine"
+
+
+#----------------------------------------------------------------
+# retries
+#----------------------------------------------------------------
+
+def test_call_retries_busy_answers():
+    policy = _policy()
+    ok = _response(ADDED)
+    send = Script(_response(BUSY), FakeComError(RPC_E_CALL_REJECTED, "modal dialog"), ok)
+    assert policy.call(send, "<QBXML />") == ok
+    assert send.calls == 3 and policy.metrics.retries == 2 and policy.metrics.failures == 0
+
+
+def test_call_raises_when_still_busy_after_the_last_retry():
+    policy = _policy(retries=2)
+    busy = _response(BUSY)
+    send = Script(busy)
+    with pytest.raises(QuickBooksError) as info:
+        policy.call(send, "<QBXML />")
+    assert info.value.kind == RETRYABLE and info.value.code == 3175 and info.value.response == busy
+    assert send.calls == 3 and policy.metrics.failures == 1
+
+
+def test_call_does_not_retry_fatal_errors():
+    policy = _policy()
+    send = Script(ValueError("bad request"))
+    with pytest.raises(ValueError):
+        policy.call(send, "<QBXML />")
+    partial = _response(ADDED, BUSY)
+    assert policy.call(Script(partial), "<QBXML />") == partial
+    assert send.calls == 1 and policy.metrics.retries == 0
+
+
+#----------------------------------------------------------------
+# BulkWriter
+#----------------------------------------------------------------
+
+@pytest.mark.parametrize("on_error", ["continueOnError", "stopOnError"])
+def test_bulk_writer_never_resends_applied_writes(on_error):
+    backend = FakeQuickBooks(seed=4).inject_faults(rate=0.2)
+    policy = _policy(retries=30)
+    with RequestProcessor("test", transport=backend, resilience=policy) as qb:
+        results = list(qb.bulk_write((_customer_add(i) for i in range(60)), batch_size=10, on_error=on_error))
+    names = sorted(customer["Name"] for customer in backend.entities["Customer"].values())
+    assert backend.faults > 0
+    assert [result.index for result in results] == list(range(60))
+    assert all(result.ok for result in results)
+    assert names == sorted(f"Bulk {i}" for i in range(60))
+
+
+def test_bulk_writer_reports_envelopes_the_policy_gave_up_on():
+    backend = FakeQuickBooks().inject_faults(rate=1.0)
+    with RequestProcessor("test", transport=backend, resilience=_policy(retries=1)) as qb:
+        results = list(qb.bulk_write((_customer_add(i) for i in range(5)), batch_size=5))
+    assert len(results) == 5 and not any(result.ok for result in results)
+    assert {result.status.code for result in results} == {3175}
+    assert not backend.entities.get("Customer")
@@ -0,0 +1,109 @@
+import contextlib
+import datetime
+import re
+import threading
+
+from qbpool import SessionPool
+from qbreports import DATA_ROW, TEXT_ROW
+from qbshard import ShardedQuery
+from qbtransport import FakeQuickBooks
+
+HEAD = '<?xml version="1.0" ?><QBXML><QBXMLMsgsRs>'
+TAIL = '</QBXMLMsgsRs></QBXML>'
+OK = 'statusCode="0" statusSeverity="Info" statusMessage="Status OK"'
+# two probe windows of 31 days each: January and February 2024
+TRANSACTIONS = {
+    "2024-01-01": [("T1", "1"), (None, "2")],
+    "2024-02-01": [("T1", "3"), (None, "4"), ("T2", "5")],
+}
+SECTIONS = {
+    "2024-01-01": [("Checking", [("T1", "10.00"), ("T2", "20.00")]), ("Savings", [("T3", "30.00")])],
+    "2024-02-01": [("Checking", [("T3", "30.00"), ("T4", "40.00")])],
+}
+
+
+def _transactions(rows: list) -> str:
+    records = "".join(f"<TransactionRet>{f'<TxnID>{txn}</TxnID>' if txn else ''}<Amount>{amount}</Amount>"
+                      "</TransactionRet>" for txn, amount in rows)
+    return f"{HEAD}<TransactionQueryRs {OK}>{records}</TransactionQueryRs>{TAIL}"
+
+
+def _report(sections: list) -> str:
+    columns = ('<ColDesc colID="1"><ColTitle titleRow="1" value="TxnID" /><ColType>TxnID</ColType></ColDesc>'
+               '<ColDesc colID="2"><ColTitle titleRow="1" value="Amount" /><ColType>Amount</ColType></ColDesc>')
+    rows, number = [], 0
+    for account, lines in sections:
+        number += 1
+        rows.append(f'<TextRow rowNumber="{number}" value="{account}" />')
+        for txn, amount in lines:
+            number += 1
+            rows.append(f'<DataRow rowNumber="{number}"><ColData colID="1" value="{txn}" />'
+                        f'<ColData colID="2" value="{amount}" /></DataRow>')
+        number += 1
+        rows.append(f'<SubtotalRow rowNumber="{number}"><ColData colID="1" value="Total {account}" /></SubtotalRow>')
+    rows.append(f'<TotalRow rowNumber="{number + 1}"><ColData colID="1" value="TOTAL" /></TotalRow>')
+    return (f"{HEAD}<GeneralDetailReportQueryRs {OK}><ReportRet><ReportTitle>General Ledger</ReportTitle>"
+            f"{columns}<ReportData>{''.join(rows)}</ReportData></ReportRet></GeneralDetailReportQueryRs>{TAIL}")
+
+
+class ScriptedPool:
+    """answers probes without counts and every shard from TRANSACTIONS or
+    SECTIONS by the first day of its range."""
+    max_size = 2
+
+    @contextlib.contextmanager
+    def session(self):
+        yield self
+
+    def process_request(self, request: str) -> str:
+        if "MetaDataOnly" in request:
+            return f"{HEAD}<TransactionQueryRs {OK} />{TAIL}"
+        day = re.search(r"<From(?:Txn|Report)Date>([^<]+)<", request).group(1)
+        if "GeneralDetailReportQueryRq" in request:
+            return _report(SECTIONS[day])
+        return _transactions(TRANSACTIONS[day])
+
+
+def test_records_keep_transactions_without_txnid():
+    query = ShardedQuery(ScriptedPool(), "TransactionQueryRq", "2024-01-01", "2024-03-02", probe_days=31)
+    assert [record["Amount"] for record in query.records()] == ["1", "2", "4", "5"]
+
+
+def test_report_keeps_the_sections_of_the_rows():
+    query = ShardedQuery(ScriptedPool(), "GeneralDetailReportQueryRq", "2024-01-01", "2024-03-02", probe_days=31)
+    report = query.report()
+    rows = [(report.row_type[index], report.row_data[index]) for index in range(len(report))]
+    assert rows == [(TEXT_ROW, "Checking"), (DATA_ROW, "T1"), (DATA_ROW, "T2"), (TEXT_ROW, "Savings"),
+                    (DATA_ROW, "T3"), (TEXT_ROW, "Checking"), (DATA_ROW, "T4")]
+    assert [report.level[index] for index in range(len(report))] == [0, 1, 1, 0, 1, 0, 1]
+
+
+def _on_thread(function):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(function()))
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+def test_affine_pool_lends_sessions_only_to_their_thread():
+    backend = FakeQuickBooks()
+    with SessionPool("test", lambda: backend, max_size=2, health_check_after=None, thread_affine=True) as pool:
+        mine = pool.acquire()
+        pool.release(mine)
+        other = _on_thread(pool.acquire)
+        assert other is not mine
+        # the pool is full: the idle session of this thread makes room for a third thread
+        third = _on_thread(pool.acquire)
+        assert third is not mine and pool.metrics.closed == 1 and pool.size == 2
+
+
+def test_shard_workers_close_their_sessions():
+    backend = FakeQuickBooks().generate(customers=10, items=5, invoices=200, start=datetime.date(2024, 1, 1), days=60)
+    with SessionPool("test", lambda: backend, max_size=3, health_check_after=None, thread_affine=True) as pool:
+        query = ShardedQuery(pool, "TransactionQueryRq", "2024-01-01", "2024-02-29", target_rows=50, probe_days=10)
+        assert sum(1 for _ in query.records()) == 200
+        assert len(query.shards) > 3
+        # only sessions of this thread, opened by the probe, are left
+        assert pool.size == pool.idle <= 1
+        assert all(entry.thread == threading.get_ident() for entry in pool._idle)
@@ -0,0 +1,58 @@
+import asyncio
+
+from qbdesktop import MessageAggregate, build_nodes
+from qbtransport import FakeQuickBooks
+from qbwc import QBWCServer, SimulatedWebConnector
+
+
+def _server(closed: list) -> QBWCServer:
+    return QBWCServer(lambda user, password: "company.qbw",
+                      work=lambda user: [MessageAggregate("CustomerQueryRq", build_nodes({"MaxReturned": 5}))
+                                         for _ in range(3)],
+                      on_close=closed.append, batch_size=1)
+
+
+def test_run_collects_records():
+    closed = []
+
+    async def main():
+        async with _server(closed) as server:
+            port = await server.start(port=0)
+            backend = FakeQuickBooks().generate(customers=10)
+            return await SimulatedWebConnector("127.0.0.1", port, "user", "secret", backend).run()
+
+    assert asyncio.run(main()) == 100
+    state, = closed
+    assert state.done == 3 and state.records == 15 and state.errors == 0
+
+
+def test_quickbooks_failure_keeps_hresult_and_message():
+    closed = []
+
+    async def main():
+        async with _server(closed) as server:
+            port = await server.start(port=0)
+            backend = FakeQuickBooks().generate(customers=10).inject_faults(hresult_rate=1.0)
+            connector = SimulatedWebConnector("127.0.0.1", port, "user", "secret", backend)
+            return await connector.run(), connector
+
+    percent, connector = asyncio.run(main())
+    assert percent == -1 and connector.progress == [-1]
+    state, = closed
+    assert state.errors == 1 and state.done == 1 and state.records == 0
+    assert state.last_error == "QuickBooks is busy and rejected the call."
+
+
+
+def test_post_without_content_length_gets_411():
+    async def main():
+        async with QBWCServer(lambda user, password: None) as server:
+            port = await server.start(port=0)
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"POST / HTTP/1.1\r\nHost: localhost\r\nTransfer-Encoding: chunked\r\n\r\n")
+            await writer.drain()
+            answer = await reader.read()
+            writer.close()
+            return answer
+
+    assert asyncio.run(main()).startswith(b"HTTP/1.1 411 Length Required\r\n")